@@ -9,3 +9,4 @@ mkdir -p staticfiles
 
 python manage.py collectstatic --no-input
 python manage.py migrate
+python manage.py createcachetable
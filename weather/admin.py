@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import City, WeatherData, ForecastData, UserPreference
+from .models import (
+    City, GeocodingResult, WeatherData, ForecastData, ForecastSeries,
+    WeatherObservationChunk, WeatherRollup, UserPreference
+)
 
 @admin.register(City)
 class CityAdmin(admin.ModelAdmin):
@@ -7,6 +10,12 @@ class CityAdmin(admin.ModelAdmin):
     list_filter = ['country_code', 'created_at']
     search_fields = ['name', 'country_code']
 
+@admin.register(GeocodingResult)
+class GeocodingResultAdmin(admin.ModelAdmin):
+    list_display = ['name', 'country_code', 'latitude', 'longitude', 'created_at']
+    list_filter = ['country_code']
+    search_fields = ['name']
+
 @admin.register(WeatherData)
 class WeatherDataAdmin(admin.ModelAdmin):
     list_display = ['city', 'temperature', 'weather_main', 'cached_at']
@@ -19,6 +28,23 @@ class ForecastDataAdmin(admin.ModelAdmin):
     list_filter = ['weather_main', 'forecast_date']
     search_fields = ['city__name']
 
+@admin.register(ForecastSeries)
+class ForecastSeriesAdmin(admin.ModelAdmin):
+    list_display = ['city', 'timezone_offset', 'cached_at']
+    search_fields = ['city__name']
+
+@admin.register(WeatherObservationChunk)
+class WeatherObservationChunkAdmin(admin.ModelAdmin):
+    list_display = ['city', 'day', 'updated_at']
+    list_filter = ['day']
+    search_fields = ['city__name']
+
+@admin.register(WeatherRollup)
+class WeatherRollupAdmin(admin.ModelAdmin):
+    list_display = ['city', 'resolution', 'bucket_start', 'samples', 'temperature_avg']
+    list_filter = ['resolution', 'bucket_start']
+    search_fields = ['city__name']
+
 @admin.register(UserPreference)
 class UserPreferenceAdmin(admin.ModelAdmin):
     list_display = ['session_key', 'temperature_unit', 'created_at']
@@ -0,0 +1,247 @@
+import asyncio
+import logging
+import weakref
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from .models import WeatherData, ForecastData
+from .coalescing import async_single_flight
+from .ratelimit import rate_limiter, backoff_delay, parse_retry_after, BACKGROUND
+from .circuitbreaker import circuit_breaker, CLOSED
+from .reads import read_counter
+from .providers import get_async_provider
+from .services import OpenWeatherMapService, WeatherCacheService, WeatherAPIException, CircuitOpenError
+
+logger = logging.getLogger('weather_api')
+
+class AsyncHTTPClient:
+    """Keep-alive httpx client shared by all coroutines on an event loop.
+
+    Under daphne there is one loop per process. Short-lived loops, such as the
+    one async_to_sync starts for an async view under WSGI, get their own client,
+    which is closed when asyncio.run() cancels the loop's remaining tasks.
+    """
+    _clients = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def get(cls):
+        """Return the client for the running event loop, creating it on first use"""
+        loop = asyncio.get_running_loop()
+        entry = cls._clients.get(loop)
+        if entry is None:
+            client = httpx.AsyncClient(
+                headers={'Accept': 'application/json'},
+                limits=httpx.Limits(
+                    max_connections=settings.OPENWEATHER_ASYNC_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.OPENWEATHER_POOL_MAXSIZE,
+                ),
+            )
+            entry = cls._clients[loop] = (client, loop.create_task(cls._close_at_shutdown(client)))
+        return entry[0]
+
+    @staticmethod
+    async def _close_at_shutdown(client):
+        """Wait until the loop shuts down and cancels this task, then close client"""
+        try:
+            await asyncio.Future()
+        finally:
+            await client.aclose()
+
+class AsyncOpenWeatherMapService(OpenWeatherMapService):
+    """OpenWeatherMap client for ASGI views.
+
+    Only the transport differs from OpenWeatherMapService: _make_request is a
+    coroutine, so get_current_weather, get_forecast, get_current_weather_group
+    and geocode return awaitables built from the same URLs and parameters.
+    """
+
+    async def _make_request(self, url, params):
+        """Make HTTP request with retry logic and error handling (see OpenWeatherMapService)"""
+        allowed = await circuit_breaker.aallow_request()
+        if not allowed:
+            raise CircuitOpenError("Weather service unavailable (circuit open)")
+        if not await rate_limiter.aacquire():
+            # Let another worker send the half-open probe
+            await circuit_breaker.arelease_probe(allowed)
+            raise WeatherAPIException("API rate limit exceeded (local quota)")
+        
+        client = AsyncHTTPClient.get()
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await client.get(url, params=params, timeout=self.timeout)
+                if response.status_code < 500:
+                    await circuit_breaker.arecord_success()
+                backoff_requested = response.status_code == 429 or (
+                    response.status_code == 503 and 'Retry-After' in response.headers
+                )
+                if backoff_requested:
+                    await sync_to_async(rate_limiter.pause, thread_sensitive=False)(
+                        parse_retry_after(response.headers.get('Retry-After'))
+                    )
+                response.raise_for_status()
+                return response.json()
+            except httpx.TimeoutException:
+                logger.error(f"Timeout error for URL: {url}")
+                await circuit_breaker.arecord_failure()
+                error = WeatherAPIException("Request timeout after multiple retries")
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code == 404:
+                    raise WeatherAPIException("City not found")
+                elif e.response.status_code == 401:
+                    raise WeatherAPIException("Invalid API key")
+                elif e.response.status_code == 429:
+                    raise WeatherAPIException("API rate limit exceeded")
+                logger.error(f"HTTP error {e.response.status_code}: {e}")
+                error = WeatherAPIException(f"API error: {e.response.status_code}")
+                if e.response.status_code < 500:
+                    raise error
+                await circuit_breaker.arecord_failure()
+                if backoff_requested:
+                    raise error
+            except httpx.TransportError:
+                logger.error(f"Connection error for URL: {url}")
+                await circuit_breaker.arecord_failure()
+                error = WeatherAPIException("Unable to connect to weather service")
+            except httpx.HTTPError as e:
+                logger.error(f"Request error: {e}")
+                raise WeatherAPIException("Weather service request failed")
+            
+            if attempt == self.max_retries:
+                break
+            if await sync_to_async(circuit_breaker.get_current_state, thread_sensitive=False)() != CLOSED:
+                logger.warning(f"Not retrying {url}: weather service circuit is open")
+                break
+            if not await rate_limiter.atry_acquire(BACKGROUND):
+                logger.warning(f"Not retrying {url}: upstream quota is low")
+                break
+            delay = backoff_delay(attempt)
+            logger.info(f"Retrying request in {delay:.2f}s (attempt {attempt + 1}/{self.max_retries})")
+            await asyncio.sleep(delay)
+        raise error
+
+class AsyncWeatherCacheService(WeatherCacheService):
+    """Non-blocking counterpart of WeatherCacheService for async views.
+
+    Use the a-prefixed methods; reads go through the async cache and ORM APIs
+    and upstream calls through an async provider, while writes reuse
+    the synchronous store methods in a worker thread.
+    """
+    def __init__(self, provider=None):
+        # A provider with coroutine methods; WEATHER_ASYNC_PROVIDER by default
+        super().__init__(provider or get_async_provider())
+
+    async def _arecord_read(self, city_id):
+        """Count a read so the refresh scheduler can prioritise popular cities"""
+        await read_counter.arecord(city_id)
+
+    async def aget_or_fetch_current_weather(self, city):
+        """Get current weather from cache or fetch from API if stale"""
+        cache_key = self._get_weather_cache_key(city.id)
+        await self._arecord_read(city.id)
+
+        cached_data = await cache.aget(cache_key)
+        if cached_data:
+            logger.info(f"Returning cached weather data for {city.name}")
+            return cached_data
+
+        # Check database cache
+        cached_weather = await WeatherData.objects.filter(city=city).select_related('city').afirst()
+
+        if cached_weather and cached_weather.is_cache_valid():
+            await cache.aset(cache_key, cached_weather, settings.WEATHER_CACHE_DURATION)
+            logger.info(f"Returning database cached weather data for {city.name}")
+            return cached_weather
+
+        # Serve expired data within the grace window and revalidate in the background
+        if cached_weather and cached_weather.is_within_grace_period():
+            async_single_flight.do_in_background(cache_key, lambda: self._afetch_current_weather(city))
+            logger.info(f"Returning stale weather data for {city.name} while revalidating")
+            return cached_weather
+
+        # Fetch fresh data from API, coalescing concurrent misses for this city
+        try:
+            return await async_single_flight.do(
+                cache_key,
+                lambda: self._afetch_current_weather(city),
+                lambda: cache.aget(cache_key)
+            )
+        except WeatherAPIException as e:
+            logger.error(f"Weather API error for {city.name}: {e}")
+            if cached_weather:
+                logger.info(f"Returning stale cached data for {city.name} due to API error")
+                return cached_weather
+            raise e
+        except Exception as e:
+            logger.error(f"Unexpected error fetching weather for {city.name}: {e}")
+            if cached_weather:
+                return cached_weather
+            raise WeatherAPIException("Failed to fetch weather data")
+
+    async def _afetch_current_weather(self, city):
+        """Fetch current weather from the API and store it in the DB and cache"""
+        cached_data = await cache.aget(self._get_weather_cache_key(city.id))
+        if cached_data:
+            return cached_data
+
+        weather_data = await self.openweather_service.get_current_weather(
+            city.name, city.country_code, city.latitude, city.longitude
+        )
+        return await sync_to_async(self._store_current_weather)(city, weather_data)
+
+    async def aget_or_fetch_forecast(self, city):
+        """Get forecast from cache or fetch from API if stale"""
+        cache_key = self._get_forecast_cache_key(city.id)
+        await self._arecord_read(city.id)
+
+        cached_data = await cache.aget(cache_key)
+        if cached_data:
+            logger.info(f"Returning cached forecast data for {city.name}")
+            return cached_data
+
+        # Check database cache
+        cached_forecasts = [
+            forecast async for forecast in ForecastData.objects.filter(city=city).select_related('city')
+        ]
+        latest_forecast = cached_forecasts[0] if cached_forecasts else None
+
+        if latest_forecast and latest_forecast.is_cache_valid():
+            await cache.aset(cache_key, cached_forecasts, settings.WEATHER_CACHE_DURATION)
+            logger.info(f"Returning database cached forecast data for {city.name}")
+            return cached_forecasts
+
+        # Serve expired data within the grace window and revalidate in the background
+        if latest_forecast and latest_forecast.is_within_grace_period():
+            async_single_flight.do_in_background(cache_key, lambda: self._afetch_forecast(city))
+            logger.info(f"Returning stale forecast data for {city.name} while revalidating")
+            return cached_forecasts
+
+        # Fetch fresh forecast data from API, coalescing concurrent misses for this city
+        try:
+            return await async_single_flight.do(
+                cache_key,
+                lambda: self._afetch_forecast(city),
+                lambda: cache.aget(cache_key)
+            )
+        except WeatherAPIException as e:
+            logger.error(f"Forecast API error for {city.name}: {e}")
+            if cached_forecasts:
+                logger.info(f"Returning stale cached forecast for {city.name} due to API error")
+                return cached_forecasts
+            raise e
+        except Exception as e:
+            logger.error(f"Unexpected error fetching forecast for {city.name}: {e}")
+            if cached_forecasts:
+                return cached_forecasts
+            raise WeatherAPIException("Failed to fetch forecast data")
+
+    async def _afetch_forecast(self, city):
+        """Fetch the forecast from the API and store it in the DB and cache"""
+        cached_data = await cache.aget(self._get_forecast_cache_key(city.id))
+        if cached_data:
+            return cached_data
+
+        forecast_data = await self.openweather_service.get_forecast(
+            city.name, city.country_code, city.latitude, city.longitude
+        )
+        return await sync_to_async(self._store_forecast)(city, forecast_data)
@@ -0,0 +1,111 @@
+import logging
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from .models import City
+from .serializers import WeatherDataSerializer, ForecastDataSerializer
+from .async_services import AsyncWeatherCacheService
+from .services import WeatherAPIException, CircuitOpenError
+from .units import convert_rows
+from .views import _get_temperature_unit, _not_modified, _set_unit_header, _set_validators
+
+logger = logging.getLogger('weather_api')
+
+# Async counterparts of CityViewSet.weather and CityViewSet.forecast. They run
+# natively under ASGI (daphne), so a worker keeps serving other requests while
+# an upstream fetch is in flight instead of blocking for the round trip.
+
+def _not_found_response():
+    """Same 404 body DRF returns for an unknown city"""
+    return JsonResponse({'detail': 'No City matches the given query.'}, status=404)
+
+def _api_error_response(e, city, kind):
+    """Map a WeatherAPIException to the same error payloads as CityViewSet"""
+    if "not found" in str(e).lower():
+        return JsonResponse(
+            {'error': f'{kind} data not available for {city.name}', 'code': 'CITY_NOT_FOUND'},
+            status=404
+        )
+    elif isinstance(e, CircuitOpenError):
+        return JsonResponse(
+            {'error': 'Weather service is temporarily unavailable. Please try again.', 'code': 'SERVICE_UNAVAILABLE'},
+            status=503,
+            headers={'Retry-After': str(settings.WEATHER_CIRCUIT_OPEN_DURATION)}
+        )
+    elif "timeout" in str(e).lower() or "connection" in str(e).lower():
+        return JsonResponse(
+            {'error': 'Weather service is temporarily unavailable. Please try again.', 'code': 'SERVICE_UNAVAILABLE'},
+            status=503
+        )
+    return JsonResponse(
+        {'error': f'Failed to get {kind.lower()} data: {str(e)}', 'code': 'API_ERROR'},
+        status=503
+    )
+
+async def city_weather(request, pk):
+    """Get current weather for a city without blocking the worker"""
+    if request.method != 'GET':
+        return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+    try:
+        # The session, if any, is read through the sync session store
+        unit = await sync_to_async(_get_temperature_unit)(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    city = await City.objects.filter(pk=pk).afirst()
+    if city is None:
+        return _not_found_response()
+
+    try:
+        weather_service = AsyncWeatherCacheService()
+        weather_data = await weather_service.aget_or_fetch_current_weather(city)
+        etag = weather_service.get_payload_etag('weather', city.id, weather_data.cached_at, unit)
+        not_modified = _not_modified(request, weather_service, etag, weather_data.cached_at)
+        if not_modified is not None:
+            return not_modified
+        # Entries cached by the sync views may need a query to load the nested city
+        data = await sync_to_async(lambda: WeatherDataSerializer(weather_data).data)()
+        response = JsonResponse(convert_rows(data, unit))
+        _set_unit_header(request, response, unit)
+        _set_validators(response, weather_service, etag, weather_data.cached_at)
+        return response
+    except WeatherAPIException as e:
+        logger.error(f"Weather API error for city {city.name}: {e}")
+        return _api_error_response(e, city, 'Weather')
+    except Exception as e:
+        logger.error(f"Unexpected error getting weather for city {city.name}: {e}")
+        return JsonResponse({'error': 'An unexpected error occurred', 'code': 'INTERNAL_ERROR'}, status=500)
+
+async def city_forecast(request, pk):
+    """Get 5-day forecast for a city without blocking the worker"""
+    if request.method != 'GET':
+        return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+    try:
+        # The session, if any, is read through the sync session store
+        unit = await sync_to_async(_get_temperature_unit)(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    city = await City.objects.filter(pk=pk).afirst()
+    if city is None:
+        return _not_found_response()
+
+    try:
+        weather_service = AsyncWeatherCacheService()
+        forecast_data = await weather_service.aget_or_fetch_forecast(city)
+        if not forecast_data:
+            return _set_unit_header(request, JsonResponse([], safe=False), unit)
+        cached_at = min(forecast.cached_at for forecast in forecast_data)
+        etag = weather_service.get_payload_etag('forecast', city.id, cached_at, unit)
+        not_modified = _not_modified(request, weather_service, etag, cached_at)
+        if not_modified is not None:
+            return not_modified
+        data = await sync_to_async(lambda: ForecastDataSerializer(forecast_data, many=True).data)()
+        response = JsonResponse(convert_rows(data, unit), safe=False)
+        _set_unit_header(request, response, unit)
+        _set_validators(response, weather_service, etag, cached_at)
+        return response
+    except WeatherAPIException as e:
+        logger.error(f"Forecast API error for city {city.name}: {e}")
+        return _api_error_response(e, city, 'Forecast')
+    except Exception as e:
+        logger.error(f"Unexpected error getting forecast for city {city.name}: {e}")
+        return JsonResponse({'error': 'An unexpected error occurred', 'code': 'INTERNAL_ERROR'}, status=500)
@@ -0,0 +1,228 @@
+import time
+import random
+import logging
+import platform
+import subprocess
+from statistics import fmean, quantiles
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.utils import timezone
+from .forecast import pack_forecast_series, aggregate_daily
+from .models import City, WeatherData, ForecastData, ForecastSeries, UserPreference
+from .replay import ReplayWeatherProvider, get_synthetic_id
+from .services import WeatherCacheService
+
+logger = logging.getLogger('weather_api')
+
+# Tiers of the per-city endpoints, in the order they are measured: each tier
+# leaves the sampled cities in the state the next one needs
+UPSTREAM_MISS = 'upstream_miss'
+DB_HIT = 'db_hit'
+CACHE_HIT = 'cache_hit'
+
+# Per-city endpoints measured in every tier, with the models they read
+CITY_ENDPOINTS = {
+    'city_weather': ('/api/cities/{id}/weather/', [WeatherData]),
+    'city_forecast': ('/api/cities/{id}/forecast/', [ForecastData, ForecastSeries]),
+}
+
+# List endpoints, read straight from the DB
+LIST_ENDPOINTS = {
+    'weather_list': '/api/weather/?page_size=100',
+    'forecast_list': '/api/forecast/?page_size=100',
+    'city_list': '/api/cities/',
+}
+
+FAVORITES_PER_SESSION = 10
+
+def summarize(samples, elapsed, queries):
+    """Throughput and latency percentiles (milliseconds) of one scenario"""
+    latencies = sorted(sample * 1000 for sample in samples)
+    if len(latencies) > 1:
+        cuts = quantiles(latencies, n=100, method='inclusive')
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = latencies[0]
+    return {
+        'requests': len(latencies),
+        'throughput': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'mean_ms': round(fmean(latencies), 3),
+        'p50_ms': round(p50, 3),
+        'p95_ms': round(p95, 3),
+        'p99_ms': round(p99, 3),
+        'max_ms': round(latencies[-1], 3),
+        'queries_per_request': round(queries / len(latencies), 2),
+    }
+
+def get_git_commit():
+    """Current commit of the working tree, if it is a git checkout"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=settings.BASE_DIR
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline, threshold):
+    """Compare two benchmark runs; return rows of (scenario, metric, old, new, change, regressed)"""
+    previous = {
+        (row['endpoint'], row['tier'], row['cities']): row for row in baseline['scenarios']
+    }
+    rows = []
+    for row in results['scenarios']:
+        old = previous.get((row['endpoint'], row['tier'], row['cities']))
+        if old is None:
+            continue
+        name = f"{row['endpoint']}/{row['tier']}/{row['cities']}"
+        for metric, higher_is_better in (('throughput', True), ('p50_ms', False), ('p95_ms', False), ('p99_ms', False)):
+            if not old.get(metric) or row.get(metric) is None:
+                continue
+            change = (row[metric] - old[metric]) / old[metric]
+            regressed = (-change if higher_is_better else change) > threshold
+            rows.append((name, metric, old[metric], row[metric], change, regressed))
+    return rows
+
+class WeatherBenchmark:
+    """Drive the weather endpoints through the Django test client against a replay upstream.
+
+    For each city count the DB is filled with that many cities, all with fresh
+    current weather and forecasts. The per-city endpoints are then measured on
+    a seeded sample of cities in three tiers: upstream miss (no row, empty
+    cache), DB hit (fresh row, empty cache) and cache hit. List endpoints and
+    the preference endpoints are measured warm. Expects to run against a
+    throwaway database and cache, see the benchmark_weather command.
+    """
+    def __init__(self, city_counts, requests=200, seed=0, progress=None):
+        self.city_counts = city_counts
+        self.requests = requests
+        self.seed = seed
+        self.progress = progress or (lambda message: None)
+        self.provider = ReplayWeatherProvider(latency=0, error_rate=0, seed=seed)
+        self.weather_service = WeatherCacheService(provider=self.provider)
+
+    def _create_cities(self, count):
+        """Replace all cities with count synthetic ones, with their upstream IDs and coordinates"""
+        City.objects.all().delete()
+        UserPreference.objects.all().delete()
+        cities = []
+        for index in range(count):
+            name = f"Bench City {index}"
+            weather = self.provider.synthesize_current(get_synthetic_id(name, 'ZZ'))
+            cities.append(City(
+                name=name, country_code='ZZ', openweather_id=weather['id'],
+                latitude=weather['coord']['lat'], longitude=weather['coord']['lon']
+            ))
+        return City.objects.bulk_create(cities, batch_size=1000)
+
+    def _prefill(self, cities):
+        """Store fresh current weather and forecasts for cities without calling upstream"""
+        now = timezone.now()
+        weather_rows = []
+        forecast_rows = []
+        series_rows = []
+        for city in cities:
+            weather = self.provider.synthesize_current(city.openweather_id, city.name, city.country_code)
+            weather_rows.append(WeatherData(city=city, **self.weather_service._get_weather_defaults(weather)))
+            forecast = self.provider.synthesize_forecast(city.openweather_id, city.name, city.country_code)
+            points = pack_forecast_series(forecast)
+            forecast_rows.extend(
+                ForecastData(city=city, cached_at=now, **day) for day in aggregate_daily(points, 0)
+            )
+            series_rows.append(ForecastSeries(city=city, points=points, timezone_offset=0, cached_at=now))
+        WeatherData.objects.bulk_create(weather_rows, batch_size=1000)
+        ForecastData.objects.bulk_create(forecast_rows, batch_size=1000)
+        ForecastSeries.objects.bulk_create(series_rows, batch_size=1000)
+
+    def _measure(self, client, urls, **extra):
+        """Request each URL in turn and return the summary of the run"""
+        samples = []
+        queries = []
+
+        def count_query(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_query):
+            started = time.perf_counter()
+            for url in urls:
+                request_started = time.perf_counter()
+                response = client.get(url, **extra)
+                samples.append(time.perf_counter() - request_started)
+                if response.status_code >= 400:
+                    raise RuntimeError(f"GET {url} returned {response.status_code}: {response.content[:200]}")
+            elapsed = time.perf_counter() - started
+        return summarize(samples, elapsed, len(queries))
+
+    def _run_city_tiers(self, client, sample, count):
+        scenarios = []
+        sample_ids = [city.id for city in sample]
+        for endpoint, (pattern, models) in CITY_ENDPOINTS.items():
+            urls = [pattern.format(id=city_id) for city_id in sample_ids]
+
+            # Drop the sampled cities' rows so every request goes upstream once
+            for model in models:
+                model.objects.filter(city_id__in=sample_ids).delete()
+            cache.clear()
+            scenarios.append({'endpoint': endpoint, 'tier': UPSTREAM_MISS, **self._measure(client, urls)})
+
+            # Rows are fresh now; an empty cache makes every request read the DB
+            cache.clear()
+            scenarios.append({'endpoint': endpoint, 'tier': DB_HIT, **self._measure(client, urls)})
+
+            # Every sampled city is cached now
+            cache_urls = [urls[index % len(urls)] for index in range(self.requests)]
+            scenarios.append({'endpoint': endpoint, 'tier': CACHE_HIT, **self._measure(client, cache_urls)})
+
+            for scenario in scenarios[-3:]:
+                scenario['cities'] = count
+        return scenarios
+
+    def _run_lists(self, client, count):
+        scenarios = []
+        for endpoint, url in LIST_ENDPOINTS.items():
+            summary = self._measure(client, [url] * self.requests)
+            scenarios.append({'endpoint': endpoint, 'tier': DB_HIT, 'cities': count, **summary})
+        return scenarios
+
+    def _run_preferences(self, cities, count):
+        """Favourites of one session: preferences list and favourites weather"""
+        client = Client()
+        client.post('/api/preferences/', {'temperature_unit': 'C'}, content_type='application/json')
+        favorite_ids = [city.id for city in cities[:FAVORITES_PER_SESSION]]
+        client.post('/api/preferences/add_favorite_city/', {'city_ids': favorite_ids}, content_type='application/json')
+        scenarios = []
+        for endpoint, url in (('preferences', '/api/preferences/'), ('favorites_weather', '/api/preferences/favorites_weather/')):
+            client.get(url)
+            summary = self._measure(client, [url] * self.requests)
+            scenarios.append({'endpoint': endpoint, 'tier': CACHE_HIT, 'cities': count, **summary})
+        return scenarios
+
+    def run(self):
+        """Run every scenario for every city count and return the results"""
+        scenarios = []
+        for count in self.city_counts:
+            self.progress(f"Preparing {count} cities")
+            cities = self._create_cities(count)
+            self._prefill(cities)
+            cache.clear()
+            sample = random.Random(self.seed).sample(cities, min(self.requests, count))
+
+            client = Client()
+            self.progress(f"Measuring {len(sample)} sampled cities of {count}")
+            scenarios.extend(self._run_city_tiers(client, sample, count))
+            scenarios.extend(self._run_lists(client, count))
+            scenarios.extend(self._run_preferences(cities, count))
+
+        return {
+            'commit': get_git_commit(),
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'provider_latency': settings.WEATHER_REPLAY['LATENCY'],
+            'requests': self.requests,
+            'seed': self.seed,
+            'scenarios': scenarios,
+        }
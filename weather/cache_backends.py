@@ -0,0 +1,448 @@
+import time
+import base64
+import pickle
+import logging
+import threading
+from collections import Counter, OrderedDict
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+from django.core.cache.backends.db import DatabaseCache
+from django.db import connections, router, transaction
+from django.utils.timezone import now as tz_now
+
+logger = logging.getLogger('weather_api')
+
+# Django creates one backend instance per thread, so the L1 tier and its
+# statistics live at module level, shared by every thread of the process.
+_l1_stores = {}
+_l1_locks = {}
+_l1_stats = {}
+_l1_sync_state = {}
+
+_MISSING = object()
+
+class TieredCache(BaseCache):
+    """Two-tier cache: a small per-process LRU (L1) in front of a shared cache (L2).
+
+    Every write goes to L2 and is published on an invalidation log kept in L2:
+    a sequence counter plus one message per write listing the changed keys.
+    Each process replays new messages at most every INVALIDATION_CHECK_INTERVAL
+    seconds and evicts those keys from its L1, so a set or delete in one worker
+    reaches the others within that interval. L1 entries also expire after
+    L1_TIMEOUT seconds as an upper bound on staleness. Unlike LocMemCache, L1
+    hands the same object to every caller, so cached values must not be mutated.
+
+    The async methods answer L1 hits on the event loop. Everything that needs
+    L2 runs in a worker thread (neither the database cache nor Django's Redis
+    cache has async I/O), off the single thread that sync_to_async uses by
+    default, so concurrent async requests do not queue behind each other.
+
+    OPTIONS:
+        L2_ALIAS: name of the shared cache in CACHES (default 'shared')
+        L1_MAX_ENTRIES: LRU size of the in-process tier (default 500)
+        L1_TIMEOUT: seconds an entry may live in L1 (default 30)
+        INVALIDATION_CHECK_INTERVAL: seconds between invalidation log checks (default 1)
+        L1_EXCLUDE_PREFIXES: keys that always go to L2, e.g. locks and counters
+    """
+    seq_key = "tiered_invalidation_seq"
+    message_prefix = "tiered_invalidation"
+    # Messages older than this are gone; a process that falls further behind clears its L1
+    message_timeout = 5 * 60
+    max_replay = 500
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._name = location or 'default'
+        self._l2_alias = options.get('L2_ALIAS', 'shared')
+        self._l1_max_entries = options.get('L1_MAX_ENTRIES', 500)
+        self._l1_timeout = options.get('L1_TIMEOUT', 30)
+        self._check_interval = options.get('INVALIDATION_CHECK_INTERVAL', 1)
+        self._l1_exclude = tuple(options.get('L1_EXCLUDE_PREFIXES', ()))
+
+        self._l1 = _l1_stores.setdefault(self._name, OrderedDict())
+        self._lock = _l1_locks.setdefault(self._name, threading.RLock())
+        self._stats = _l1_stats.setdefault(self._name, Counter())
+        self._sync_state = _l1_sync_state.setdefault(self._name, {'seen': None, 'next_check': 0})
+
+    @property
+    def l2(self):
+        return caches[self._l2_alias]
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _uses_l1(self, key):
+        return not key.startswith(self._l1_exclude)
+
+    # L1 helpers (callers hold no lock)
+
+    def _l1_get(self, made_key):
+        with self._lock:
+            entry = self._l1.get(made_key)
+            if entry is None:
+                return _MISSING
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._l1[made_key]
+                return _MISSING
+            self._l1.move_to_end(made_key)
+            return value
+
+    def _l1_set(self, made_key, value, timeout=DEFAULT_TIMEOUT):
+        timeout = self.get_backend_timeout(timeout)
+        if timeout is not None and timeout <= 0:
+            self._l1_delete([made_key])
+            return
+        ttl = self._l1_timeout if timeout is None else min(timeout, self._l1_timeout)
+        with self._lock:
+            self._l1[made_key] = (time.monotonic() + ttl, value)
+            self._l1.move_to_end(made_key)
+            while len(self._l1) > self._l1_max_entries:
+                self._l1.popitem(last=False)
+
+    def _l1_delete(self, made_keys):
+        with self._lock:
+            for made_key in made_keys:
+                self._l1.pop(made_key, None)
+
+    def _l1_clear(self):
+        with self._lock:
+            self._l1.clear()
+
+    # Cross-worker invalidation
+
+    def _publish(self, made_keys):
+        """Tell the other processes to drop made_keys ('*' clears everything).
+
+        Costs two L2 round trips per write on top of the write itself (three
+        when the sequence counter has to be created): cheap on Redis, but on
+        the database fallback every cache.set() takes three statements. Use
+        set_many()/delete_many() to publish several keys in one message.
+        """
+        try:
+            try:
+                seq = self.l2.incr(self.seq_key)
+            except ValueError:
+                self.l2.add(self.seq_key, 0, None)
+                seq = self.l2.incr(self.seq_key)
+            self.l2.set(f"{self.message_prefix}_{seq}", list(made_keys), self.message_timeout)
+            self._count('invalidations_published')
+            with self._lock:
+                # Our own L1 is already up to date for this message
+                if self._sync_state['seen'] == seq - 1:
+                    self._sync_state['seen'] = seq
+        except Exception as e:
+            logger.error(f"Failed to publish cache invalidation: {e}")
+            self._l1_delete(made_keys)
+
+    def _sync(self):
+        """Apply invalidation messages published by other processes"""
+        now = time.monotonic()
+        with self._lock:
+            if now < self._sync_state['next_check']:
+                return
+            self._sync_state['next_check'] = now + self._check_interval
+            seen = self._sync_state['seen']
+
+        seq = self.l2.get(self.seq_key) or 0
+        if seen is None or seq == seen:
+            pass
+        elif seq < seen or seq - seen > self.max_replay:
+            # L2 was cleared or we fell too far behind to replay
+            self._l1_clear()
+        else:
+            message_keys = [f"{self.message_prefix}_{n}" for n in range(seen + 1, seq + 1)]
+            messages = self.l2.get_many(message_keys)
+            if len(messages) < len(message_keys):
+                self._l1_clear()
+            else:
+                evict = set()
+                for keys in messages.values():
+                    if '*' in keys:
+                        self._l1_clear()
+                        evict.clear()
+                        break
+                    evict.update(keys)
+                self._l1_delete(evict)
+            self._count('invalidations_received', len(message_keys))
+
+        with self._lock:
+            self._sync_state['seen'] = seq
+
+    # Cache API
+
+    def get(self, key, default=None, version=None):
+        if not self._uses_l1(key):
+            return self.l2.get(key, default, version)
+
+        self._sync()
+        made_key = self.make_and_validate_key(key, version=version)
+        value = self._l1_get(made_key)
+        if value is not _MISSING:
+            self._count('l1_hits')
+            return value
+        self._count('l1_misses')
+
+        value = self.l2.get(key, _MISSING, version)
+        if value is _MISSING:
+            self._count('l2_misses')
+            return default
+        self._count('l2_hits')
+        self._l1_set(made_key, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        self._sync()
+        results = {}
+        l2_keys = []
+        for key in keys:
+            if not self._uses_l1(key):
+                l2_keys.append(key)
+                continue
+            value = self._l1_get(self.make_and_validate_key(key, version=version))
+            if value is _MISSING:
+                self._count('l1_misses')
+                l2_keys.append(key)
+            else:
+                self._count('l1_hits')
+                results[key] = value
+
+        if l2_keys:
+            found = self.l2.get_many(l2_keys, version=version)
+            self._count('l2_hits', len(found))
+            self._count('l2_misses', len(l2_keys) - len(found))
+            for key, value in found.items():
+                if self._uses_l1(key):
+                    self._l1_set(self.make_and_validate_key(key, version=version), value)
+            results.update(found)
+        return results
+
+    def has_key(self, key, version=None):
+        if self._uses_l1(key):
+            self._sync()
+            if self._l1_get(self.make_and_validate_key(key, version=version)) is not _MISSING:
+                return True
+        return self.l2.has_key(key, version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l2.set(key, value, timeout, version)
+        if self._uses_l1(key):
+            made_key = self.make_and_validate_key(key, version=version)
+            self._publish([made_key])
+            self._l1_set(made_key, value, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.l2.set_many(data, timeout, version)
+        made_keys = {
+            key: self.make_and_validate_key(key, version=version)
+            for key in data if self._uses_l1(key)
+        }
+        if made_keys:
+            self._publish(made_keys.values())
+            for key, made_key in made_keys.items():
+                if key not in failed:
+                    self._l1_set(made_key, data[key], timeout)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.l2.add(key, value, timeout, version)
+        if added and self._uses_l1(key):
+            made_key = self.make_and_validate_key(key, version=version)
+            self._publish([made_key])
+            self._l1_set(made_key, value, timeout)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        touched = self.l2.touch(key, timeout, version)
+        if self._uses_l1(key):
+            self._l1_delete([self.make_and_validate_key(key, version=version)])
+        return touched
+
+    def incr(self, key, delta=1, version=None):
+        value = self.l2.incr(key, delta, version)
+        if self._uses_l1(key):
+            made_key = self.make_and_validate_key(key, version=version)
+            self._l1_delete([made_key])
+            self._publish([made_key])
+        return value
+
+    def delete(self, key, version=None):
+        deleted = self.l2.delete(key, version)
+        if self._uses_l1(key):
+            made_key = self.make_and_validate_key(key, version=version)
+            self._l1_delete([made_key])
+            self._publish([made_key])
+        return deleted
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self.l2.delete_many(keys, version)
+        made_keys = [self.make_and_validate_key(key, version=version) for key in keys if self._uses_l1(key)]
+        if made_keys:
+            self._l1_delete(made_keys)
+            self._publish(made_keys)
+
+    def clear(self):
+        self.l2.clear()
+        self._l1_clear()
+        self._publish(['*'])
+
+    def close(self, **kwargs):
+        self.l2.close(**kwargs)
+
+    # Async cache API
+
+    def _sync_due(self):
+        with self._lock:
+            return time.monotonic() >= self._sync_state['next_check']
+
+    async def aget(self, key, default=None, version=None):
+        if self._uses_l1(key) and not self._sync_due():
+            value = self._l1_get(self.make_and_validate_key(key, version=version))
+            if value is not _MISSING:
+                self._count('l1_hits')
+                return value
+        return await sync_to_async(self.get, thread_sensitive=False)(key, default, version)
+
+    async def aget_many(self, keys, version=None):
+        return await sync_to_async(self.get_many, thread_sensitive=False)(keys, version)
+
+    async def aset(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return await sync_to_async(self.set, thread_sensitive=False)(key, value, timeout, version)
+
+    async def aadd(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return await sync_to_async(self.add, thread_sensitive=False)(key, value, timeout, version)
+
+    async def aincr(self, key, delta=1, version=None):
+        return await sync_to_async(self.incr, thread_sensitive=False)(key, delta, version)
+
+    async def adelete(self, key, version=None):
+        return await sync_to_async(self.delete, thread_sensitive=False)(key, version)
+
+    def stats(self):
+        """Per-tier hit/miss counters for this process"""
+        with self._lock:
+            stats = dict(self._stats)
+            entries = len(self._l1)
+        return {
+            'l1': {
+                'hits': stats.get('l1_hits', 0),
+                'misses': stats.get('l1_misses', 0),
+                'entries': entries,
+                'max_entries': self._l1_max_entries,
+            },
+            'l2': {
+                'backend': self.l2.__class__.__name__,
+                'hits': stats.get('l2_hits', 0),
+                'misses': stats.get('l2_misses', 0),
+            },
+            'invalidations_published': stats.get('invalidations_published', 0),
+            'invalidations_received': stats.get('invalidations_received', 0),
+        }
+
+class AtomicDatabaseCache(DatabaseCache):
+    """DatabaseCache whose add() and incr() are safe across processes.
+
+    Used as the shared tier when there is no Redis. add() relies on the
+    primary key, so of two concurrent adds only one inserts, also when taking
+    over an expired key. incr() locks the row for the read-modify-write.
+    Culling never evicts keys starting with one of CULL_EXCLUDE_PREFIXES
+    (locks, counters and breaker state) and evicts the soonest-expiring
+    entries first.
+
+    OPTIONS (besides DatabaseCache's):
+        CULL_EXCLUDE_PREFIXES: keys culling must keep
+    """
+    def __init__(self, table, params):
+        super().__init__(table, params)
+        options = params.get('OPTIONS', {})
+        self._cull_exclude = tuple(options.get('CULL_EXCLUDE_PREFIXES', ()))
+
+    def _get_db(self):
+        db = router.db_for_write(self.cache_model_class)
+        return db, connections[db]
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        db, connection = self._get_db()
+        quote_name = connection.ops.quote_name
+        # Drop an expired entry first, so the add below is a plain INSERT that
+        # fails for everyone but the first caller
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM %s WHERE %s = %%s AND %s < %%s"
+                % (quote_name(self._table), quote_name('cache_key'), quote_name('expires')),
+                [key, connection.ops.adapt_datetimefield_value(tz_now().replace(microsecond=0))],
+            )
+        return self._base_set('add', key, value, timeout)
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        db, connection = self._get_db()
+        quote_name = connection.ops.quote_name
+        table = quote_name(self._table)
+        now = connection.ops.adapt_datetimefield_value(tz_now().replace(microsecond=0))
+        with transaction.atomic(using=db), connection.cursor() as cursor:
+            # A no-op write takes the row lock (the write lock on SQLite) before reading
+            cursor.execute(
+                "UPDATE %s SET %s = %s WHERE %s = %%s"
+                % (table, quote_name('expires'), quote_name('expires'), quote_name('cache_key')),
+                [key],
+            )
+            cursor.execute(
+                "SELECT %s FROM %s WHERE %s = %%s AND %s >= %%s"
+                % (quote_name('value'), table, quote_name('cache_key'), quote_name('expires')),
+                [key, now],
+            )
+            row = cursor.fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found.")
+            value = pickle.loads(base64.b64decode(row[0].encode())) + delta
+            cursor.execute(
+                "UPDATE %s SET %s = %%s WHERE %s = %%s"
+                % (table, quote_name('value'), quote_name('cache_key')),
+                [base64.b64encode(pickle.dumps(value, self.pickle_protocol)).decode('latin1'), key],
+            )
+        return value
+
+    def _get_cull_filter(self):
+        """WHERE clause and params that leave CULL_EXCLUDE_PREFIXES out of culling"""
+        if not self._cull_exclude:
+            return '', []
+
+        def escape(value):
+            return value.replace('!', '!!').replace('%', '!%').replace('_', '!_')
+
+        # Made keys look like "<KEY_PREFIX>:<version>:<key>"
+        patterns = [f"{escape(self.key_prefix)}:%:{escape(prefix)}%" for prefix in self._cull_exclude]
+        conditions = " OR ".join(["cache_key LIKE %s ESCAPE '!'"] * len(patterns))
+        return f" WHERE NOT ({conditions})", patterns
+
+    def _cull(self, db, cursor, now, num):
+        connection = connections[db]
+        quote_name = connection.ops.quote_name
+        table = quote_name(self._table)
+        cursor.execute(
+            "DELETE FROM %s WHERE %s < %%s" % (table, quote_name('expires')),
+            [connection.ops.adapt_datetimefield_value(now)],
+        )
+        remaining_num = num - cursor.rowcount
+        if remaining_num <= self._max_entries or not self._cull_frequency:
+            return
+        where, params = self._get_cull_filter()
+        cursor.execute(
+            "SELECT %s FROM %s%s ORDER BY %s LIMIT %%s"
+            % (quote_name('cache_key'), table, where, quote_name('expires')),
+            params + [remaining_num // self._cull_frequency],
+        )
+        cull = [row[0] for row in cursor.fetchall()]
+        for start in range(0, len(cull), 500):
+            chunk = cull[start:start + 500]
+            cursor.execute(
+                "DELETE FROM %s WHERE %s IN (%s)"
+                % (table, quote_name('cache_key'), ', '.join(['%s'] * len(chunk))),
+                chunk,
+            )
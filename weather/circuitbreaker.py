@@ -0,0 +1,178 @@
+import time
+import uuid
+import logging
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger('weather_api')
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class CircuitBreaker:
+    """Circuit breaker for OpenWeatherMap calls, shared by every worker through the cache.
+
+    Outcomes are counted in WEATHER_CIRCUIT_BUCKET-second buckets. When at least
+    WEATHER_CIRCUIT_MIN_REQUESTS calls in the last WEATHER_CIRCUIT_WINDOW seconds
+    failed at a rate of WEATHER_CIRCUIT_ERROR_THRESHOLD or more, the circuit
+    opens and calls fail immediately. After WEATHER_CIRCUIT_OPEN_DURATION it is
+    half-open: one worker sends a probe, which closes the circuit on success or
+    opens it again on failure. Only timeouts, connection errors and 5xx
+    responses count as failures.
+    """
+    state_key = "circuit_state"
+    probe_key = "circuit_probe"
+    counter_prefix = "circuit_count"
+
+    def _get_bucket(self, now):
+        return int(now // settings.WEATHER_CIRCUIT_BUCKET)
+
+    def _get_counter_key(self, state, outcome, bucket):
+        # Each state change starts fresh counters, so failures from before the
+        # circuit last closed never count again
+        return f"{self.counter_prefix}_{int(state['since'] * 1000)}_{outcome}_{bucket}"
+
+    def _incr(self, state, outcome, now):
+        key = self._get_counter_key(state, outcome, self._get_bucket(now))
+        timeout = settings.WEATHER_CIRCUIT_WINDOW + settings.WEATHER_CIRCUIT_BUCKET
+        cache.add(key, 0, timeout)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Expired between add() and incr()
+            cache.set(key, 1, timeout)
+
+    def _get_state(self):
+        return cache.get(self.state_key) or {'state': CLOSED, 'since': 0}
+
+    def _set_state(self, state, now):
+        cache.set(self.state_key, {'state': state, 'since': now}, None)
+        logger.warning(f"Weather service circuit {state.replace('_', '-')}")
+
+    def get_window_counts(self, state, now=None):
+        """Return (successes, failures) since state began, within the rolling window"""
+        now = now or time.time()
+        current = self._get_bucket(now)
+        first = current - settings.WEATHER_CIRCUIT_WINDOW // settings.WEATHER_CIRCUIT_BUCKET + 1
+        keys = {
+            self._get_counter_key(state, outcome, bucket): outcome
+            for bucket in range(first, current + 1)
+            for outcome in ('success', 'failure')
+        }
+        counts = {'success': 0, 'failure': 0}
+        for key, value in cache.get_many(list(keys)).items():
+            counts[keys[key]] += value
+        return counts['success'], counts['failure']
+
+    def get_current_state(self, now=None, state=None):
+        """Effective state, treating an open circuit past its open duration as half-open"""
+        now = now or time.time()
+        state = state or self._get_state()
+        if state['state'] == OPEN and now - state['since'] >= settings.WEATHER_CIRCUIT_OPEN_DURATION:
+            return HALF_OPEN
+        return state['state']
+
+    def allow_request(self):
+        """Whether an upstream call may be made now; fails open if the cache is unavailable.
+
+        The caller that gets the half-open probe receives the probe's token
+        (a true value) and must pass it to release_probe() if it ends up not
+        calling upstream.
+        """
+        try:
+            state = self.get_current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN:
+                # A single probe per open period; everyone else keeps failing fast
+                token = uuid.uuid4().hex
+                if cache.add(self.probe_key, token, settings.WEATHER_CIRCUIT_PROBE_TIMEOUT):
+                    return token
+            return False
+        except Exception as e:
+            logger.error(f"Circuit breaker unavailable, allowing upstream call: {e}")
+            return True
+
+    def release_probe(self, token):
+        """Give up a probe taken by allow_request() without calling upstream"""
+        if token is True:
+            return
+        try:
+            if cache.get(self.probe_key) == token:
+                cache.delete(self.probe_key)
+        except Exception as e:
+            logger.error(f"Failed to release circuit probe: {e}")
+
+    def record_success(self):
+        """Record a call that reached a healthy upstream"""
+        try:
+            now = time.time()
+            state = self._get_state()
+            self._incr(state, 'success', now)
+            if self.get_current_state(now, state) == HALF_OPEN:
+                self._set_state(CLOSED, now)
+                cache.delete(self.probe_key)
+        except Exception as e:
+            logger.error(f"Failed to record upstream success: {e}")
+
+    def record_failure(self):
+        """Record a timeout, connection error or 5xx and open the circuit if needed"""
+        try:
+            now = time.time()
+            state = self._get_state()
+            self._incr(state, 'failure', now)
+            if state['state'] == OPEN:
+                if self.get_current_state(now, state) == HALF_OPEN:
+                    # The probe failed
+                    self._set_state(OPEN, now)
+                    cache.delete(self.probe_key)
+                return
+            successes, failures = self.get_window_counts(state, now)
+            total = successes + failures
+            if total >= settings.WEATHER_CIRCUIT_MIN_REQUESTS and failures / total >= settings.WEATHER_CIRCUIT_ERROR_THRESHOLD:
+                self._set_state(OPEN, now)
+        except Exception as e:
+            logger.error(f"Failed to record upstream failure: {e}")
+
+    async def aallow_request(self):
+        """Coroutine version of allow_request()"""
+        return await sync_to_async(self.allow_request, thread_sensitive=False)()
+
+    async def arelease_probe(self, token):
+        """Coroutine version of release_probe()"""
+        await sync_to_async(self.release_probe, thread_sensitive=False)(token)
+
+    async def arecord_success(self):
+        """Coroutine version of record_success()"""
+        await sync_to_async(self.record_success, thread_sensitive=False)()
+
+    async def arecord_failure(self):
+        """Coroutine version of record_failure()"""
+        await sync_to_async(self.record_failure, thread_sensitive=False)()
+
+    def status(self):
+        """Breaker state and rolling error rate for monitoring"""
+        now = time.time()
+        try:
+            state = self._get_state()
+            current = self.get_current_state(now, state)
+            successes, failures = self.get_window_counts(state, now)
+        except Exception as e:
+            return {'error': str(e)}
+        total = successes + failures
+        status = {
+            'state': current,
+            'since': state['since'] or None,
+            'window_seconds': settings.WEATHER_CIRCUIT_WINDOW,
+            'successes': successes,
+            'failures': failures,
+            'error_rate': round(failures / total, 3) if total else 0,
+            'error_threshold': settings.WEATHER_CIRCUIT_ERROR_THRESHOLD,
+        }
+        if current == OPEN:
+            status['retry_in'] = round(settings.WEATHER_CIRCUIT_OPEN_DURATION - (now - state['since']), 1)
+        return status
+
+circuit_breaker = CircuitBreaker()
@@ -0,0 +1,225 @@
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from .ratelimit import background_priority
+
+logger = logging.getLogger('weather_api')
+
+class _Call:
+    """An in-flight fetch that other threads in this process can wait on"""
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Coalesce concurrent fetches for the same key into a single upstream call.
+
+    Threads in one process share the leader's result directly. Across gunicorn
+    workers a lock is taken with cache.add(); workers that lose the race poll
+    the shared cache for the leader's published result instead of fetching.
+    """
+    lock_prefix = "singleflight"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def _get_lock_key(self, key):
+        """Generate cache key for the cross-worker fetch lock"""
+        return f"{self.lock_prefix}_{key}"
+
+    def do(self, key, fetch, peek):
+        """Run fetch() once per key; peek() returns a result published by another worker"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            logger.info(f"Waiting for in-flight fetch of {key}")
+            if not call.event.wait(settings.WEATHER_FETCH_WAIT_TIMEOUT):
+                raise TimeoutError(f"Timed out waiting for in-flight fetch of {key}")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._do_across_workers(key, fetch, peek)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            self._finish(key, call)
+
+    def _do_across_workers(self, key, fetch, peek):
+        """Take the shared lock for key, or wait for the worker that holds it"""
+        lock_key = self._get_lock_key(key)
+        token = uuid.uuid4().hex
+
+        if not cache.add(lock_key, token, settings.WEATHER_FETCH_LOCK_TIMEOUT):
+            logger.info(f"Fetch of {key} is in flight in another worker, waiting")
+            deadline = time.monotonic() + settings.WEATHER_FETCH_WAIT_TIMEOUT
+            while time.monotonic() < deadline:
+                time.sleep(settings.WEATHER_FETCH_POLL_INTERVAL)
+                result = peek()
+                if result is not None:
+                    return result
+                if cache.get(lock_key) is None:
+                    break
+
+            # The other worker failed or stalled: try to lead, otherwise fetch uncoordinated
+            result = peek()
+            if result is not None:
+                return result
+            if not cache.add(lock_key, token, settings.WEATHER_FETCH_LOCK_TIMEOUT):
+                logger.warning(f"Fetch lock for {key} still held, fetching without coalescing")
+                return fetch()
+
+        try:
+            return fetch()
+        finally:
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+
+    def do_in_background(self, key, fetch):
+        """Start fetch() in a background thread unless a fetch for key is already in flight"""
+        with self._lock:
+            if key in self._calls:
+                return False
+            call = _Call()
+            self._calls[key] = call
+
+        lock_key = self._get_lock_key(key)
+        token = uuid.uuid4().hex
+        if not cache.add(lock_key, token, settings.WEATHER_FETCH_LOCK_TIMEOUT):
+            # Another worker is already refreshing this key
+            self._finish(key, call)
+            return False
+
+        def run():
+            try:
+                with background_priority():
+                    call.result = fetch()
+            except Exception as e:
+                call.error = e
+                logger.error(f"Background refresh of {key} failed: {e}")
+            finally:
+                if cache.get(lock_key) == token:
+                    cache.delete(lock_key)
+                self._finish(key, call)
+                connection.close()
+
+        threading.Thread(target=run, name=f"refresh-{key}", daemon=True).start()
+        return True
+
+    def _finish(self, key, call):
+        """Forget the in-flight call and wake up any waiters"""
+        with self._lock:
+            self._calls.pop(key, None)
+        call.event.set()
+
+class AsyncSingleFlight(SingleFlight):
+    """Single-flight coordination for coroutines running on an ASGI event loop"""
+
+    def __init__(self):
+        super().__init__()
+        self._tasks = set()
+
+    async def do(self, key, fetch, peek):
+        """Await fetch() once per key; peek() returns a result published by another worker"""
+        call = self._calls.get(key)
+        if call is not None:
+            logger.info(f"Waiting for in-flight fetch of {key}")
+            result = await asyncio.wait_for(asyncio.shield(call), settings.WEATHER_FETCH_WAIT_TIMEOUT)
+            if result is not None:
+                return result
+            # A background refresh gave up because another worker holds the lock
+            return await self.do(key, fetch, peek)
+
+        call = asyncio.get_running_loop().create_future()
+        self._calls[key] = call
+        try:
+            result = await self._do_across_workers(key, fetch, peek)
+            call.set_result(result)
+            return result
+        except Exception as e:
+            call.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            call.exception()
+            raise
+        finally:
+            self._calls.pop(key, None)
+
+    async def _do_across_workers(self, key, fetch, peek):
+        """Take the shared lock for key, or wait for the worker that holds it"""
+        lock_key = self._get_lock_key(key)
+        token = uuid.uuid4().hex
+
+        if not await cache.aadd(lock_key, token, settings.WEATHER_FETCH_LOCK_TIMEOUT):
+            logger.info(f"Fetch of {key} is in flight in another worker, waiting")
+            deadline = time.monotonic() + settings.WEATHER_FETCH_WAIT_TIMEOUT
+            while time.monotonic() < deadline:
+                await asyncio.sleep(settings.WEATHER_FETCH_POLL_INTERVAL)
+                result = await peek()
+                if result is not None:
+                    return result
+                if await cache.aget(lock_key) is None:
+                    break
+
+            result = await peek()
+            if result is not None:
+                return result
+            if not await cache.aadd(lock_key, token, settings.WEATHER_FETCH_LOCK_TIMEOUT):
+                logger.warning(f"Fetch lock for {key} still held, fetching without coalescing")
+                return await fetch()
+
+        try:
+            return await fetch()
+        finally:
+            if await cache.aget(lock_key) == token:
+                await cache.adelete(lock_key)
+
+    def do_in_background(self, key, fetch):
+        """Schedule fetch() as a task unless a fetch for key is already in flight"""
+        if key in self._calls:
+            return False
+
+        call = asyncio.get_running_loop().create_future()
+        self._calls[key] = call
+        lock_key = self._get_lock_key(key)
+        token = uuid.uuid4().hex
+
+        async def run():
+            result = None
+            try:
+                if await cache.aadd(lock_key, token, settings.WEATHER_FETCH_LOCK_TIMEOUT):
+                    try:
+                        with background_priority():
+                            result = await fetch()
+                    finally:
+                        if await cache.aget(lock_key) == token:
+                            await cache.adelete(lock_key)
+            except Exception as e:
+                logger.error(f"Background refresh of {key} failed: {e}")
+            finally:
+                self._calls.pop(key, None)
+                call.set_result(result)
+
+        task = asyncio.get_running_loop().create_task(run())
+        # Keep a reference so the task is not garbage collected before it finishes
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+# One coordinator per process, shared by every WeatherCacheService instance
+single_flight = SingleFlight()
+async_single_flight = AsyncSingleFlight()
@@ -0,0 +1,70 @@
+import logging
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.conf import settings
+from .models import City
+from .live import get_city_group_name, convert_message
+from .units import TEMPERATURE_UNITS, DEFAULT_TEMPERATURE_UNIT
+
+logger = logging.getLogger('weather_api')
+
+class WeatherUpdatesConsumer(AsyncJsonWebsocketConsumer):
+    """Push weather and forecast changes for the cities a client subscribes to.
+
+    Clients send {"action": "subscribe", "city_ids": [1, 2]} or the same with
+    "unsubscribe"; every later write of a subscribed city arrives as a
+    {"type": "weather"} or {"type": "forecast"} message (see weather.live).
+    A subscribe may also set "unit" ("C" or "F") for the connection's messages.
+    """
+
+    async def connect(self):
+        self.city_ids = set()
+        self.unit = DEFAULT_TEMPERATURE_UNIT
+        await self.accept()
+
+    async def disconnect(self, code):
+        for city_id in self.city_ids:
+            await self.channel_layer.group_discard(get_city_group_name(city_id), self.channel_name)
+
+    async def send_error(self, error):
+        await self.send_json({'type': 'error', 'error': error, 'code': 'INVALID_MESSAGE'})
+
+    async def receive_json(self, content, **kwargs):
+        action = content.get('action') if isinstance(content, dict) else None
+        city_ids = content.get('city_ids') if isinstance(content, dict) else None
+        if action not in ('subscribe', 'unsubscribe'):
+            await self.send_error('action must be "subscribe" or "unsubscribe"')
+            return
+        if not isinstance(city_ids, list) or not all(isinstance(city_id, int) for city_id in city_ids):
+            await self.send_error('city_ids must be a list of city IDs')
+            return
+        unit = content.get('unit')
+        if unit is not None and unit not in TEMPERATURE_UNITS:
+            await self.send_error(f'unit must be one of {", ".join(TEMPERATURE_UNITS)}')
+            return
+        if unit is not None:
+            self.unit = unit
+
+        if action == 'subscribe':
+            requested = set(city_ids) - self.city_ids
+            if len(self.city_ids) + len(requested) > settings.WEATHER_LIVE_MAX_SUBSCRIPTIONS:
+                await self.send_error(
+                    f'At most {settings.WEATHER_LIVE_MAX_SUBSCRIPTIONS} cities per connection'
+                )
+                return
+            existing = {
+                city_id async for city_id in City.objects.filter(pk__in=requested).values_list('pk', flat=True)
+            }
+            for city_id in existing:
+                await self.channel_layer.group_add(get_city_group_name(city_id), self.channel_name)
+            self.city_ids |= existing
+            logger.info(f"Live client subscribed to {len(existing)} cities")
+        else:
+            for city_id in self.city_ids.intersection(city_ids):
+                await self.channel_layer.group_discard(get_city_group_name(city_id), self.channel_name)
+            self.city_ids.difference_update(city_ids)
+
+        await self.send_json({'type': 'subscriptions', 'city_ids': sorted(self.city_ids), 'unit': self.unit})
+
+    async def weather_update(self, event):
+        """Forward a message published by weather.live.publish"""
+        await self.send_json(convert_message(event['message'], self.unit))
@@ -0,0 +1,103 @@
+import logging
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
+from .models import City, UserPreference
+
+logger = logging.getLogger('weather_api')
+
+# Rows of the UserPreference.favorite_cities join table; unique on (userpreference, city)
+Favorite = UserPreference.favorite_cities.through
+
+class FavoritesService:
+    """Favourite cities of a session.
+
+    The favourite city IDs of each session are cached as a sorted list (the
+    favourites vector) and dropped whenever that session's favourites change.
+    Membership checks and writes go straight to the indexed join table instead
+    of loading every favourite. Deleting a city or a preference also drops the
+    vectors it was part of (see the receivers below).
+    """
+    def __init__(self):
+        self.favorites_cache_prefix = "weather_favorites"
+
+    def _get_favorites_cache_key(self, session_key):
+        """Generate cache key for the favourites vector of a session"""
+        return f"{self.favorites_cache_prefix}_{session_key}"
+
+    def get_city_ids(self, session_key):
+        """Return the sorted favourite city IDs of a session"""
+        if not session_key:
+            return []
+        cache_key = self._get_favorites_cache_key(session_key)
+        city_ids = cache.get(cache_key)
+        if city_ids is None:
+            city_ids = sorted(
+                Favorite.objects.filter(userpreference__session_key=session_key).values_list('city_id', flat=True)
+            )
+            cache.set(cache_key, city_ids, settings.WEATHER_FAVORITES_CACHE_TIMEOUT)
+        return city_ids
+
+    def get_cities(self, session_key):
+        """Return the favourite City objects of a session with one joined query"""
+        if not session_key:
+            return []
+        return list(City.objects.filter(userpreference__session_key=session_key).order_by('id'))
+
+    def is_favorite(self, session_key, city_id):
+        """Check one city against the join table's (userpreference, city) index"""
+        return Favorite.objects.filter(userpreference__session_key=session_key, city_id=city_id).exists()
+
+    def add(self, session_key, city_ids):
+        """Add cities to a session's favourites and return (preference, added IDs, unknown IDs)"""
+        preference, created = UserPreference.objects.get_or_create(session_key=session_key)
+        existing = set(City.objects.filter(pk__in=city_ids).values_list('pk', flat=True))
+        already = set(
+            Favorite.objects.filter(userpreference=preference, city_id__in=existing).values_list('city_id', flat=True)
+        )
+        added = sorted(existing - already)
+        if added:
+            # One bulk insert for all new rows
+            preference.favorite_cities.add(*added)
+            self.invalidate(session_key)
+            logger.info(f"Added {len(added)} favourite cities for session {session_key}")
+        return preference, added, sorted(set(city_ids) - existing)
+
+    def remove(self, session_key, city_ids):
+        """Remove cities from a session's favourites and return (preference, removed IDs)"""
+        preference = UserPreference.objects.get(session_key=session_key)
+        removed = sorted(
+            Favorite.objects.filter(userpreference=preference, city_id__in=city_ids).values_list('city_id', flat=True)
+        )
+        if removed:
+            # One DELETE for all rows
+            preference.favorite_cities.remove(*removed)
+            self.invalidate(session_key)
+            logger.info(f"Removed {len(removed)} favourite cities for session {session_key}")
+        return preference, removed
+
+    def invalidate(self, session_key):
+        """Drop the cached favourites vector of a session"""
+        cache.delete(self._get_favorites_cache_key(session_key))
+
+    def invalidate_many(self, session_keys):
+        """Drop the cached favourites vectors of several sessions"""
+        if session_keys:
+            cache.delete_many([self._get_favorites_cache_key(session_key) for session_key in session_keys])
+
+@receiver(pre_delete, sender=City)
+def _invalidate_city_favorites(sender, instance, using, **kwargs):
+    """Drop the vectors that list a city about to be deleted, once the delete commits"""
+    # The join table rows are gone by post_delete, so look the sessions up now
+    session_keys = list(
+        Favorite.objects.using(using).filter(city=instance).values_list('userpreference__session_key', flat=True)
+    )
+    if session_keys:
+        transaction.on_commit(lambda: FavoritesService().invalidate_many(session_keys), using=using)
+
+@receiver(post_delete, sender=UserPreference)
+def _invalidate_preference_favorites(sender, instance, using, **kwargs):
+    """Drop the vector of a deleted preference once the delete commits"""
+    transaction.on_commit(lambda: FavoritesService().invalidate(instance.session_key), using=using)
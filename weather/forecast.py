@@ -0,0 +1,108 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+from statistics import fmean
+
+# Column layout of ForecastSeries.points: one list per field, index i is the i-th
+# 3-hour slot. Each entry maps the column name to a getter on an upstream item.
+SERIES_COLUMNS = {
+    'dt': lambda item: item['dt'],
+    'temp': lambda item: item['main']['temp'],
+    'feels_like': lambda item: item['main'].get('feels_like', item['main']['temp']),
+    'temp_min': lambda item: item['main']['temp_min'],
+    'temp_max': lambda item: item['main']['temp_max'],
+    'humidity': lambda item: item['main']['humidity'],
+    'pressure': lambda item: item['main']['pressure'],
+    'weather_main': lambda item: item['weather'][0]['main'],
+    'weather_description': lambda item: item['weather'][0]['description'],
+    'weather_icon': lambda item: item['weather'][0]['icon'],
+    'wind_speed': lambda item: item.get('wind', {}).get('speed', 0),
+    'wind_deg': lambda item: item.get('wind', {}).get('deg', 0),
+    'pop': lambda item: item.get('pop', 0),
+    'pod': lambda item: item.get('sys', {}).get('pod', ''),
+}
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+def pack_forecast_series(forecast_data):
+    """Convert the upstream 3-hourly forecast into a column-oriented dict of lists"""
+    items = sorted(forecast_data['list'], key=lambda item: item['dt'])
+    return {column: [getter(item) for item in items] for column, getter in SERIES_COLUMNS.items()}
+
+def _day_slices(timestamps, timezone_offset):
+    """Split sorted timestamps into (local day start, slice) runs"""
+    slices = []
+    start = 0
+    day_keys = [(dt + timezone_offset) // SECONDS_PER_DAY for dt in timestamps]
+    for index in range(1, len(day_keys) + 1):
+        if index == len(day_keys) or day_keys[index] != day_keys[start]:
+            slices.append((day_keys[start], slice(start, index)))
+            start = index
+    return slices
+
+def aggregate_daily(points, timezone_offset=0, days=5):
+    """Compute one summary per local calendar day from a packed 3-hourly series.
+
+    forecast_date is the local midnight of the day expressed in UTC, so the same
+    day keeps the same key across refreshes. Day and night temperatures are the
+    means of the daytime ('d') and night-time ('n') slots, falling back to the
+    daily max and min when a partial day has no slot of that kind.
+    """
+    daily = []
+    for day_key, day in _day_slices(points['dt'], timezone_offset)[:days]:
+        temps = points['temp'][day]
+        pods = points['pod'][day]
+        day_temps = [temp for temp, pod in zip(temps, pods) if pod == 'd']
+        night_temps = [temp for temp, pod in zip(temps, pods) if pod == 'n']
+        temperature_min = min(points['temp_min'][day])
+        temperature_max = max(points['temp_max'][day])
+
+        # Describe the day by its most frequent condition, preferring daytime slots
+        indices = range(day.start, day.stop)
+        daytime = [i for i in indices if points['pod'][i] == 'd'] or list(indices)
+        weather_main = Counter(points['weather_main'][i] for i in daytime).most_common(1)[0][0]
+        representative = next(i for i in daytime if points['weather_main'][i] == weather_main)
+
+        daily.append({
+            'forecast_date': datetime.fromtimestamp(
+                day_key * SECONDS_PER_DAY - timezone_offset, tz=dt_timezone.utc
+            ),
+            'temperature_min': temperature_min,
+            'temperature_max': temperature_max,
+            'temperature_day': round(fmean(day_temps), 2) if day_temps else temperature_max,
+            'temperature_night': round(fmean(night_temps), 2) if night_temps else temperature_min,
+            'humidity': round(fmean(points['humidity'][day])),
+            'pressure': round(fmean(points['pressure'][day]), 1),
+            'weather_main': weather_main,
+            'weather_description': points['weather_description'][representative],
+            'weather_icon': points['weather_icon'][representative],
+            'wind_speed': round(fmean(points['wind_speed'][day]), 2),
+            'wind_direction': points['wind_deg'][representative],
+        })
+    return daily
+
+def unpack_hourly(points, timezone_offset=0):
+    """Expand a packed series into one dict per 3-hour slot for the hourly endpoint"""
+    return [
+        {
+            'forecast_time': datetime.fromtimestamp(
+                points['dt'][i], tz=dt_timezone.utc
+            ).isoformat().replace('+00:00', 'Z'),
+            'local_time': (
+                datetime.fromtimestamp(points['dt'][i], tz=dt_timezone.utc)
+                + timedelta(seconds=timezone_offset)
+            ).replace(tzinfo=None).isoformat(),
+            'temperature': points['temp'][i],
+            'feels_like': points['feels_like'][i],
+            'temperature_min': points['temp_min'][i],
+            'temperature_max': points['temp_max'][i],
+            'humidity': points['humidity'][i],
+            'pressure': points['pressure'][i],
+            'weather_main': points['weather_main'][i],
+            'weather_description': points['weather_description'][i],
+            'weather_icon': points['weather_icon'][i],
+            'wind_speed': points['wind_speed'][i],
+            'wind_direction': points['wind_deg'][i],
+            'precipitation_probability': points['pop'][i],
+        }
+        for i in range(len(points['dt']))
+    ]
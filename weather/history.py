@@ -0,0 +1,242 @@
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+from statistics import fmean
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import WeatherObservationChunk, WeatherRollup
+
+logger = logging.getLogger('weather_api')
+
+# Column layout of WeatherObservationChunk.points: one list per field, index i is
+# the i-th observation of the day in time order. Each entry maps the column name
+# to a getter on an upstream current weather payload.
+HISTORY_COLUMNS = {
+    'dt': lambda data: int(data.get('dt') or timezone.now().timestamp()),
+    'temp': lambda data: data['main']['temp'],
+    'feels_like': lambda data: data['main'].get('feels_like', data['main']['temp']),
+    'humidity': lambda data: data['main']['humidity'],
+    'pressure': lambda data: data['main']['pressure'],
+    'wind_speed': lambda data: data.get('wind', {}).get('speed', 0),
+}
+
+SECONDS_PER_HOUR = 60 * 60
+SECONDS_PER_DAY = 24 * SECONDS_PER_HOUR
+
+ROLLUP_FIELDS = [
+    'samples', 'temperature_avg', 'temperature_min', 'temperature_max', 'feels_like_avg',
+    'humidity_avg', 'pressure_avg', 'wind_speed_avg', 'wind_speed_max'
+]
+
+def _utc(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+
+def _summarize(points, indices):
+    """Aggregate the observations at indices into WeatherRollup field values"""
+    def column(name):
+        return [points[name][i] for i in indices]
+
+    temps = column('temp')
+    winds = column('wind_speed')
+    return {
+        'samples': len(indices),
+        'temperature_avg': round(fmean(temps), 2),
+        'temperature_min': min(temps),
+        'temperature_max': max(temps),
+        'feels_like_avg': round(fmean(column('feels_like')), 2),
+        'humidity_avg': round(fmean(column('humidity')), 1),
+        'pressure_avg': round(fmean(column('pressure')), 1),
+        'wind_speed_avg': round(fmean(winds), 2),
+        'wind_speed_max': max(winds),
+    }
+
+def build_rollups(city_id, day, points, hours):
+    """Recompute the daily rollup of a chunk and the hourly rollups of the given hours.
+
+    A chunk holds a whole UTC day, so every bucket it touches can be rebuilt
+    from it alone; rollups are therefore idempotent and safe to upsert.
+    """
+    by_hour = {}
+    for index, timestamp in enumerate(points['dt']):
+        by_hour.setdefault(timestamp // SECONDS_PER_HOUR, []).append(index)
+
+    rollups = [
+        WeatherRollup(
+            city_id=city_id, resolution=WeatherRollup.HOURLY,
+            bucket_start=_utc(hour * SECONDS_PER_HOUR), **_summarize(points, by_hour[hour])
+        )
+        for hour in sorted(hours)
+    ]
+    rollups.append(WeatherRollup(
+        city_id=city_id, resolution=WeatherRollup.DAILY,
+        bucket_start=datetime(day.year, day.month, day.day, tzinfo=dt_timezone.utc),
+        **_summarize(points, range(len(points['dt'])))
+    ))
+    return rollups
+
+class WeatherHistoryService:
+    """Append-only observation history with hourly and daily rollups.
+
+    Raw observations are packed per city and UTC day into WeatherObservationChunk
+    rows. Every append rebuilds the affected hourly and daily WeatherRollup rows,
+    so range queries over long periods read one row per bucket instead of every
+    observation. Each tier is pruned after its own retention period.
+    """
+    resolutions = ['raw', 'hourly', 'daily']
+    rollup_resolutions = {'hourly': WeatherRollup.HOURLY, 'daily': WeatherRollup.DAILY}
+    bucket_lengths = {'hourly': timedelta(hours=1), 'daily': timedelta(days=1)}
+
+    def get_retention(self, resolution):
+        """Retention period of a resolution, or None to keep it forever"""
+        days = {
+            'raw': settings.WEATHER_HISTORY_RAW_RETENTION_DAYS,
+            'hourly': settings.WEATHER_HISTORY_HOURLY_RETENTION_DAYS,
+            'daily': settings.WEATHER_HISTORY_DAILY_RETENTION_DAYS,
+        }[resolution]
+        return timedelta(days=days) if days else None
+
+    def record(self, city, weather_data):
+        """Append one upstream current weather payload to a city's history"""
+        return self.record_many([(city.id, weather_data)])
+
+    def record_many(self, observations):
+        """Append (city id, upstream payload) observations and update their rollups.
+
+        Observations whose upstream timestamp is already stored are skipped, so
+        refreshing a city before its station reports again adds no duplicates.
+        Returns the number of observations appended.
+        """
+        by_chunk = {}
+        for city_id, weather_data in observations:
+            point = {column: getter(weather_data) for column, getter in HISTORY_COLUMNS.items()}
+            by_chunk.setdefault((city_id, _utc(point['dt']).date()), []).append(point)
+
+        appended = 0
+        rollups = []
+        with transaction.atomic():
+            for (city_id, day), new_points in by_chunk.items():
+                chunk, created = WeatherObservationChunk.objects.select_for_update().get_or_create(
+                    city_id=city_id, day=day,
+                    defaults={'points': {column: [] for column in HISTORY_COLUMNS}}
+                )
+                points = chunk.points
+                known = set(points['dt'])
+                added = []
+                for point in new_points:
+                    if point['dt'] not in known:
+                        known.add(point['dt'])
+                        added.append(point)
+                if not added:
+                    continue
+
+                for point in added:
+                    for column in HISTORY_COLUMNS:
+                        points[column].append(point[column])
+                # Late observations are rare; keep the columns in time order
+                if any(a > b for a, b in zip(points['dt'], points['dt'][1:])):
+                    order = sorted(range(len(points['dt'])), key=points['dt'].__getitem__)
+                    for column in HISTORY_COLUMNS:
+                        points[column] = [points[column][i] for i in order]
+
+                chunk.save(update_fields=['points', 'updated_at'])
+                appended += len(added)
+                hours = {point['dt'] // SECONDS_PER_HOUR for point in added}
+                rollups.extend(build_rollups(city_id, day, points, hours))
+
+            if rollups:
+                WeatherRollup.objects.bulk_create(
+                    rollups,
+                    update_conflicts=True,
+                    unique_fields=['city', 'resolution', 'bucket_start'],
+                    update_fields=ROLLUP_FIELDS,
+                )
+        return appended
+
+    def choose_resolution(self, start, end):
+        """Pick the finest resolution that keeps the range small and is still retained"""
+        now = timezone.now()
+        limits = [
+            ('raw', settings.WEATHER_HISTORY_RAW_MAX_SPAN),
+            ('hourly', settings.WEATHER_HISTORY_HOURLY_MAX_SPAN),
+        ]
+        for resolution, max_span in limits:
+            retention = self.get_retention(resolution)
+            if end - start > timedelta(seconds=max_span):
+                continue
+            if retention is None or start >= now - retention:
+                return resolution
+        return 'daily'
+
+    def get_range(self, city, start, end, resolution='auto'):
+        """Return (resolution, points) for a city between start and end"""
+        if resolution == 'auto':
+            resolution = self.choose_resolution(start, end)
+        if resolution == 'raw':
+            return resolution, self._get_raw_range(city, start, end)
+        return resolution, self._get_rollup_range(city, start, end, resolution)
+
+    def _get_raw_range(self, city, start, end):
+        """Unpack the observations between start and end from the daily chunks"""
+        start_ts, end_ts = start.timestamp(), end.timestamp()
+        chunks = WeatherObservationChunk.objects.filter(
+            city=city, day__gte=start.astimezone(dt_timezone.utc).date(),
+            day__lte=end.astimezone(dt_timezone.utc).date()
+        ).values_list('points', flat=True)
+
+        results = []
+        for points in chunks:
+            for i, timestamp in enumerate(points['dt']):
+                if start_ts <= timestamp <= end_ts:
+                    results.append({
+                        'time': _utc(timestamp),
+                        'temperature': points['temp'][i],
+                        'feels_like': points['feels_like'][i],
+                        'humidity': points['humidity'][i],
+                        'pressure': points['pressure'][i],
+                        'wind_speed': points['wind_speed'][i],
+                    })
+        return results
+
+    def _get_rollup_range(self, city, start, end, resolution):
+        """Read the rollup buckets overlapping start..end"""
+        rows = WeatherRollup.objects.filter(
+            city=city, resolution=self.rollup_resolutions[resolution],
+            bucket_start__gt=start - self.bucket_lengths[resolution], bucket_start__lte=end
+        ).values_list('bucket_start', *ROLLUP_FIELDS)
+
+        return [
+            {
+                'time': bucket_start,
+                'samples': samples,
+                'temperature': temperature_avg,
+                'temperature_min': temperature_min,
+                'temperature_max': temperature_max,
+                'feels_like': feels_like_avg,
+                'humidity': humidity_avg,
+                'pressure': pressure_avg,
+                'wind_speed': wind_speed_avg,
+                'wind_speed_max': wind_speed_max,
+            }
+            for (bucket_start, samples, temperature_avg, temperature_min, temperature_max,
+                 feels_like_avg, humidity_avg, pressure_avg, wind_speed_avg, wind_speed_max) in rows
+        ]
+
+    def prune(self):
+        """Delete observations and rollups older than their retention period"""
+        now = timezone.now()
+        deleted = {}
+
+        retention = self.get_retention('raw')
+        if retention is not None:
+            cutoff = (now - retention).astimezone(dt_timezone.utc).date()
+            deleted['raw'], _ = WeatherObservationChunk.objects.filter(day__lt=cutoff).delete()
+
+        for resolution, code in self.rollup_resolutions.items():
+            retention = self.get_retention(resolution)
+            if retention is not None:
+                deleted[resolution], _ = WeatherRollup.objects.filter(
+                    resolution=code, bucket_start__lt=now - retention
+                ).delete()
+
+        logger.info(f"Pruned weather history: {deleted}")
+        return deleted
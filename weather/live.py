@@ -0,0 +1,89 @@
+import logging
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from .serializers import _format_datetime
+from .units import DEFAULT_TEMPERATURE_UNIT, TEMPERATURE_UNITS, convert_rows
+
+logger = logging.getLogger('weather_api')
+
+# Push path for ws/weather/ subscribers. WeatherCacheService publishes one
+# message per city write to the city's channel group; the channel layer fans
+# it out, so no subscriber ever reads the database or cache. Messages carry
+# temperatures in the stored unit and say so in 'unit'; the consumer converts
+# them to the unit each connection asked for.
+
+LIVE_WEATHER_FIELDS = [
+    'temperature', 'feels_like', 'humidity', 'pressure', 'weather_main', 'weather_description',
+    'weather_icon', 'wind_speed', 'wind_direction', 'visibility', 'uv_index'
+]
+
+LIVE_FORECAST_FIELDS = [
+    'temperature_min', 'temperature_max', 'temperature_day', 'temperature_night', 'humidity',
+    'pressure', 'weather_main', 'weather_description', 'weather_icon', 'wind_speed', 'wind_direction'
+]
+
+def get_city_group_name(city_id):
+    """Channel group of the subscribers of a city"""
+    return f"weather_city_{city_id}"
+
+def _get_changes(previous, current, fields):
+    """Fields of current that differ from previous (all of them without a previous value)"""
+    return {
+        field: getattr(current, field) for field in fields
+        if previous is None or getattr(previous, field) != getattr(current, field)
+    }
+
+def weather_delta(previous, current):
+    """Live update message for a new WeatherData row"""
+    return {
+        'type': 'weather',
+        'city_id': current.city_id,
+        'unit': DEFAULT_TEMPERATURE_UNIT,
+        'cached_at': _format_datetime(current.cached_at),
+        'changes': _get_changes(previous, current, LIVE_WEATHER_FIELDS),
+    }
+
+def forecast_delta(city_id, previous, current):
+    """Live update message for a new list of ForecastData rows.
+
+    'days' holds the changed fields of new or changed days keyed by their
+    forecast_date, 'removed' the dates that dropped out of the forecast.
+    """
+    previous_days = {forecast.forecast_date: forecast for forecast in previous or []}
+    current_dates = {forecast.forecast_date for forecast in current}
+    days = {}
+    for forecast in current:
+        changes = _get_changes(previous_days.get(forecast.forecast_date), forecast, LIVE_FORECAST_FIELDS)
+        if changes:
+            days[_format_datetime(forecast.forecast_date)] = changes
+    return {
+        'type': 'forecast',
+        'city_id': city_id,
+        'unit': DEFAULT_TEMPERATURE_UNIT,
+        'cached_at': _format_datetime(min((forecast.cached_at for forecast in current), default=None)),
+        'days': days,
+        'removed': [_format_datetime(date) for date in sorted(previous_days) if date not in current_dates],
+    }
+
+def convert_message(message, unit):
+    """Return a weather or forecast message with its temperatures in unit"""
+    if unit not in TEMPERATURE_UNITS or message.get('unit', unit) == unit:
+        return message
+    message = dict(message, unit=unit)
+    if message['type'] == 'weather':
+        message['changes'] = convert_rows(message['changes'], unit)
+    elif message['type'] == 'forecast':
+        message['days'] = {day: convert_rows(changes, unit) for day, changes in message['days'].items()}
+    return message
+
+def publish(city_id, message):
+    """Fan a message out to every subscriber of a city with a single group_send"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(
+            get_city_group_name(city_id), {'type': 'weather.update', 'message': message}
+        )
+    except Exception as e:
+        logger.error(f"Failed to publish live update for city {city_id}: {e}")
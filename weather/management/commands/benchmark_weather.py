@@ -0,0 +1,122 @@
+import json
+import logging
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from weather.benchmark import WeatherBenchmark, compare
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the weather endpoints (cache hit, DB hit, upstream miss) in a test database '
+        'against the replay provider and write the results as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--cities', type=int, nargs='+', default=[10, 100, 1000, 10000],
+            help='City counts to benchmark (default: 10 100 1000 10000)'
+        )
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario (and sampled cities)')
+        parser.add_argument('--latency', type=float, default=0.05, help='Simulated upstream latency in seconds')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for city sampling and synthetic weather')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--compare', help='Compare against the results in this JSON file')
+        parser.add_argument(
+            '--max-regression', type=float, default=None,
+            help='Fail if any compared metric is worse by more than this percentage'
+        )
+        parser.add_argument('--keepdb', action='store_true', help='Reuse the test database between runs')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read baseline {options['compare']}: {e}")
+
+        results = self.run_benchmark(options)
+        self.print_results(results)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote results to {options['output']}"))
+
+        if baseline is not None:
+            self.print_comparison(results, baseline, options['max_regression'])
+
+    def run_benchmark(self, options):
+        """Run the benchmark in a throwaway database, cache and channel layer"""
+        isolated = override_settings(
+            WEATHER_PROVIDER='weather.replay.ReplayWeatherProvider',
+            WEATHER_ASYNC_PROVIDER='weather.replay.AsyncReplayWeatherProvider',
+            WEATHER_REPLAY={
+                'RECORDINGS': '', 'LATENCY': options['latency'], 'JITTER': 0.0,
+                'ERROR_RATE': 0.0, 'SEED': options['seed'],
+            },
+            CACHES={
+                'default': {
+                    'BACKEND': 'weather.cache_backends.TieredCache',
+                    'LOCATION': 'weather-benchmark',
+                    'OPTIONS': {
+                        'L2_ALIAS': 'shared',
+                        'L1_EXCLUDE_PREFIXES': settings.WEATHER_COORDINATION_KEY_PREFIXES,
+                    },
+                },
+                'shared': {
+                    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                    'LOCATION': 'weather-benchmark-shared',
+                    'OPTIONS': {'MAX_ENTRIES': 100000},
+                },
+            },
+            CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+            ALLOWED_HOSTS=['testserver'],
+        )
+
+        # Per-request logging would dominate the timings
+        api_logger = logging.getLogger('weather_api')
+        previous_level = api_logger.level
+        if options['verbosity'] < 2:
+            api_logger.setLevel(logging.ERROR)
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=options['verbosity'], autoclobber=True, serialize=False, keepdb=options['keepdb']
+        )
+        try:
+            with isolated:
+                benchmark = WeatherBenchmark(
+                    options['cities'], requests=options['requests'], seed=options['seed'],
+                    progress=self.stdout.write,
+                )
+                return benchmark.run()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=options['verbosity'], keepdb=options['keepdb'])
+            teardown_test_environment()
+            api_logger.setLevel(previous_level)
+
+    def print_results(self, results):
+        self.stdout.write(
+            f"{'endpoint':<20} {'tier':<14} {'cities':>6} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} "
+            f"{'p99 ms':>9} {'queries':>8}"
+        )
+        for row in results['scenarios']:
+            self.stdout.write(
+                f"{row['endpoint']:<20} {row['tier']:<14} {row['cities']:>6} {row['throughput']:>9} "
+                f"{row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f} {row['queries_per_request']:>8}"
+            )
+
+    def print_comparison(self, results, baseline, max_regression):
+        threshold = (max_regression if max_regression is not None else 10) / 100
+        rows = compare(results, baseline, threshold)
+        self.stdout.write(f"\nCompared with {baseline.get('commit') or 'baseline'} ({len(rows)} metrics):")
+        regressions = [row for row in rows if row[5]]
+        for name, metric, old, new, change, regressed in rows:
+            line = f"{name:<40} {metric:<11} {old:>10} -> {new:<10} {change:+.1%}"
+            self.stdout.write(self.style.ERROR(line) if regressed else line)
+        if regressions and max_regression is not None:
+            raise CommandError(f"{len(regressions)} metrics regressed by more than {max_regression}%")
+        self.stdout.write(f"{len(regressions)} metrics worse by more than {threshold:.0%}")
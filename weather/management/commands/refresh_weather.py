@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from weather.scheduler import RefreshScheduler
+
+class Command(BaseCommand):
+    help = 'Pre-warm current weather and forecasts for tracked cities before their cache expires'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run a single refresh cycle and exit')
+        parser.add_argument('--lead-time', type=int, help='Seconds before expiry to refresh a city')
+        parser.add_argument('--rate-limit', type=int, help='Upstream calls per minute')
+
+    def handle(self, *args, **options):
+        scheduler = RefreshScheduler(
+            lead_time=options['lead_time'],
+            rate_limit=options['rate_limit'],
+        )
+        if options['once']:
+            refreshed = scheduler.run_cycle()
+            self.stdout.write(self.style.SUCCESS(f"Refreshed {refreshed} cities"))
+            return
+
+        try:
+            scheduler.run_forever()
+        except KeyboardInterrupt:
+            self.stdout.write("Refresh scheduler stopped")
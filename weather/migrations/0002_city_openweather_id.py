@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='city',
+            name='openweather_id',
+            field=models.IntegerField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0002_city_openweather_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodingResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('country_code', models.CharField(max_length=2)),
+                ('resolved_name', models.CharField(blank=True, max_length=100)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'unique_together': {('name', 'country_code')},
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0003_geocodingresult'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ForecastSeries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timezone_offset', models.IntegerField(default=0)),
+                ('points', models.JSONField()),
+                ('cached_at', models.DateTimeField(auto_now=True)),
+                ('city', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='forecast_series', to='weather.city')),
+            ],
+            options={
+                'verbose_name_plural': 'Forecast series',
+            },
+        ),
+    ]
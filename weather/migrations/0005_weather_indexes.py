@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:39
+
+from django.db import migrations, models
+
+
+def delete_duplicate_weather_rows(apps, schema_editor):
+    """Keep only the newest WeatherData row of each city before adding the unique constraint"""
+    WeatherData = apps.get_model('weather', 'WeatherData')
+    seen = set()
+    duplicates = []
+    for weather_id, city_id in WeatherData.objects.order_by('city_id', '-cached_at', '-id').values_list('id', 'city_id'):
+        if city_id in seen:
+            duplicates.append(weather_id)
+        else:
+            seen.add(city_id)
+    WeatherData.objects.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0004_forecastseries'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='forecastdata',
+            index=models.Index(fields=['city', 'cached_at'], name='forecast_city_cached_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='forecastdata',
+            index=models.Index(fields=['forecast_date', 'id'], name='forecast_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='forecastdata',
+            index=models.Index(fields=['weather_main'], name='forecast_main_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='weatherdata',
+            index=models.Index(fields=['city', '-cached_at'], name='weather_city_cached_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='weatherdata',
+            index=models.Index(fields=['-cached_at', '-id'], name='weather_cached_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='weatherdata',
+            index=models.Index(fields=['weather_main'], name='weather_main_idx'),
+        ),
+        migrations.RunPython(delete_duplicate_weather_rows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='weatherdata',
+            constraint=models.UniqueConstraint(fields=('city',), name='unique_current_weather_per_city'),
+        ),
+    ]
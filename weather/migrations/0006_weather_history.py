@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0005_weather_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeatherObservationChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('points', models.JSONField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('city', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='observation_chunks', to='weather.city')),
+            ],
+            options={
+                'ordering': ['day'],
+                'indexes': [models.Index(fields=['day'], name='observation_chunk_day_idx')],
+                'unique_together': {('city', 'day')},
+            },
+        ),
+        migrations.CreateModel(
+            name='WeatherRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('H', 'Hourly'), ('D', 'Daily')], max_length=1)),
+                ('bucket_start', models.DateTimeField()),
+                ('samples', models.IntegerField()),
+                ('temperature_avg', models.FloatField()),
+                ('temperature_min', models.FloatField()),
+                ('temperature_max', models.FloatField()),
+                ('feels_like_avg', models.FloatField()),
+                ('humidity_avg', models.FloatField()),
+                ('pressure_avg', models.FloatField()),
+                ('wind_speed_avg', models.FloatField()),
+                ('wind_speed_max', models.FloatField()),
+                ('city', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='weather_rollups', to='weather.city')),
+            ],
+            options={
+                'ordering': ['bucket_start'],
+                'indexes': [models.Index(fields=['resolution', 'bucket_start'], name='rollup_resolution_start_idx')],
+                'unique_together': {('city', 'resolution', 'bucket_start')},
+            },
+        ),
+    ]
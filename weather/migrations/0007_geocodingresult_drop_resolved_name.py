@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:34
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0006_weather_history'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='geocodingresult',
+            name='resolved_name',
+        ),
+    ]
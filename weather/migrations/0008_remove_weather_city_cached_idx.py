@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:39
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0007_geocodingresult_drop_resolved_name'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='weatherdata',
+            name='weather_city_cached_idx',
+        ),
+    ]
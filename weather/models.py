@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 from django.utils import timezone
 from datetime import timedelta
@@ -7,6 +8,7 @@ class City(models.Model):
     country_code = models.CharField(max_length=2)
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
+    openweather_id = models.IntegerField(null=True, blank=True, db_index=True)  # upstream city ID
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -16,6 +18,24 @@ class City(models.Model):
     def __str__(self):
         return f"{self.name}, {self.country_code}"
 
+class GeocodingResult(models.Model):
+    """Upstream geocoder answer for a city name, cached so it is looked up only once"""
+    name = models.CharField(max_length=100)  # normalized (stripped, lower-case) query name
+    country_code = models.CharField(max_length=2)
+    latitude = models.FloatField(null=True, blank=True)  # null when the geocoder found nothing
+    longitude = models.FloatField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)  # "not found" answers expire from here
+    
+    class Meta:
+        unique_together = ['name', 'country_code']
+    
+    def __str__(self):
+        return f"{self.name}, {self.country_code}"
+    
+    @property
+    def found(self):
+        return self.latitude is not None and self.longitude is not None
+
 class WeatherData(models.Model):
     city = models.ForeignKey(City, on_delete=models.CASCADE, related_name='weather_data')
     temperature = models.FloatField()
@@ -33,6 +53,16 @@ class WeatherData(models.Model):
     
     class Meta:
         ordering = ['-cached_at']
+        indexes = [
+            # Keyset pagination of /api/weather/ and the admin date filter
+            models.Index(fields=['-cached_at', '-id'], name='weather_cached_id_idx'),
+            models.Index(fields=['weather_main'], name='weather_main_idx'),
+        ]
+        constraints = [
+            # get_or_fetch_current_weather keeps exactly one current row per city;
+            # its index also serves the per-city lookups and the expiry scan
+            models.UniqueConstraint(fields=['city'], name='unique_current_weather_per_city'),
+        ]
     
     def __str__(self):
         return f"{self.city.name} - {self.temperature}°C"
@@ -40,6 +70,11 @@ class WeatherData(models.Model):
     def is_cache_valid(self):
         """Check if cached data is still valid (within 30 minutes)"""
         return timezone.now() - self.cached_at < timedelta(minutes=30)
+    
+    def is_within_grace_period(self):
+        """Check if expired data may still be served while it is refreshed"""
+        max_age = settings.WEATHER_CACHE_DURATION + settings.WEATHER_STALE_GRACE_PERIOD
+        return timezone.now() - self.cached_at < timedelta(seconds=max_age)
 
 class ForecastData(models.Model):
     city = models.ForeignKey(City, on_delete=models.CASCADE, related_name='forecast_data')
@@ -60,6 +95,13 @@ class ForecastData(models.Model):
     class Meta:
         unique_together = ['city', 'forecast_date']
         ordering = ['forecast_date']
+        indexes = [
+            # Oldest row per city for the scheduler's expiry scan
+            models.Index(fields=['city', 'cached_at'], name='forecast_city_cached_idx'),
+            # Keyset pagination of /api/forecast/ and the admin date filter
+            models.Index(fields=['forecast_date', 'id'], name='forecast_date_id_idx'),
+            models.Index(fields=['weather_main'], name='forecast_main_idx'),
+        ]
     
     def __str__(self):
         return f"{self.city.name} - {self.forecast_date.date()}"
@@ -67,6 +109,81 @@ class ForecastData(models.Model):
     def is_cache_valid(self):
         """Check if cached forecast data is still valid (within 30 minutes)"""
         return timezone.now() - self.cached_at < timedelta(minutes=30)
+    
+    def is_within_grace_period(self):
+        """Check if expired forecast data may still be served while it is refreshed"""
+        max_age = settings.WEATHER_CACHE_DURATION + settings.WEATHER_STALE_GRACE_PERIOD
+        return timezone.now() - self.cached_at < timedelta(seconds=max_age)
+
+class ForecastSeries(models.Model):
+    """Full 3-hourly upstream forecast for a city, packed column-wise into one row"""
+    city = models.OneToOneField(City, on_delete=models.CASCADE, related_name='forecast_series')
+    timezone_offset = models.IntegerField(default=0)  # seconds east of UTC
+    points = models.JSONField()  # {'dt': [...], 'temp': [...], ...}, see weather.forecast
+    cached_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = 'Forecast series'
+    
+    def __str__(self):
+        return f"{self.city.name} - {len(self.points.get('dt', []))} points"
+    
+    def is_cache_valid(self):
+        """Check if the cached series is still valid (within 30 minutes)"""
+        return timezone.now() - self.cached_at < timedelta(minutes=30)
+    
+    def is_within_grace_period(self):
+        """Check if an expired series may still be served while it is refreshed"""
+        max_age = settings.WEATHER_CACHE_DURATION + settings.WEATHER_STALE_GRACE_PERIOD
+        return timezone.now() - self.cached_at < timedelta(seconds=max_age)
+
+class WeatherObservationChunk(models.Model):
+    """One UTC day of observed weather for a city, packed column-wise into one row"""
+    city = models.ForeignKey(City, on_delete=models.CASCADE, related_name='observation_chunks')
+    day = models.DateField()  # UTC date of every observation in the chunk
+    points = models.JSONField()  # {'dt': [...], 'temp': [...], ...}, see weather.history
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['city', 'day']
+        ordering = ['day']
+        indexes = [
+            # Retention pruning deletes old days across all cities
+            models.Index(fields=['day'], name='observation_chunk_day_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.city.name} - {self.day} ({len(self.points.get('dt', []))} observations)"
+
+class WeatherRollup(models.Model):
+    """Hourly or daily (UTC) summary of a city's observations"""
+    HOURLY = 'H'
+    DAILY = 'D'
+    RESOLUTION_CHOICES = [(HOURLY, 'Hourly'), (DAILY, 'Daily')]
+    
+    city = models.ForeignKey(City, on_delete=models.CASCADE, related_name='weather_rollups')
+    resolution = models.CharField(max_length=1, choices=RESOLUTION_CHOICES)
+    bucket_start = models.DateTimeField()
+    samples = models.IntegerField()
+    temperature_avg = models.FloatField()
+    temperature_min = models.FloatField()
+    temperature_max = models.FloatField()
+    feels_like_avg = models.FloatField()
+    humidity_avg = models.FloatField()
+    pressure_avg = models.FloatField()
+    wind_speed_avg = models.FloatField()
+    wind_speed_max = models.FloatField()
+    
+    class Meta:
+        unique_together = ['city', 'resolution', 'bucket_start']
+        ordering = ['bucket_start']
+        indexes = [
+            # Retention pruning deletes old buckets of one resolution across all cities
+            models.Index(fields=['resolution', 'bucket_start'], name='rollup_resolution_start_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.city.name} - {self.get_resolution_display()} {self.bucket_start}"
 
 class UserPreference(models.Model):
     session_key = models.CharField(max_length=40, unique=True)
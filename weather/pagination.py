@@ -0,0 +1,103 @@
+import json
+import base64
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+class KeysetPagination(BasePagination):
+    """Forward-only cursor pagination over a (timestamp, id) key.
+
+    The cursor encodes the key of the last row on the page, and the next page
+    is a range scan starting right after it. The cost of a page does not grow
+    with its position in the table, unlike offset pagination.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering_field, descending):
+        self.ordering_field = ordering_field
+        self.descending = descending
+        self.page_size = settings.WEATHER_LIST_PAGE_SIZE
+        self.max_page_size = settings.WEATHER_LIST_MAX_PAGE_SIZE
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        """Return the (timestamp, id) key encoded in the request cursor, or None"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            value = parse_datetime(position['v'])
+            pk = int(position['id'])
+        except (TypeError, ValueError, KeyError):
+            value = None
+        if value is None:
+            raise ValidationError({self.cursor_query_param: [self.invalid_cursor_message]})
+        return value, pk
+
+    def encode_cursor(self, value, pk):
+        position = json.dumps({'v': value.isoformat(), 'id': pk})
+        return base64.urlsafe_b64encode(position.encode()).decode()
+
+    def _get_page_queryset(self, queryset, request):
+        """Order queryset by the key and start it right after the cursor"""
+        self.request = request
+        prefix = '-' if self.descending else ''
+        queryset = queryset.order_by(f'{prefix}{self.ordering_field}', f'{prefix}id')
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            value, pk = position
+            lookup = 'lt' if self.descending else 'gt'
+            # The redundant inclusive bound lets the planner seek into the
+            # (field, id) index; the OR alone is evaluated as a filtered scan.
+            queryset = queryset.filter(
+                Q(**{f'{self.ordering_field}__{lookup}e': value}),
+                Q(**{f'{self.ordering_field}__{lookup}': value}) |
+                Q(**{self.ordering_field: value, f'id__{lookup}': pk})
+            )
+        return queryset
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Return the model instances on the requested page"""
+        page_size = self.get_page_size(request)
+        # One extra row tells whether another page follows
+        rows = list(self._get_page_queryset(queryset, request)[:page_size + 1])
+        self.next_position = None
+        if len(rows) > page_size:
+            last = rows[page_size - 1]
+            self.next_position = (getattr(last, self.ordering_field), last.pk)
+        return rows[:page_size]
+
+    def paginate_values(self, queryset, request, columns):
+        """Return value tuples of columns for the rows on the requested page, in a single query"""
+        page_size = self.get_page_size(request)
+        # The key is fetched after the requested columns and cut off again
+        rows = list(
+            self._get_page_queryset(queryset, request).values_list(*columns, self.ordering_field, 'id')[:page_size + 1]
+        )
+        self.next_position = rows[page_size - 1][-2:] if len(rows) > page_size else None
+        return [row[:-2] for row in rows[:page_size]]
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(*self.next_position))
+
+    def get_paginated_response(self, data):
+        if isinstance(data, dict):
+            return Response({'next': self.get_next_link(), **data})
+        return Response({'next': self.get_next_link(), 'results': data})
@@ -0,0 +1,59 @@
+from abc import ABC, abstractmethod
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+# One provider instance per class path and process; providers keep no
+# per-request state, and replay providers keep their random stream going
+_providers = {}
+
+class WeatherProvider(ABC):
+    """Upstream weather source used by WeatherCacheService and GeocodingService.
+
+    Methods return payloads in the OpenWeatherMap 2.5 format (the only format
+    the store methods understand) and raise WeatherAPIException on failure,
+    with messages classified the same way as OpenWeatherMapService's.
+    """
+    # Maximum number of IDs accepted by get_current_weather_group
+    group_size = 20
+
+    @abstractmethod
+    def get_current_weather(self, city_name, country_code, latitude=None, longitude=None):
+        """Return the current weather payload for a city"""
+
+    @abstractmethod
+    def get_current_weather_group(self, openweather_ids):
+        """Return {'list': [...]} with current weather for up to group_size upstream IDs"""
+
+    @abstractmethod
+    def get_forecast(self, city_name, country_code, latitude=None, longitude=None):
+        """Return the 5-day 3-hourly forecast payload for a city"""
+
+    @abstractmethod
+    def geocode(self, city_name, country_code):
+        """Return a list of matching locations with 'name', 'lat' and 'lon'"""
+
+    def pool_stats(self):
+        """Connection counters for monitoring, if the provider has any"""
+        return {}
+
+@receiver(setting_changed)
+def _reset_providers(setting, **kwargs):
+    """Build new providers after override_settings changes their configuration"""
+    if setting in ('WEATHER_PROVIDER', 'WEATHER_ASYNC_PROVIDER', 'WEATHER_REPLAY'):
+        _providers.clear()
+
+def _get_provider(path):
+    provider = _providers.get(path)
+    if provider is None:
+        provider = _providers[path] = import_string(path)()
+    return provider
+
+def get_provider():
+    """Return the WEATHER_PROVIDER instance of this process"""
+    return _get_provider(settings.WEATHER_PROVIDER)
+
+def get_async_provider():
+    """Return the WEATHER_ASYNC_PROVIDER instance (coroutine methods) of this process"""
+    return _get_provider(settings.WEATHER_ASYNC_PROVIDER)
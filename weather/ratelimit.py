@@ -0,0 +1,192 @@
+import time
+import uuid
+import random
+import asyncio
+import logging
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone as dt_timezone
+from email.utils import parsedate_to_datetime
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger('weather_api')
+
+FOREGROUND = 'foreground'
+BACKGROUND = 'background'
+
+# Priority of the upstream calls made by the current thread or task
+_priority = contextvars.ContextVar('upstream_priority', default=FOREGROUND)
+
+@contextmanager
+def background_priority():
+    """Mark upstream calls made inside the block as background refreshes"""
+    token = _priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def backoff_delay(attempt):
+    """Exponential backoff with full jitter for the given retry attempt (0-based)"""
+    ceiling = min(settings.OPENWEATHER_RETRY_MAX_DELAY, settings.OPENWEATHER_RETRY_BASE_DELAY * 2 ** attempt)
+    return random.uniform(0, ceiling)
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=dt_timezone.utc)
+    return max((retry_at - datetime.now(dt_timezone.utc)).total_seconds(), 0)
+
+class UpstreamRateLimiter:
+    """Token bucket for OpenWeatherMap calls, shared by every worker through the cache.
+
+    The bucket refills at OPENWEATHER_RATE_LIMIT calls per minute up to
+    OPENWEATHER_RATE_BURST tokens. Background refreshes may not take the last
+    OPENWEATHER_BACKGROUND_RESERVE share of the bucket, which is kept for user
+    requests. A 429 or 503 response pauses all workers for its Retry-After.
+    Callers that cannot get a token in time fail fast with a rate limit error,
+    which the cache service answers with stale data where it has any.
+    """
+    state_key = "ratelimit_bucket"
+    lock_key = "ratelimit_lock"
+    cooldown_key = "ratelimit_cooldown"
+    lock_timeout = 2
+    lock_attempts = 50
+
+    @property
+    def capacity(self):
+        return settings.OPENWEATHER_RATE_BURST
+
+    @property
+    def refill_rate(self):
+        """Tokens added per second"""
+        return settings.OPENWEATHER_RATE_LIMIT / 60.0
+
+    def get_reserve(self, priority):
+        """Tokens a caller of this priority must leave in the bucket"""
+        if priority == BACKGROUND:
+            return self.capacity * settings.OPENWEATHER_BACKGROUND_RESERVE
+        return 0
+
+    def _refill(self, state, now):
+        if state is None:
+            return float(self.capacity)
+        return min(self.capacity, state['tokens'] + (now - state['updated']) * self.refill_rate)
+
+    def _take(self, priority):
+        """Try to take a token; return 0 when granted, else the seconds until one may be free"""
+        now = time.time()
+        cooldown_until = cache.get(self.cooldown_key)
+        if cooldown_until and cooldown_until > now:
+            return cooldown_until - now
+
+        token = uuid.uuid4().hex
+        for attempt in range(self.lock_attempts):
+            if cache.add(self.lock_key, token, self.lock_timeout):
+                break
+            time.sleep(0.01)
+        else:
+            return 0.05
+
+        try:
+            tokens = self._refill(cache.get(self.state_key), now)
+            reserve = self.get_reserve(priority)
+            granted = tokens - 1 >= reserve
+            if granted:
+                tokens -= 1
+            cache.set(self.state_key, {'tokens': tokens, 'updated': now}, None)
+        finally:
+            # Only release our own lock, not one taken after ours timed out
+            if cache.get(self.lock_key) == token:
+                cache.delete(self.lock_key)
+        return 0 if granted else (reserve + 1 - tokens) / self.refill_rate
+
+    def try_take(self, priority):
+        """Take a token without waiting; fails open if the shared cache is unavailable"""
+        try:
+            return self._take(priority)
+        except Exception as e:
+            logger.error(f"Rate limiter unavailable, allowing upstream call: {e}")
+            return 0
+
+    def get_max_wait(self, priority):
+        if priority == BACKGROUND:
+            return settings.OPENWEATHER_BACKGROUND_MAX_WAIT
+        return settings.OPENWEATHER_FOREGROUND_MAX_WAIT
+
+    def try_acquire(self, priority=None):
+        """Take a token if one is free right now"""
+        return self.try_take(priority or _priority.get()) == 0
+
+    def acquire(self, priority=None):
+        """Take a token, waiting up to the priority's max wait; False if none became free"""
+        priority = priority or _priority.get()
+        deadline = time.monotonic() + self.get_max_wait(priority)
+        while True:
+            wait = self.try_take(priority)
+            if wait == 0:
+                return True
+            if time.monotonic() + wait > deadline:
+                logger.warning(f"Upstream quota exhausted for {priority} request, needed {wait:.1f}s")
+                return False
+            time.sleep(wait)
+
+    async def aacquire(self, priority=None):
+        """Coroutine version of acquire()"""
+        priority = priority or _priority.get()
+        deadline = time.monotonic() + self.get_max_wait(priority)
+        while True:
+            wait = await sync_to_async(self.try_take, thread_sensitive=False)(priority)
+            if wait == 0:
+                return True
+            if time.monotonic() + wait > deadline:
+                logger.warning(f"Upstream quota exhausted for {priority} request, needed {wait:.1f}s")
+                return False
+            await asyncio.sleep(wait)
+
+    async def atry_acquire(self, priority=None):
+        """Coroutine version of try_acquire()"""
+        priority = priority or _priority.get()
+        return await sync_to_async(self.try_take, thread_sensitive=False)(priority) == 0
+
+    def pause(self, retry_after=None):
+        """Stop all workers from calling upstream for retry_after seconds"""
+        if retry_after is None:
+            retry_after = settings.OPENWEATHER_DEFAULT_COOLDOWN
+        if retry_after <= 0:
+            return
+        try:
+            cache.set(self.cooldown_key, time.time() + retry_after, int(retry_after) + 1)
+        except Exception as e:
+            logger.error(f"Failed to record upstream cooldown: {e}")
+        logger.warning(f"Upstream asked us to back off, pausing calls for {retry_after:.0f}s")
+
+    def status(self):
+        """Remaining quota and cooldown for monitoring"""
+        now = time.time()
+        try:
+            tokens = self._refill(cache.get(self.state_key), now)
+            cooldown_until = cache.get(self.cooldown_key) or 0
+        except Exception as e:
+            return {'error': str(e)}
+        return {
+            'tokens': round(tokens, 2),
+            'capacity': self.capacity,
+            'rate_per_minute': settings.OPENWEATHER_RATE_LIMIT,
+            'background_reserve': self.get_reserve(BACKGROUND),
+            'cooldown_remaining': round(max(cooldown_until - now, 0), 1),
+        }
+
+rate_limiter = UpstreamRateLimiter()
@@ -0,0 +1,74 @@
+import os
+import time
+import logging
+import threading
+from collections import Counter
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger('weather_api')
+
+class ReadCounter:
+    """Recent reads per city, used by the refresh scheduler to prioritise popular cities.
+
+    Reads are counted in process memory and added to the shared counters at
+    most every WEATHER_READ_FLUSH_INTERVAL seconds, with one add+incr per city
+    read since the last flush, so the hot read path does not write to the
+    shared cache. Counts not flushed when a worker exits are lost, which only
+    makes the priorities slightly less precise.
+    """
+    prefix = "weather_reads"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._next_flush = 0
+        self.pid = os.getpid()
+
+    def get_key(self, city_id):
+        """Generate cache key for the shared read counter of a city"""
+        return f"{self.prefix}_{city_id}"
+
+    def _count(self, city_ids):
+        """Count reads in memory; return whether a flush is due"""
+        now = time.monotonic()
+        with self._lock:
+            if self.pid != os.getpid():
+                # Forked worker: the counts belong to the parent
+                self._counts.clear()
+                self.pid = os.getpid()
+            self._counts.update(city_ids)
+            if now < self._next_flush:
+                return False
+            self._next_flush = now + settings.WEATHER_READ_FLUSH_INTERVAL
+            return True
+
+    def record(self, *city_ids):
+        """Count a read of each city"""
+        if self._count(city_ids):
+            self.flush()
+
+    async def arecord(self, *city_ids):
+        """Coroutine version of record(); only a flush leaves the event loop"""
+        if self._count(city_ids):
+            await sync_to_async(self.flush, thread_sensitive=False)()
+
+    def flush(self):
+        """Add the reads counted since the last flush to the shared counters"""
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        window = settings.WEATHER_READ_TRAFFIC_WINDOW
+        try:
+            for city_id, reads in counts.items():
+                read_key = self.get_key(city_id)
+                cache.add(read_key, 0, window)
+                try:
+                    cache.incr(read_key, reads)
+                except ValueError:
+                    # The counter expired between add() and incr()
+                    cache.add(read_key, reads, window)
+        except Exception as e:
+            logger.error(f"Failed to flush read counts for {len(counts)} cities: {e}")
+
+read_counter = ReadCounter()
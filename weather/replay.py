@@ -0,0 +1,202 @@
+import json
+import time
+import zlib
+import random
+import asyncio
+import logging
+import threading
+from django.conf import settings
+from .providers import WeatherProvider
+from .services import WeatherAPIException
+
+logger = logging.getLogger('weather_api')
+
+# Errors raised by injected failures, as OpenWeatherMapService reports them
+INJECTED_ERRORS = [
+    "Request timeout after multiple retries",
+    "Unable to connect to weather service",
+    "API error: 503",
+]
+
+CONDITIONS = [
+    ('Clear', 'clear sky', '01'),
+    ('Clouds', 'few clouds', '02'),
+    ('Clouds', 'broken clouds', '04'),
+    ('Rain', 'light rain', '10'),
+    ('Thunderstorm', 'thunderstorm', '11'),
+    ('Snow', 'light snow', '13'),
+    ('Mist', 'mist', '50'),
+]
+
+FORECAST_STEPS = 40
+FORECAST_STEP_SECONDS = 3 * 60 * 60
+
+_recordings = {}
+
+def load_recordings(path):
+    """Load (once per process) a JSON file mapping "<endpoint>:<query>" to upstream payloads"""
+    if not path:
+        return {}
+    if path not in _recordings:
+        with open(path) as f:
+            _recordings[path] = json.load(f)
+        logger.info(f"Loaded {len(_recordings[path])} recorded upstream responses from {path}")
+    return _recordings[path]
+
+def get_synthetic_id(city_name, country_code):
+    """Stable fake upstream ID for a city name"""
+    return zlib.crc32(f"{city_name.strip().lower()},{country_code.upper()}".encode()) % 10_000_000 + 1
+
+class ReplayWeatherProvider(WeatherProvider):
+    """Offline stand-in for OpenWeatherMapService for load tests and local development.
+
+    Responses are looked up in the WEATHER_REPLAY['RECORDINGS'] file under keys
+    such as "weather:London,GB", "forecast:London,GB", "geocode:London,GB" or
+    "group:2643743" (a null value means "City not found"). Anything not
+    recorded is synthesized from SEED and the city, so a city always gets the
+    same weather. Every call sleeps LATENCY seconds plus up to JITTER, and fails
+    with probability ERROR_RATE; the failure sequence is reproducible for a
+    given SEED. Calls do not go through the rate limiter or circuit breaker.
+    """
+    def __init__(self, recordings=None, latency=None, jitter=None, error_rate=None, seed=None):
+        options = settings.WEATHER_REPLAY
+        self.recordings = load_recordings(options['RECORDINGS'] if recordings is None else recordings)
+        self.latency = options['LATENCY'] if latency is None else latency
+        self.jitter = options['JITTER'] if jitter is None else jitter
+        self.error_rate = options['ERROR_RATE'] if error_rate is None else error_rate
+        self.seed = options['SEED'] if seed is None else seed
+        self.random = random.Random(self.seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def pool_stats(self):
+        """Number of calls served, in place of connection counters"""
+        return {'provider': 'replay', 'requests': self.calls}
+
+    def _get_delay_and_error(self):
+        """Draw this call's latency and injected error from the seeded stream"""
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + self.random.uniform(0, self.jitter) if self.jitter else self.latency
+            error = None
+            if self.error_rate and self.random.random() < self.error_rate:
+                error = self.random.choice(INJECTED_ERRORS)
+        return delay, error
+
+    def _respond(self, endpoint, query, synthesize, error):
+        if error:
+            logger.error(f"Injected upstream error for {endpoint}:{query}: {error}")
+            raise WeatherAPIException(error)
+        key = f"{endpoint}:{query}"
+        if key in self.recordings:
+            if self.recordings[key] is None:
+                raise WeatherAPIException("City not found")
+            return self.recordings[key]
+        return synthesize()
+
+    def _make_request(self, endpoint, query, synthesize):
+        delay, error = self._get_delay_and_error()
+        if delay:
+            time.sleep(delay)
+        return self._respond(endpoint, query, synthesize, error)
+
+    def _get_random(self, openweather_id):
+        return random.Random(f"{self.seed}:{openweather_id}")
+
+    def synthesize_current(self, openweather_id, city_name='', country_code=''):
+        """Deterministic current weather payload for an upstream ID"""
+        rng = self._get_random(openweather_id)
+        latitude = round(rng.uniform(-60, 70), 4)
+        longitude = round(rng.uniform(-180, 180), 4)
+        temperature = round(rng.uniform(-10, 35), 2)
+        main, description, icon = rng.choice(CONDITIONS)
+        return {
+            'id': openweather_id,
+            'name': city_name,
+            'coord': {'lat': latitude, 'lon': longitude},
+            'main': {
+                'temp': temperature,
+                'feels_like': round(temperature - rng.uniform(0, 3), 2),
+                'temp_min': round(temperature - rng.uniform(0, 2), 2),
+                'temp_max': round(temperature + rng.uniform(0, 2), 2),
+                'humidity': rng.randint(20, 100),
+                'pressure': rng.randint(980, 1040),
+            },
+            'weather': [{'main': main, 'description': description, 'icon': f"{icon}d"}],
+            'wind': {'speed': round(rng.uniform(0, 15), 2), 'deg': rng.randint(0, 359)},
+            'visibility': 10000,
+            'sys': {'country': country_code},
+            'dt': int(time.time()),
+        }
+
+    def synthesize_forecast(self, openweather_id, city_name, country_code):
+        """Deterministic forecast payload for an upstream ID, starting at the next 3-hour slot"""
+        current = self.synthesize_current(openweather_id, city_name, country_code)
+        rng = self._get_random(f"forecast:{openweather_id}")
+        start = (int(time.time()) // FORECAST_STEP_SECONDS + 1) * FORECAST_STEP_SECONDS
+        items = []
+        for step in range(FORECAST_STEPS):
+            temperature = round(current['main']['temp'] + rng.uniform(-6, 6), 2)
+            main, description, icon = rng.choice(CONDITIONS)
+            pod = 'd' if 6 <= (step * 3 + start // 3600) % 24 < 18 else 'n'
+            items.append({
+                'dt': start + step * FORECAST_STEP_SECONDS,
+                'main': {
+                    'temp': temperature,
+                    'feels_like': round(temperature - rng.uniform(0, 3), 2),
+                    'temp_min': round(temperature - rng.uniform(0, 1), 2),
+                    'temp_max': round(temperature + rng.uniform(0, 1), 2),
+                    'humidity': rng.randint(20, 100),
+                    'pressure': rng.randint(980, 1040),
+                },
+                'weather': [{'main': main, 'description': description, 'icon': f"{icon}{pod}"}],
+                'wind': {'speed': round(rng.uniform(0, 15), 2), 'deg': rng.randint(0, 359)},
+                'pop': round(rng.random(), 2),
+                'sys': {'pod': pod},
+            })
+        return {
+            'list': items,
+            'city': {
+                'id': openweather_id, 'name': city_name, 'country': country_code,
+                'coord': current['coord'], 'timezone': 0,
+            },
+        }
+
+    def get_current_weather(self, city_name, country_code, latitude=None, longitude=None):
+        """Return recorded or synthetic current weather"""
+        openweather_id = get_synthetic_id(city_name, country_code)
+        return self._make_request(
+            'weather', f"{city_name},{country_code}",
+            lambda: self.synthesize_current(openweather_id, city_name, country_code)
+        )
+
+    def get_current_weather_group(self, openweather_ids):
+        """Return recorded or synthetic current weather for several upstream IDs"""
+        return self._make_request(
+            'group', ','.join(str(openweather_id) for openweather_id in openweather_ids),
+            lambda: {'list': [self.synthesize_current(openweather_id) for openweather_id in openweather_ids]}
+        )
+
+    def get_forecast(self, city_name, country_code, latitude=None, longitude=None):
+        """Return a recorded or synthetic 5-day forecast"""
+        openweather_id = get_synthetic_id(city_name, country_code)
+        return self._make_request(
+            'forecast', f"{city_name},{country_code}",
+            lambda: self.synthesize_forecast(openweather_id, city_name, country_code)
+        )
+
+    def geocode(self, city_name, country_code):
+        """Return a recorded or synthetic geocoding match"""
+        def synthesize():
+            coord = self.synthesize_current(get_synthetic_id(city_name, country_code))['coord']
+            return [{'name': city_name, 'country': country_code, 'lat': coord['lat'], 'lon': coord['lon']}]
+        return self._make_request('geocode', f"{city_name},{country_code}", synthesize)
+
+class AsyncReplayWeatherProvider(ReplayWeatherProvider):
+    """ReplayWeatherProvider for async views: calls return awaitables and sleep without blocking"""
+
+    async def _make_request(self, endpoint, query, synthesize):
+        delay, error = self._get_delay_and_error()
+        if delay:
+            await asyncio.sleep(delay)
+        return self._respond(endpoint, query, synthesize, error)
@@ -0,0 +1,6 @@
+from django.urls import path
+from .consumers import WeatherUpdatesConsumer
+
+websocket_urlpatterns = [
+    path('ws/weather/', WeatherUpdatesConsumer.as_asgi()),
+]
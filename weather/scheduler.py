@@ -0,0 +1,153 @@
+import time
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.utils import timezone
+from .models import City, WeatherData, ForecastData
+from .services import WeatherCacheService, WeatherAPIException
+from .ratelimit import background_priority
+
+logger = logging.getLogger('weather_api')
+
+class RefreshScheduler:
+    """Proactively refresh weather for tracked cities before their cache expires.
+
+    Each cycle selects the cities whose current weather or forecast will expire
+    within the lead time, orders them by recent reads and favourites, and
+    refreshes only what is due for each city: current weather through the
+    group endpoint, forecasts one call per city. Calls are paced to stay inside
+    the upstream rate budget while spreading the forecasts evenly over the
+    lead time.
+    """
+    # Each city costs one forecast call; current weather is fetched 20 cities per call
+    calls_per_city = 1
+
+    def __init__(self, lead_time=None, rate_limit=None):
+        self.lead_time = lead_time or settings.WEATHER_REFRESH_LEAD_TIME
+        self.rate_limit = rate_limit or settings.WEATHER_REFRESH_RATE_LIMIT
+        self.weather_service = WeatherCacheService()
+        self.next_prune = 0
+
+    def get_due_cities(self):
+        """Return cities that expire within the lead time, most popular first.
+
+        Each city has weather_due and forecast_due set for the data that expires.
+        """
+        threshold = timezone.now() - timedelta(
+            seconds=max(settings.WEATHER_CACHE_DURATION - self.lead_time, 0)
+        )
+        latest_weather = WeatherData.objects.filter(
+            city=OuterRef('pk')
+        ).order_by('-cached_at').values('cached_at')[:1]
+        oldest_forecast = ForecastData.objects.filter(
+            city=OuterRef('pk')
+        ).order_by('cached_at').values('cached_at')[:1]
+
+        cities = list(
+            City.objects.annotate(
+                weather_cached_at=Subquery(latest_weather),
+                forecast_cached_at=Subquery(oldest_forecast),
+                favorites_count=Count('userpreference', distinct=True),
+            ).filter(
+                Q(weather_cached_at__isnull=True) | Q(weather_cached_at__lte=threshold) |
+                Q(forecast_cached_at__isnull=True) | Q(forecast_cached_at__lte=threshold)
+            )
+        )
+
+        read_keys = {city.id: self.weather_service.get_read_cache_key(city.id) for city in cities}
+        reads = cache.get_many(list(read_keys.values()))
+        for city in cities:
+            city.recent_reads = reads.get(read_keys[city.id], 0)
+            city.weather_due = city.weather_cached_at is None or city.weather_cached_at <= threshold
+            city.forecast_due = city.forecast_cached_at is None or city.forecast_cached_at <= threshold
+
+        cities.sort(key=lambda c: (c.recent_reads, c.favorites_count), reverse=True)
+        return cities
+
+    def get_interval(self, due_count):
+        """Seconds between city refreshes for a batch of due_count cities"""
+        budget_interval = 60.0 * self.calls_per_city / self.rate_limit
+        spread_interval = self.lead_time / max(due_count, 1)
+        # Spread the batch over the lead time, but never exceed the rate budget
+        return max(budget_interval, spread_interval)
+
+    def refresh_current_weather(self, cities):
+        """Refresh current weather for cities through the group endpoint; return the failed city ids"""
+        group_size = self.weather_service.openweather_service.group_size
+        budget_interval = 60.0 / self.rate_limit
+        grouped = [city for city in cities if city.openweather_id]
+        # Every batch is one upstream call: a group of cities with an upstream ID,
+        # or a single city without one
+        batches = [grouped[start:start + group_size] for start in range(0, len(grouped), group_size)]
+        batches.extend([city] for city in cities if not city.openweather_id)
+        failed = set()
+        for batch in batches:
+            started = time.monotonic()
+            try:
+                refreshed, errors = self.weather_service.refresh_current_weather_bulk(batch)
+                failed.update(errors)
+            except Exception as e:
+                logger.error(f"Unexpected error in scheduled bulk refresh: {e}")
+                failed.update(city.id for city in batch)
+            time.sleep(max(budget_interval - (time.monotonic() - started), 0))
+        return failed
+
+    def refresh_city(self, city):
+        """Refresh the forecast for a single city"""
+        try:
+            self.weather_service.refresh_forecast(city)
+            logger.info(f"Pre-warmed weather for {city.name}")
+            return True
+        except WeatherAPIException as e:
+            logger.error(f"Scheduled refresh failed for {city.name}: {e}")
+        except Exception as e:
+            logger.error(f"Unexpected error in scheduled refresh for {city.name}: {e}")
+        return False
+
+    def prune_history(self):
+        """Apply the history retention periods, at most once per prune interval"""
+        if time.monotonic() < self.next_prune:
+            return
+        self.next_prune = time.monotonic() + settings.WEATHER_HISTORY_PRUNE_INTERVAL
+        try:
+            self.weather_service.history.prune()
+        except Exception as e:
+            logger.error(f"Failed to prune weather history: {e}")
+
+    def run_cycle(self):
+        """Refresh every city that is currently due and return the number refreshed"""
+        with background_priority():
+            return self._run_cycle()
+
+    def _run_cycle(self):
+        self.prune_history()
+        cities = self.get_due_cities()
+        if not cities:
+            return 0
+
+        weather_due = [city for city in cities if city.weather_due]
+        forecast_due = [city for city in cities if city.forecast_due]
+        failed = self.refresh_current_weather(weather_due)
+
+        interval = self.get_interval(len(forecast_due))
+        if forecast_due:
+            logger.info(f"Refreshing forecasts for {len(forecast_due)} cities, one every {interval:.1f}s")
+        for index, city in enumerate(forecast_due):
+            started = time.monotonic()
+            if not self.refresh_city(city):
+                failed.add(city.id)
+            if index < len(forecast_due) - 1:
+                time.sleep(max(interval - (time.monotonic() - started), 0))
+        return sum(1 for city in cities if city.id not in failed)
+
+    def run_forever(self):
+        """Run refresh cycles until interrupted"""
+        logger.info(
+            f"Starting weather refresh scheduler (lead time {self.lead_time}s, "
+            f"{self.rate_limit} calls/min)"
+        )
+        while True:
+            if not self.run_cycle():
+                time.sleep(settings.WEATHER_REFRESH_POLL_INTERVAL)
@@ -1,3 +1,4 @@
+from django.db import models
 from rest_framework import serializers
 from .models import City, WeatherData, ForecastData, UserPreference
 
@@ -44,3 +45,111 @@ class AddCitySerializer(serializers.Serializer):
     
     def validate_country_code(self, value):
         return value.upper()
+
+
+# Fast path for the list endpoints: rows are read with values_list() and turned
+# into the same JSON shape as the ModelSerializers above, without per-object
+# field introspection. Field lists and converters are computed once at import.
+
+def _format_datetime(value):
+    """Match DRF's DateTimeField output (ISO 8601, 'Z' for UTC)"""
+    if value is None:
+        return None
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+def _format_float(value):
+    return None if value is None else float(value)
+
+def _get_converter(model, field_name):
+    """Pick the output conversion DRF would apply to a model field"""
+    field = model._meta.get_field(field_name)
+    if isinstance(field, models.DateTimeField):
+        return _format_datetime
+    if isinstance(field, models.FloatField):
+        return _format_float
+    return None
+
+class RowSerializer:
+    """Serialize a queryset of a model with a nested city from values_list() tuples"""
+    def __init__(self, model, fields):
+        self.fields = [field for field in fields if field != 'city']
+        # Output keys keep the ModelSerializer's order, with the city in its place
+        self.before_city = set(fields[:fields.index('city')])
+        self.converters = [_get_converter(model, field) for field in self.fields]
+        self.city_fields = CitySerializer.Meta.fields
+        self.city_converters = [_get_converter(City, field) for field in self.city_fields]
+        self.columns = self.fields + ['city_id'] + [f'city__{field}' for field in self.city_fields]
+    
+    def _convert(self, names, converters, values):
+        return {
+            name: converter(value) if converter else value
+            for name, converter, value in zip(names, converters, values)
+        }
+    
+    def get_projection(self, fields):
+        """Validate a ?fields= list, returning the unknown names"""
+        return [field for field in fields if field not in self.fields and field != 'city']
+    
+    def _get_selection(self, fields):
+        """Row field names and converters for a ?fields= list, and whether to include the city"""
+        names, converters = self.fields, self.converters
+        if fields is not None:
+            selected = [
+                (name, converter) for name, converter in zip(self.fields, self.converters)
+                if name == 'id' or name in fields
+            ]
+            names = [name for name, converter in selected]
+            converters = [converter for name, converter in selected]
+        return names, converters, fields is None or 'city' in fields
+    
+    def _get_city_position(self, names):
+        """Number of selected row fields that come before the city"""
+        return sum(1 for name in names if name in self.before_city)
+    
+    def get_columns(self, fields=None):
+        """Columns serialize_values() expects, in order, for a ?fields= list"""
+        names, converters, include_city = self._get_selection(fields)
+        return names + (self.columns[len(self.fields):] if include_city else [])
+    
+    def serialize(self, queryset, flat=False, fields=None):
+        """Return a list of row dicts, or with flat=True a dict that lists each city once.
+        
+        fields limits the output to a subset of the row fields; 'id' is always included.
+        """
+        return self.serialize_values(queryset.values_list(*self.get_columns(fields)), flat, fields)
+    
+    def serialize_values(self, value_rows, flat=False, fields=None):
+        """serialize() for tuples already fetched with the columns of get_columns(fields)"""
+        names, converters, include_city = self._get_selection(fields)
+        field_count = len(names)
+        split = self._get_city_position(names)
+        head_names, head_converters = names[:split], converters[:split]
+        tail_names, tail_converters = names[split:], converters[split:]
+        rows = []
+        cities = {}
+        for values in value_rows:
+            row = self._convert(head_names, head_converters, values[:split])
+            if include_city:
+                city_id = values[field_count]
+                if flat:
+                    row['city'] = city_id
+                    if city_id not in cities:
+                        cities[city_id] = self._convert(
+                            self.city_fields, self.city_converters, values[field_count + 1:]
+                        )
+                else:
+                    row['city'] = self._convert(
+                        self.city_fields, self.city_converters, values[field_count + 1:]
+                    )
+            row.update(self._convert(tail_names, tail_converters, values[split:field_count]))
+            rows.append(row)
+        
+        if flat:
+            return {'cities': list(cities.values()), 'results': rows}
+        return rows
+
+weather_row_serializer = RowSerializer(WeatherData, WeatherDataSerializer.Meta.fields)
+forecast_row_serializer = RowSerializer(ForecastData, ForecastDataSerializer.Meta.fields)
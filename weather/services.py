@@ -1,10 +1,26 @@
+import os
+import time
+import threading
 import requests
 import logging
+from datetime import timedelta
+from requests.adapters import HTTPAdapter
 from django.conf import settings
 from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
 from django.core.cache import cache
-from datetime import datetime, timedelta, timezone as dt_timezone
-from .models import City, WeatherData, ForecastData
+from django.db import connection, transaction
+from concurrent.futures import ThreadPoolExecutor
+from .models import GeocodingResult, WeatherData, ForecastData, ForecastSeries
+from .forecast import pack_forecast_series, aggregate_daily
+from .history import WeatherHistoryService
+from .live import publish, weather_delta, forecast_delta
+from .units import TEMPERATURE_UNITS
+from .coalescing import single_flight
+from .ratelimit import rate_limiter, backoff_delay, parse_retry_after, BACKGROUND
+from .circuitbreaker import circuit_breaker, CLOSED
+from .reads import read_counter
+from .providers import WeatherProvider, get_provider
 
 logger = logging.getLogger('weather_api')
 
@@ -12,47 +28,175 @@ class WeatherAPIException(Exception):
     """Custom exception for weather API errors"""
     pass
 
-class OpenWeatherMapService:
+class CircuitOpenError(WeatherAPIException):
+    """Raised without calling upstream while the circuit breaker is open"""
+    pass
+
+class PooledHTTPSession:
+    """Process-wide keep-alive HTTP session shared by all OpenWeatherMapService instances"""
+    _instance = None
+    _lock = threading.Lock()
+    
+    def __init__(self):
+        self.pid = os.getpid()
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Accept': 'application/json',
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive',
+        })
+        # pool_connections is the number of per-host pools kept alive,
+        # pool_maxsize caps the open connections to each host.
+        self.adapter = HTTPAdapter(
+            pool_connections=settings.OPENWEATHER_POOL_CONNECTIONS,
+            pool_maxsize=settings.OPENWEATHER_POOL_MAXSIZE,
+            pool_block=settings.OPENWEATHER_POOL_BLOCK,
+        )
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+    
+    @classmethod
+    def get(cls):
+        """Return the session for this process, creating it after a fork if needed"""
+        instance = cls._instance
+        if instance is None or instance.pid != os.getpid():
+            with cls._lock:
+                instance = cls._instance
+                if instance is None or instance.pid != os.getpid():
+                    # Never share sockets inherited from a pre-fork parent process
+                    instance = cls()
+                    cls._instance = instance
+                    logger.info(f"Created pooled HTTP session for process {instance.pid}")
+        return instance
+    
+    def request(self, url, params, timeout):
+        """Issue a GET over a pooled keep-alive connection"""
+        with self._stats_lock:
+            self._requests += 1
+        return self.session.get(url, params=params, timeout=timeout)
+    
+    def stats(self):
+        """Return connection pool hit/miss counters for this process"""
+        connections = 0
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                connections += pool.num_connections
+        with self._stats_lock:
+            total = self._requests
+        return {
+            'pid': self.pid,
+            'requests': total,
+            'pool_hits': max(total - connections, 0),
+            'pool_misses': connections,
+            'pool_maxsize': settings.OPENWEATHER_POOL_MAXSIZE,
+        }
+
+class OpenWeatherMapService(WeatherProvider):
+    """WeatherProvider backed by the live OpenWeatherMap API (the default WEATHER_PROVIDER)"""
+    # The group endpoint accepts at most 20 city IDs per call
+    group_size = 20
+    
     def __init__(self):
         self.api_key = settings.OPENWEATHER_API_KEY
         self.base_url = settings.OPENWEATHER_BASE_URL
         self.timeout = 10
         self.max_retries = 3
     
-    def _make_request(self, url, params, retry_count=0):
-        """Make HTTP request with retry logic and error handling"""
-        try:
-            response = requests.get(url, params=params, timeout=self.timeout)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.Timeout:
-            logger.error(f"Timeout error for URL: {url}")
-            if retry_count < self.max_retries:
-                logger.info(f"Retrying request (attempt {retry_count + 1}/{self.max_retries})")
-                return self._make_request(url, params, retry_count + 1)
-            raise WeatherAPIException("Request timeout after multiple retries")
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 404:
-                raise WeatherAPIException("City not found")
-            elif e.response.status_code == 401:
-                raise WeatherAPIException("Invalid API key")
-            elif e.response.status_code == 429:
-                raise WeatherAPIException("API rate limit exceeded")
-            else:
+    @property
+    def http(self):
+        """Pooled session of the current process; a new one after a fork"""
+        return PooledHTTPSession.get()
+    
+    def pool_stats(self):
+        """Expose connection reuse counters for monitoring"""
+        return self.http.stats()
+    
+    def _make_request(self, url, params):
+        """Make HTTP request with retry logic and error handling.
+        
+        Every attempt takes a token from the shared rate limiter. Timeouts,
+        connection errors and 5xx responses are retried with jittered
+        exponential backoff, but only while quota is left above the foreground
+        reserve; otherwise the error is raised so callers can serve stale data.
+        They also count towards the circuit breaker, which fails calls
+        immediately while upstream is down.
+        """
+        allowed = circuit_breaker.allow_request()
+        if not allowed:
+            raise CircuitOpenError("Weather service unavailable (circuit open)")
+        if not rate_limiter.acquire():
+            # Let another worker send the half-open probe
+            circuit_breaker.release_probe(allowed)
+            raise WeatherAPIException("API rate limit exceeded (local quota)")
+        
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.http.request(url, params, self.timeout)
+                if response.status_code < 500:
+                    circuit_breaker.record_success()
+                backoff_requested = response.status_code == 429 or (
+                    response.status_code == 503 and 'Retry-After' in response.headers
+                )
+                if backoff_requested:
+                    # Pause every worker instead of spending quota on retries
+                    rate_limiter.pause(parse_retry_after(response.headers.get('Retry-After')))
+                response.raise_for_status()
+                return response.json()
+            except requests.exceptions.Timeout:
+                logger.error(f"Timeout error for URL: {url}")
+                circuit_breaker.record_failure()
+                error = WeatherAPIException("Request timeout after multiple retries")
+            except requests.exceptions.HTTPError as e:
+                if e.response.status_code == 404:
+                    raise WeatherAPIException("City not found")
+                elif e.response.status_code == 401:
+                    raise WeatherAPIException("Invalid API key")
+                elif e.response.status_code == 429:
+                    raise WeatherAPIException("API rate limit exceeded")
                 logger.error(f"HTTP error {e.response.status_code}: {e}")
-                raise WeatherAPIException(f"API error: {e.response.status_code}")
-        except requests.exceptions.ConnectionError:
-            logger.error(f"Connection error for URL: {url}")
-            raise WeatherAPIException("Unable to connect to weather service")
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Request error: {e}")
-            raise WeatherAPIException("Weather service request failed")
-    
-    def get_current_weather(self, city_name, country_code):
+                error = WeatherAPIException(f"API error: {e.response.status_code}")
+                if e.response.status_code < 500:
+                    raise error
+                circuit_breaker.record_failure()
+                if backoff_requested:
+                    raise error
+            except requests.exceptions.ConnectionError:
+                logger.error(f"Connection error for URL: {url}")
+                circuit_breaker.record_failure()
+                error = WeatherAPIException("Unable to connect to weather service")
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Request error: {e}")
+                raise WeatherAPIException("Weather service request failed")
+            
+            if attempt == self.max_retries:
+                break
+            if circuit_breaker.get_current_state() != CLOSED:
+                logger.warning(f"Not retrying {url}: weather service circuit is open")
+                break
+            # Retries never wait for quota or dip into the foreground reserve
+            if not rate_limiter.try_acquire(BACKGROUND):
+                logger.warning(f"Not retrying {url}: upstream quota is low")
+                break
+            delay = backoff_delay(attempt)
+            logger.info(f"Retrying request in {delay:.2f}s (attempt {attempt + 1}/{self.max_retries})")
+            time.sleep(delay)
+        raise error
+    
+    def _get_location_params(self, city_name, country_code, latitude, longitude):
+        """Query by coordinates when known, otherwise by name (geocoded upstream)"""
+        if latitude is not None and longitude is not None:
+            return {'lat': latitude, 'lon': longitude}
+        return {'q': f"{city_name},{country_code}"}
+    
+    def get_current_weather(self, city_name, country_code, latitude=None, longitude=None):
         """Fetch current weather data from OpenWeatherMap API"""
         url = f"{self.base_url}/weather"
         params = {
-            'q': f"{city_name},{country_code}",
+            **self._get_location_params(city_name, country_code, latitude, longitude),
             'appid': self.api_key,
             'units': 'metric'
         }
@@ -60,23 +204,127 @@ class OpenWeatherMapService:
         logger.info(f"Fetching current weather for {city_name}, {country_code}")
         return self._make_request(url, params)
     
-    def get_forecast(self, city_name, country_code):
+    def get_current_weather_group(self, openweather_ids):
+        """Fetch current weather for up to 20 cities by upstream ID in one call"""
+        url = f"{self.base_url}/group"
+        params = {
+            'id': ','.join(str(openweather_id) for openweather_id in openweather_ids),
+            'appid': self.api_key,
+            'units': 'metric'
+        }
+        
+        logger.info(f"Fetching current weather for {len(openweather_ids)} cities by ID")
+        return self._make_request(url, params)
+    
+    def get_forecast(self, city_name, country_code, latitude=None, longitude=None):
         """Fetch 5-day forecast data from OpenWeatherMap API"""
         url = f"{self.base_url}/forecast"
         params = {
-            'q': f"{city_name},{country_code}",
+            **self._get_location_params(city_name, country_code, latitude, longitude),
             'appid': self.api_key,
             'units': 'metric'
         }
         
         logger.info(f"Fetching forecast for {city_name}, {country_code}")
         return self._make_request(url, params)
+    
+    def geocode(self, city_name, country_code):
+        """Resolve a city name to coordinates with the OpenWeatherMap geocoding API"""
+        url = f"{settings.OPENWEATHER_GEO_URL}/direct"
+        params = {
+            'q': f"{city_name},{country_code}",
+            'limit': 1,
+            'appid': self.api_key
+        }
+        
+        logger.info(f"Geocoding {city_name}, {country_code}")
+        return self._make_request(url, params)
+
+class GeocodingService:
+    """Resolve city names to coordinates, asking upstream at most once per name.
+
+    Found locations are kept for good. "Not found" answers expire after
+    WEATHER_GEOCODING_NOT_FOUND_TTL seconds, so a city that was missing
+    upstream once can be added again later.
+    """
+    def __init__(self, openweather_service=None):
+        self.openweather_service = openweather_service or get_provider()
+    
+    def _normalize(self, name, country_code):
+        return name.strip().lower(), country_code.upper()
+    
+    def get_cached(self, name, country_code):
+        """Return the cached GeocodingResult for a name, or None if unknown or an expired "not found" """
+        normalized_name, country_code = self._normalize(name, country_code)
+        result = GeocodingResult.objects.filter(name=normalized_name, country_code=country_code).first()
+        if result is None or result.found:
+            return result
+        expires_at = result.created_at + timedelta(seconds=settings.WEATHER_GEOCODING_NOT_FOUND_TTL)
+        if expires_at <= timezone.now():
+            result.delete()
+            return None
+        return result
+    
+    def remember(self, name, country_code, latitude=None, longitude=None):
+        """Cache a location for a name; without coordinates it is cached as not found"""
+        normalized_name, country_code = self._normalize(name, country_code)
+        result, created = GeocodingResult.objects.update_or_create(
+            name=normalized_name,
+            country_code=country_code,
+            defaults={'latitude': latitude, 'longitude': longitude, 'created_at': timezone.now()}
+        )
+        return result
+    
+    def resolve(self, name, country_code):
+        """Return the cached GeocodingResult for a city, geocoding it on first use"""
+        result = self.get_cached(name, country_code)
+        if result is None:
+            locations = self.openweather_service.geocode(name.strip(), country_code.upper())
+            location = locations[0] if locations else {}
+            result = self.remember(name, country_code, location.get('lat'), location.get('lon'))
+        else:
+            logger.info(f"Using cached geocoding result for {name}, {country_code}")
+        
+        if not result.found:
+            raise WeatherAPIException("City not found")
+        return result
+    
+    def geocode_city(self, city):
+        """Fill in a city's coordinates from the geocoding cache, without calling upstream.
+
+        Cities not in the cache keep no coordinates, so their first weather
+        fetch queries by name and stores the coordinates it returns.
+        """
+        if city.latitude is not None and city.longitude is not None:
+            return city
+        result = self.get_cached(city.name, city.country_code)
+        if result is None:
+            return city
+        if not result.found:
+            raise WeatherAPIException("City not found")
+        logger.info(f"Using cached geocoding result for {city.name}, {city.country_code}")
+        city.latitude = result.latitude
+        city.longitude = result.longitude
+        city.save(update_fields=['latitude', 'longitude'])
+        return city
 
 class WeatherCacheService:
-    def __init__(self):
-        self.openweather_service = OpenWeatherMapService()
+    # Columns rewritten when a forecast row for the same (city, forecast_date) already exists
+    forecast_update_fields = [
+        'temperature_min', 'temperature_max', 'temperature_day', 'temperature_night',
+        'humidity', 'pressure', 'weather_main', 'weather_description', 'weather_icon',
+        'wind_speed', 'wind_direction', 'cached_at'
+    ]
+    
+    def __init__(self, provider=None):
+        # Any WeatherProvider; WEATHER_PROVIDER by default
+        self.openweather_service = provider or get_provider()
+        self.history = WeatherHistoryService()
         self.weather_cache_prefix = "weather_current"
         self.forecast_cache_prefix = "weather_forecast"
+        self.forecast_series_cache_prefix = "weather_forecast_series"
+        self.payload_cache_prefix = "weather_payload"
+        self.payload_units = TEMPERATURE_UNITS
     
     def _get_weather_cache_key(self, city_id):
         """Generate cache key for current weather"""
@@ -86,9 +334,63 @@ class WeatherCacheService:
         """Generate cache key for forecast data"""
         return f"{self.forecast_cache_prefix}_{city_id}"
     
+    def _get_forecast_series_cache_key(self, city_id):
+        """Generate cache key for the 3-hourly forecast series"""
+        return f"{self.forecast_series_cache_prefix}_{city_id}"
+    
+    def _get_payload_cache_key(self, kind, city_id, unit):
+        """Generate cache key for a rendered JSON response ('weather' or 'forecast')"""
+        return f"{self.payload_cache_prefix}_{kind}_{city_id}_{unit}"
+    
+    def get_cached_payload(self, kind, city_id, unit='C'):
+        """Return the cached response for a city ({'body', 'etag', 'cached_at', 'unit'}), or None on a miss"""
+        payload = cache.get(self._get_payload_cache_key(kind, city_id, unit))
+        if payload is not None:
+            self._record_read(city_id)
+            logger.info(f"Returning cached {kind} payload for city {city_id}")
+        return payload
+    
+    def get_payload_etag(self, kind, city_id, cached_at, unit='C'):
+        """Strong ETag of a response; it changes exactly when cached_at or the unit does"""
+        return f'"{kind}-{city_id}-{int(cached_at.timestamp() * 1000000)}-{unit}"'
+    
+    def get_remaining_validity(self, cached_at):
+        """Seconds until data cached at cached_at expires (0 once it is stale)"""
+        remaining = settings.WEATHER_CACHE_DURATION - (timezone.now() - cached_at).total_seconds()
+        return max(int(remaining), 0)
+    
+    def cache_payload(self, kind, city_id, data, cached_at, unit='C'):
+        """Render data to JSON and cache it with its validators for the rest of the validity window"""
+        payload = {
+            'body': JSONRenderer().render(data),
+            'etag': self.get_payload_etag(kind, city_id, cached_at, unit),
+            'cached_at': cached_at,
+            'unit': unit,
+        }
+        remaining = self.get_remaining_validity(cached_at)
+        # Stale data served during revalidation is never cached
+        if remaining > 0:
+            cache.set(self._get_payload_cache_key(kind, city_id, unit), payload, remaining)
+        return payload
+    
+    def _invalidate_payloads(self, kind, city_id):
+        """Drop the rendered responses of a city after its data changed"""
+        cache.delete_many([
+            self._get_payload_cache_key(kind, city_id, unit) for unit in self.payload_units
+        ])
+    
+    def get_read_cache_key(self, city_id):
+        """Generate cache key for the recent read counter of a city"""
+        return read_counter.get_key(city_id)
+    
+    def _record_read(self, city_id):
+        """Count a read so the refresh scheduler can prioritise popular cities"""
+        read_counter.record(city_id)
+    
     def get_or_fetch_current_weather(self, city):
         """Get current weather from cache or fetch from API if stale"""
         cache_key = self._get_weather_cache_key(city.id)
+        self._record_read(city.id)
         
         cached_data = cache.get(cache_key)
         if cached_data:
@@ -103,42 +405,25 @@ class WeatherCacheService:
             logger.info(f"Returning database cached weather data for {city.name}")
             return cached_weather
         
-        # Fetch fresh data from API
+        # Serve expired data within the grace window and revalidate in the background
+        if cached_weather and cached_weather.is_within_grace_period():
+            single_flight.do_in_background(cache_key, lambda: self._fetch_current_weather(city))
+            logger.info(f"Returning stale weather data for {city.name} while revalidating")
+            return cached_weather
+        
+        return self._fetch_current_weather_or_stale(city, cached_weather)
+    
+    def _fetch_current_weather_or_stale(self, city, cached_weather):
+        """Fetch fresh weather, falling back to the stale row if the API fails"""
+        cache_key = self._get_weather_cache_key(city.id)
+        
+        # Fetch fresh data from API, coalescing concurrent misses for this city
         try:
-            weather_data = self.openweather_service.get_current_weather(
-                city.name, city.country_code
-            )
-            
-            # Update city coordinates if not set
-            if not city.latitude or not city.longitude:
-                city.latitude = weather_data['coord']['lat']
-                city.longitude = weather_data['coord']['lon']
-                city.save()
-                logger.info(f"Updated coordinates for {city.name}")
-            
-            # Create or update weather data
-            weather_obj, created = WeatherData.objects.update_or_create(
-                city=city,
-                defaults={
-                    'temperature': weather_data['main']['temp'],
-                    'feels_like': weather_data['main']['feels_like'],
-                    'humidity': weather_data['main']['humidity'],
-                    'pressure': weather_data['main']['pressure'],
-                    'weather_main': weather_data['weather'][0]['main'],
-                    'weather_description': weather_data['weather'][0]['description'],
-                    'weather_icon': weather_data['weather'][0]['icon'],
-                    'wind_speed': weather_data.get('wind', {}).get('speed', 0),
-                    'wind_direction': weather_data.get('wind', {}).get('deg', 0),
-                    'visibility': weather_data.get('visibility'),
-                    'cached_at': timezone.now()
-                }
+            return single_flight.do(
+                cache_key,
+                lambda: self._fetch_current_weather(city),
+                lambda: cache.get(cache_key)
             )
-            
-            cache.set(cache_key, weather_obj, settings.WEATHER_CACHE_DURATION)
-            logger.info(f"Fetched and cached fresh weather data for {city.name}")
-            
-            return weather_obj
-            
         except WeatherAPIException as e:
             logger.error(f"Weather API error for {city.name}: {e}")
             # If API fails and we have old cached data, return it
@@ -152,9 +437,220 @@ class WeatherCacheService:
                 return cached_weather
             raise WeatherAPIException("Failed to fetch weather data")
     
+    def get_or_fetch_current_weather_many(self, cities):
+        """Get current weather for many cities with one cache multi-get and parallel API fetches.
+        
+        Returns a tuple of (results, errors) dicts keyed by city id.
+        """
+        cache_keys = {city.id: self._get_weather_cache_key(city.id) for city in cities}
+        cached_data = cache.get_many(list(cache_keys.values()))
+        read_counter.record(*cache_keys)
+        
+        results = {}
+        misses = []
+        for city in cities:
+            weather = cached_data.get(cache_keys[city.id])
+            if weather:
+                results[city.id] = weather
+            else:
+                misses.append(city)
+        
+        if not misses:
+            logger.info(f"Returning cached weather data for {len(cities)} cities")
+            return results, {}
+        
+        # One query for the database cache of every miss (rows are newest first)
+        db_rows = {}
+        for weather in WeatherData.objects.filter(city__in=misses).select_related('city'):
+            db_rows.setdefault(weather.city_id, weather)
+        
+        to_cache = {}
+        to_fetch = []
+        for city in misses:
+            cached_weather = db_rows.get(city.id)
+            if cached_weather and cached_weather.is_cache_valid():
+                results[city.id] = cached_weather
+                to_cache[cache_keys[city.id]] = cached_weather
+            elif cached_weather and cached_weather.is_within_grace_period():
+                single_flight.do_in_background(
+                    cache_keys[city.id], lambda city=city: self._fetch_current_weather(city)
+                )
+                results[city.id] = cached_weather
+            else:
+                to_fetch.append((city, cached_weather))
+        
+        if to_cache:
+            cache.set_many(to_cache, settings.WEATHER_CACHE_DURATION)
+        
+        errors = {}
+        if to_fetch:
+            logger.info(f"Fetching weather for {len(to_fetch)} cities from the API")
+            with ThreadPoolExecutor(max_workers=settings.WEATHER_BATCH_MAX_WORKERS) as executor:
+                futures = {
+                    executor.submit(self._fetch_in_thread, city, cached_weather): city
+                    for city, cached_weather in to_fetch
+                }
+                for future, city in futures.items():
+                    try:
+                        results[city.id] = future.result()
+                    except WeatherAPIException as e:
+                        errors[city.id] = e
+        
+        return results, errors
+    
+    def _fetch_in_thread(self, city, cached_weather):
+        """Fetch weather from a worker thread and release its DB connection"""
+        try:
+            return self._fetch_current_weather_or_stale(city, cached_weather)
+        finally:
+            connection.close()
+    
+    def _get_weather_defaults(self, weather_data):
+        """Map an upstream current weather payload to WeatherData fields"""
+        return {
+            'temperature': weather_data['main']['temp'],
+            'feels_like': weather_data['main']['feels_like'],
+            'humidity': weather_data['main']['humidity'],
+            'pressure': weather_data['main']['pressure'],
+            'weather_main': weather_data['weather'][0]['main'],
+            'weather_description': weather_data['weather'][0]['description'],
+            'weather_icon': weather_data['weather'][0]['icon'],
+            'wind_speed': weather_data.get('wind', {}).get('speed', 0),
+            'wind_direction': weather_data.get('wind', {}).get('deg', 0),
+            'visibility': weather_data.get('visibility'),
+            'cached_at': timezone.now()
+        }
+    
+    def refresh_current_weather_bulk(self, cities):
+        """Refresh current weather for many cities using the group-by-ID endpoint.
+        
+        Cities with a known upstream ID are fetched 20 per call; the rest fall back
+        to one call each. Returns a tuple of (refreshed city ids, errors by city id).
+        """
+        by_upstream_id = {city.openweather_id: city for city in cities if city.openweather_id}
+        refreshed = []
+        errors = {}
+        
+        upstream_ids = list(by_upstream_id)
+        group_size = self.openweather_service.group_size
+        for start in range(0, len(upstream_ids), group_size):
+            chunk = upstream_ids[start:start + group_size]
+            try:
+                group_data = self.openweather_service.get_current_weather_group(chunk)
+            except WeatherAPIException as e:
+                logger.error(f"Group weather API error for {len(chunk)} cities: {e}")
+                for upstream_id in chunk:
+                    errors[by_upstream_id[upstream_id].id] = e
+                continue
+            
+            to_cache = {}
+            observations = []
+            previous = cache.get_many([
+                self._get_weather_cache_key(by_upstream_id[upstream_id].id) for upstream_id in chunk
+            ])
+            with transaction.atomic():
+                for weather_data in group_data.get('list', []):
+                    city = by_upstream_id.get(weather_data.get('id'))
+                    if city is None:
+                        continue
+                    weather_obj, created = WeatherData.objects.update_or_create(
+                        city=city,
+                        defaults=self._get_weather_defaults(weather_data)
+                    )
+                    to_cache[self._get_weather_cache_key(city.id)] = weather_obj
+                    observations.append((city.id, weather_data))
+            cache.set_many(to_cache, settings.WEATHER_CACHE_DURATION)
+            self._record_history(observations)
+            chunk_refreshed = {weather_obj.city_id for weather_obj in to_cache.values()}
+            for cache_key, weather_obj in to_cache.items():
+                publish(weather_obj.city_id, weather_delta(previous.get(cache_key), weather_obj))
+            cache.delete_many([
+                self._get_payload_cache_key('weather', city_id, unit)
+                for city_id in chunk_refreshed for unit in self.payload_units
+            ])
+            refreshed.extend(chunk_refreshed)
+            
+            for upstream_id in chunk:
+                city = by_upstream_id[upstream_id]
+                if city.id not in chunk_refreshed and city.id not in errors:
+                    errors[city.id] = WeatherAPIException("City not found")
+        
+        for city in cities:
+            if city.openweather_id:
+                continue
+            try:
+                self.refresh_current_weather(city)
+                refreshed.append(city.id)
+            except WeatherAPIException as e:
+                errors[city.id] = e
+        
+        logger.info(f"Bulk refreshed weather for {len(refreshed)} cities with {len(errors)} errors")
+        return refreshed, errors
+    
+    def refresh_current_weather(self, city):
+        """Fetch current weather from the API even if the cached copy is still valid"""
+        cache_key = self._get_weather_cache_key(city.id)
+        return single_flight.do(
+            cache_key,
+            lambda: self._fetch_current_weather(city, force=True),
+            lambda: None
+        )
+    
+    def _fetch_current_weather(self, city, force=False):
+        """Fetch current weather from the API and store it in the DB and cache"""
+        cache_key = self._get_weather_cache_key(city.id)
+        
+        # Another worker may have refreshed the city while we waited for the lock
+        cached_data = None if force else cache.get(cache_key)
+        if cached_data:
+            return cached_data
+        
+        weather_data = self.openweather_service.get_current_weather(
+            city.name, city.country_code, city.latitude, city.longitude
+        )
+        return self._store_current_weather(city, weather_data)
+    
+    def _store_current_weather(self, city, weather_data):
+        """Save an upstream current weather payload to the DB and cache"""
+        cache_key = self._get_weather_cache_key(city.id)
+        
+        # Update city coordinates and upstream ID if not set
+        if city.latitude is None or city.longitude is None or not city.openweather_id:
+            if city.latitude is None or city.longitude is None:
+                city.latitude = weather_data['coord']['lat']
+                city.longitude = weather_data['coord']['lon']
+            city.openweather_id = weather_data.get('id') or city.openweather_id
+            city.save()
+            logger.info(f"Updated coordinates for {city.name}")
+        
+        # Create or update weather data
+        previous = cache.get(cache_key)
+        weather_obj, created = WeatherData.objects.update_or_create(
+            city=city,
+            defaults=self._get_weather_defaults(weather_data)
+        )
+        
+        cache.set(cache_key, weather_obj, settings.WEATHER_CACHE_DURATION)
+        self._invalidate_payloads('weather', city.id)
+        self._record_history([(city.id, weather_data)])
+        publish(city.id, weather_delta(previous, weather_obj))
+        logger.info(f"Fetched and cached fresh weather data for {city.name}")
+        
+        return weather_obj
+    
+    def _record_history(self, observations):
+        """Append observations to the weather history without failing the refresh"""
+        if not observations:
+            return
+        try:
+            self.history.record_many(observations)
+        except Exception as e:
+            logger.error(f"Failed to record weather history for {len(observations)} cities: {e}")
+    
     def get_or_fetch_forecast(self, city):
         """Get forecast from cache or fetch from API if stale"""
         cache_key = self._get_forecast_cache_key(city.id)
+        self._record_read(city.id)
         
         cached_data = cache.get(cache_key)
         if cached_data:
@@ -164,59 +660,27 @@ class WeatherCacheService:
         # Check database cache
         cached_forecasts = ForecastData.objects.filter(city=city)
         
-        if cached_forecasts.exists() and cached_forecasts.first().is_cache_valid():
+        latest_forecast = cached_forecasts.first()
+        
+        if latest_forecast and latest_forecast.is_cache_valid():
             forecast_list = list(cached_forecasts)
             cache.set(cache_key, forecast_list, settings.WEATHER_CACHE_DURATION)
             logger.info(f"Returning database cached forecast data for {city.name}")
             return forecast_list
         
-        # Fetch fresh forecast data from API
+        # Serve expired data within the grace window and revalidate in the background
+        if latest_forecast and latest_forecast.is_within_grace_period():
+            single_flight.do_in_background(cache_key, lambda: self._fetch_forecast(city))
+            logger.info(f"Returning stale forecast data for {city.name} while revalidating")
+            return list(cached_forecasts)
+        
+        # Fetch fresh forecast data from API, coalescing concurrent misses for this city
         try:
-            forecast_data = self.openweather_service.get_forecast(
-                city.name, city.country_code
+            return single_flight.do(
+                cache_key,
+                lambda: self._fetch_forecast(city),
+                lambda: cache.get(cache_key)
             )
-            
-            # Clear old forecast data
-            ForecastData.objects.filter(city=city).delete()
-            
-            # Process forecast data (group by day and take one forecast per day)
-            daily_forecasts = {}
-            for item in forecast_data['list']:
-                forecast_date = datetime.fromtimestamp(item['dt'], tz=dt_timezone.utc)
-                date_key = forecast_date.date()
-                
-                # Take the first forecast for each day (usually around noon)
-                if date_key not in daily_forecasts:
-                    daily_forecasts[date_key] = item
-            
-            # Create forecast objects
-            forecast_objects = []
-            for date_key, forecast_item in list(daily_forecasts.items())[:5]:  # Limit to 5 days
-                forecast_date = datetime.fromtimestamp(forecast_item['dt'], tz=dt_timezone.utc)
-                
-                forecast_obj = ForecastData.objects.create(
-                    city=city,
-                    forecast_date=forecast_date,
-                    temperature_min=forecast_item['main']['temp_min'],
-                    temperature_max=forecast_item['main']['temp_max'],
-                    temperature_day=forecast_item['main']['temp'],
-                    temperature_night=forecast_item['main']['temp'],  # API doesn't separate day/night in 5-day forecast
-                    humidity=forecast_item['main']['humidity'],
-                    pressure=forecast_item['main']['pressure'],
-                    weather_main=forecast_item['weather'][0]['main'],
-                    weather_description=forecast_item['weather'][0]['description'],
-                    weather_icon=forecast_item['weather'][0]['icon'],
-                    wind_speed=forecast_item.get('wind', {}).get('speed', 0),
-                    wind_direction=forecast_item.get('wind', {}).get('deg', 0),
-                    cached_at=timezone.now()
-                )
-                forecast_objects.append(forecast_obj)
-            
-            cache.set(cache_key, forecast_objects, settings.WEATHER_CACHE_DURATION)
-            logger.info(f"Fetched and cached fresh forecast data for {city.name}")
-            
-            return forecast_objects
-            
         except WeatherAPIException as e:
             logger.error(f"Forecast API error for {city.name}: {e}")
             # If API fails and we have old cached data, return it
@@ -230,15 +694,129 @@ class WeatherCacheService:
                 return list(cached_forecasts)
             raise WeatherAPIException("Failed to fetch forecast data")
     
+    def refresh_forecast(self, city):
+        """Fetch the forecast from the API even if the cached copy is still valid"""
+        cache_key = self._get_forecast_cache_key(city.id)
+        return single_flight.do(
+            cache_key,
+            lambda: self._fetch_forecast(city, force=True),
+            lambda: None
+        )
+    
+    def _fetch_forecast(self, city, force=False):
+        """Fetch the forecast from the API and store it in the DB and cache"""
+        cache_key = self._get_forecast_cache_key(city.id)
+        
+        # Another worker may have refreshed the city while we waited for the lock
+        cached_data = None if force else cache.get(cache_key)
+        if cached_data:
+            return cached_data
+        
+        forecast_data = self.openweather_service.get_forecast(
+            city.name, city.country_code, city.latitude, city.longitude
+        )
+        return self._store_forecast(city, forecast_data)
+    
+    def _store_forecast(self, city, forecast_data):
+        """Save an upstream forecast payload to the DB and cache"""
+        cache_key = self._get_forecast_cache_key(city.id)
+        
+        # Keep the full 3-hourly series and derive the daily rows from it
+        points = pack_forecast_series(forecast_data)
+        timezone_offset = forecast_data.get('city', {}).get('timezone', 0)
+        
+        previous = cache.get(cache_key)
+        now = timezone.now()
+        forecast_objects = [
+            ForecastData(city=city, cached_at=now, **day)
+            for day in aggregate_daily(points, timezone_offset)
+        ]
+        
+        # Upsert the new days and prune the rest in one transaction, so readers
+        # never see a partially written or empty forecast
+        with transaction.atomic():
+            ForecastData.objects.filter(city=city).exclude(
+                forecast_date__in=[forecast.forecast_date for forecast in forecast_objects]
+            ).delete()
+            forecast_objects = ForecastData.objects.bulk_create(
+                forecast_objects,
+                update_conflicts=True,
+                unique_fields=['city', 'forecast_date'],
+                update_fields=self.forecast_update_fields,
+            )
+            series, created = ForecastSeries.objects.update_or_create(
+                city=city,
+                defaults={'points': points, 'timezone_offset': timezone_offset, 'cached_at': now}
+            )
+        
+        cache.set(self._get_forecast_series_cache_key(city.id), series, settings.WEATHER_CACHE_DURATION)
+        cache.set(cache_key, forecast_objects, settings.WEATHER_CACHE_DURATION)
+        self._invalidate_payloads('forecast', city.id)
+        publish(city.id, forecast_delta(city.id, previous, forecast_objects))
+        logger.info(f"Fetched and cached fresh forecast data for {city.name}")
+        
+        return forecast_objects
+    
+    def get_or_fetch_forecast_series(self, city):
+        """Get the 3-hourly forecast series, fetching it with the daily forecast if stale"""
+        cache_key = self._get_forecast_series_cache_key(city.id)
+        forecast_key = self._get_forecast_cache_key(city.id)
+        self._record_read(city.id)
+        
+        cached_data = cache.get(cache_key)
+        if cached_data:
+            logger.info(f"Returning cached forecast series for {city.name}")
+            return cached_data
+        
+        # Check database cache
+        cached_series = ForecastSeries.objects.filter(city=city).first()
+        
+        if cached_series and cached_series.is_cache_valid():
+            cache.set(cache_key, cached_series, settings.WEATHER_CACHE_DURATION)
+            logger.info(f"Returning database cached forecast series for {city.name}")
+            return cached_series
+        
+        # Serve expired data within the grace window and revalidate in the background
+        if cached_series and cached_series.is_within_grace_period():
+            single_flight.do_in_background(forecast_key, lambda: self._fetch_forecast(city, force=True))
+            logger.info(f"Returning stale forecast series for {city.name} while revalidating")
+            return cached_series
+        
+        # One upstream call refreshes both the series and the daily rows
+        try:
+            self.refresh_forecast(city)
+            return cache.get(cache_key) or ForecastSeries.objects.get(city=city)
+        except WeatherAPIException as e:
+            logger.error(f"Forecast API error for {city.name}: {e}")
+            if cached_series:
+                logger.info(f"Returning stale forecast series for {city.name} due to API error")
+                return cached_series
+            raise e
+        except Exception as e:
+            logger.error(f"Unexpected error fetching forecast series for {city.name}: {e}")
+            if cached_series:
+                return cached_series
+            raise WeatherAPIException("Failed to fetch forecast data")
+    
     def invalidate_city_cache(self, city_id):
         """Invalidate all cache entries for a specific city"""
         weather_key = self._get_weather_cache_key(city_id)
         forecast_key = self._get_forecast_cache_key(city_id)
+        series_key = self._get_forecast_series_cache_key(city_id)
         
         cache.delete(weather_key)
         cache.delete(forecast_key)
+        cache.delete(series_key)
+        self._invalidate_payloads('weather', city_id)
+        self._invalidate_payloads('forecast', city_id)
         logger.info(f"Invalidated cache for city {city_id}")
     
+    def cache_stats(self):
+        """Per-tier hit/miss statistics of the weather cache for this process"""
+        if hasattr(cache, 'stats'):
+            return cache.stats()
+        return {}
+    
     def clear_all_cache(self):
         """Clear all weather-related cache entries"""
         cache.clear()
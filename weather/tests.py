@@ -1,3 +1,1869 @@
-from django.test import TestCase
+import os
+import re
+import json
+import time
+import shutil
+import tempfile
+import asyncio
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+from email.utils import format_datetime
+from io import StringIO
+from unittest import mock
+import httpx
+import requests
+from rest_framework.renderers import JSONRenderer
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from channels.routing import URLRouter
+from channels.security.websocket import OriginValidator
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connection
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from . import views
+from .async_services import AsyncHTTPClient, AsyncOpenWeatherMapService, AsyncWeatherCacheService
+from .benchmark import CACHE_HIT, DB_HIT, UPSTREAM_MISS
+from .coalescing import AsyncSingleFlight, SingleFlight, async_single_flight, single_flight
+from .circuitbreaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from .favorites import FavoritesService
+from .forecast import aggregate_daily, pack_forecast_series
+from .history import WeatherHistoryService
+from .live import convert_message, publish
+from .models import (
+    City, GeocodingResult, WeatherData, ForecastData, ForecastSeries, UserPreference, WeatherObservationChunk,
+    WeatherRollup,
+)
+from .providers import WeatherProvider, get_async_provider, get_provider
+from .reads import ReadCounter
+from .replay import INJECTED_ERRORS, AsyncReplayWeatherProvider, ReplayWeatherProvider
+from .routing import websocket_urlpatterns
+from .serializers import (
+    ForecastDataSerializer, WeatherDataSerializer, forecast_row_serializer, weather_row_serializer,
+)
+from .ratelimit import BACKGROUND, FOREGROUND, UpstreamRateLimiter, parse_retry_after
+from .scheduler import RefreshScheduler
+from .services import (
+    CircuitOpenError, GeocodingService, OpenWeatherMapService, PooledHTTPSession, WeatherAPIException,
+    WeatherCacheService,
+)
 
-# Create your tests here.
+# Keep tests away from the shared database or Redis cache of the running app
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'weather-tests'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'weather-tests-shared'},
+}
+
+# Upstream calls answered offline, instantly and without injected errors
+REPLAY_PROVIDER = {
+    'WEATHER_PROVIDER': 'weather.replay.ReplayWeatherProvider',
+    'WEATHER_ASYNC_PROVIDER': 'weather.replay.AsyncReplayWeatherProvider',
+    'WEATHER_REPLAY': {'RECORDINGS': '', 'LATENCY': 0, 'JITTER': 0, 'ERROR_RATE': 0, 'SEED': 0},
+}
+
+def create_weather(city, **fields):
+    defaults = {
+        'temperature': 10, 'feels_like': 9, 'humidity': 50, 'pressure': 1000, 'weather_main': 'Clear',
+        'weather_description': 'clear sky', 'weather_icon': '01d', 'wind_speed': 1, 'wind_direction': 0,
+    }
+    return WeatherData.objects.create(city=city, **{**defaults, **fields})
+
+def set_age(queryset, seconds):
+    """Backdate cached_at of rows (auto_now prevents doing so on save)"""
+    queryset.update(cached_at=timezone.now() - timedelta(seconds=seconds))
+
+class FakeClock:
+    """Stands in for the time module of the code under test; sleep() advances the clock"""
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class QueryPlanTests(TestCase):
+    """Fail when a hot lookup stops using an index and falls back to a full table scan"""
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.cities = [
+            City.objects.create(name=f"City {i}", country_code='GB', openweather_id=1000 + i)
+            for i in range(20)
+        ]
+        for i, city in enumerate(cls.cities):
+            WeatherData.objects.create(
+                city=city, temperature=10, feels_like=9, humidity=50, pressure=1000,
+                weather_main='Rain' if i % 2 else 'Clear', weather_description='x',
+                weather_icon='01d', wind_speed=1, wind_direction=0
+            )
+            for day in range(5):
+                ForecastData.objects.create(
+                    city=city, forecast_date=now + timedelta(days=day), temperature_min=1,
+                    temperature_max=2, temperature_day=2, temperature_night=1, humidity=50,
+                    pressure=1000, weather_main='Clear', weather_description='x',
+                    weather_icon='01d', wind_speed=1, wind_direction=0
+                )
+            ForecastSeries.objects.create(city=city, points={'dt': []})
+        GeocodingResult.objects.create(name='city 1', country_code='GB', latitude=1, longitude=2)
+        cls.city = cls.cities[3]
+        cls.cursor = WeatherData.objects.order_by('-cached_at', '-id').values_list('cached_at', 'id')[5]
+
+    def explain(self, queryset):
+        if connection.vendor == 'postgresql':
+            # Tiny test tables make a sequential scan the cheapest plan, so
+            # discourage it: Postgres still picks one when no index applies.
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+            try:
+                return queryset.explain()
+            finally:
+                with connection.cursor() as cursor:
+                    cursor.execute('SET enable_seqscan = on')
+        return queryset.explain()
+
+    def assertNoFullScan(self, queryset):
+        plan = self.explain(queryset)
+        if connection.vendor == 'postgresql':
+            self.assertNotIn('Seq Scan', plan, plan)
+        elif connection.vendor == 'sqlite':
+            # SQLite reports a full pass over a table or index as "SCAN", keyed lookups as "SEARCH"
+            full_scans = re.findall(r'\bSCAN (\w+)', plan)
+            self.assertEqual(full_scans, [], plan)
+        else:
+            self.skipTest(f"No query plan check for {connection.vendor}")
+
+    def test_latest_weather_for_city(self):
+        self.assertNoFullScan(WeatherData.objects.filter(city=self.city).order_by('-cached_at')[:1])
+
+    def test_weather_for_many_cities(self):
+        self.assertNoFullScan(WeatherData.objects.filter(city__in=self.cities[:5]))
+
+    def test_forecast_for_city(self):
+        self.assertNoFullScan(ForecastData.objects.filter(city=self.city))
+
+    def test_oldest_forecast_for_city(self):
+        self.assertNoFullScan(ForecastData.objects.filter(city=self.city).order_by('cached_at')[:1])
+
+    def test_forecast_series_for_city(self):
+        self.assertNoFullScan(ForecastSeries.objects.filter(city=self.city))
+
+    def test_weather_list_page(self):
+        value, pk = self.cursor
+        self.assertNoFullScan(
+            WeatherData.objects.order_by('-cached_at', '-id').filter(
+                Q(cached_at__lte=value), Q(cached_at__lt=value) | Q(cached_at=value, id__lt=pk)
+            )[:100]
+        )
+
+    def test_forecast_list_page(self):
+        forecast = ForecastData.objects.order_by('forecast_date', 'id')[10]
+        self.assertNoFullScan(
+            ForecastData.objects.order_by('forecast_date', 'id').filter(
+                Q(forecast_date__gte=forecast.forecast_date),
+                Q(forecast_date__gt=forecast.forecast_date) |
+                Q(forecast_date=forecast.forecast_date, id__gt=forecast.id)
+            )[:100]
+        )
+
+    def test_admin_weather_main_filter(self):
+        self.assertNoFullScan(WeatherData.objects.filter(weather_main='Rain'))
+        self.assertNoFullScan(ForecastData.objects.filter(weather_main='Clear'))
+
+    def test_city_by_upstream_id(self):
+        self.assertNoFullScan(City.objects.filter(openweather_id=1003))
+
+    def test_geocoding_lookup(self):
+        self.assertNoFullScan(GeocodingResult.objects.filter(name='city 1', country_code='GB'))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class TemperatureUnitTests(TestCase):
+    """Units come from ?unit= or the session, and reading them never changes the session"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.city = City.objects.create(name='Oslo', country_code='NO', latitude=59.9, longitude=10.7)
+        create_weather(cls.city, temperature=20)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_preference_rejects_unknown_unit(self):
+        response = self.client.post('/api/preferences/', {'temperature_unit': 'K'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(UserPreference.objects.exists())
+
+    def test_unknown_session_unit_falls_back_to_celsius(self):
+        session = self.client.session
+        session['temperature_unit'] = 'K'
+        session.save()
+        for url in ['/api/weather/', f'/api/cities/{self.city.id}/weather/']:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertEqual(response['X-Temperature-Unit'], 'C')
+
+    def test_session_unit_converts_and_varies_on_cookie(self):
+        self.client.post('/api/preferences/', {'temperature_unit': 'F'}, content_type='application/json')
+        response = self.client.get(f'/api/cities/{self.city.id}/weather/')
+        self.assertEqual(response['X-Temperature-Unit'], 'F')
+        self.assertEqual(response.json()['temperature'], 68)
+        self.assertIn('Cookie', response['Vary'])
+
+    def test_response_without_cookie_varies_on_cookie(self):
+        response = self.client.get(f'/api/cities/{self.city.id}/weather/')
+        self.assertEqual(response['X-Temperature-Unit'], 'C')
+        self.assertIn('Cookie', response['Vary'])
+
+    def test_empty_forecast_is_labelled(self):
+        with mock.patch.object(WeatherCacheService, 'get_or_fetch_forecast', return_value=[]):
+            response = self.client.get(f'/api/cities/{self.city.id}/forecast/?unit=F')
+        self.assertEqual(response.json(), [])
+        self.assertEqual(response['X-Temperature-Unit'], 'F')
+
+    def test_reads_do_not_write_the_session(self):
+        # A session from before the unit was stored in it
+        UserPreference.objects.create(session_key='x' * 32, temperature_unit='F')
+        session = self.client.session
+        session['other'] = 1
+        session.save()
+        UserPreference.objects.filter(session_key='x' * 32).update(session_key=session.session_key)
+        response = self.client.get('/api/weather/')
+        self.assertEqual(response['X-Temperature-Unit'], 'F')
+        self.assertNotIn('sessionid', response.cookies)
+        self.assertNotIn('temperature_unit', self.client.session)
+
+    def test_live_messages_are_converted_for_the_connection(self):
+        message = {'type': 'weather', 'unit': 'C', 'city_id': 1, 'changes': {'temperature': 100, 'humidity': 5}}
+        converted = convert_message(message, 'F')
+        self.assertEqual(converted['unit'], 'F')
+        self.assertEqual(converted['changes'], {'temperature': 212, 'humidity': 5})
+        self.assertIs(convert_message(message, 'C'), message)
+
+
+@override_settings(CACHES={
+    **TEST_CACHES,
+    'atomic': {
+        'BACKEND': 'weather.cache_backends.AtomicDatabaseCache',
+        'LOCATION': 'weather_cache',
+        'OPTIONS': {'MAX_ENTRIES': 4, 'CULL_FREQUENCY': 2, 'CULL_EXCLUDE_PREFIXES': ['ratelimit_']},
+    },
+})
+class AtomicDatabaseCacheTests(TestCase):
+    """The database fallback for the shared tier keeps lock and counter semantics"""
+
+    def setUp(self):
+        self.cache = caches['atomic']
+        self.cache.clear()
+
+    def test_add_takes_over_expired_keys_only(self):
+        self.assertTrue(self.cache.add('singleflight_x', 'a', 60))
+        self.assertFalse(self.cache.add('singleflight_x', 'b', 60))
+        self.cache.set('singleflight_y', 'a', -1)
+        self.assertTrue(self.cache.add('singleflight_y', 'b', 60))
+        self.assertEqual(self.cache.get('singleflight_y'), 'b')
+
+    def test_incr(self):
+        self.cache.add('weather_reads_1', 0, 60)
+        self.assertEqual(self.cache.incr('weather_reads_1'), 1)
+        self.assertEqual(self.cache.incr('weather_reads_1', 5), 6)
+        self.assertEqual(self.cache.get('weather_reads_1'), 6)
+        with self.assertRaises(ValueError):
+            self.cache.incr('weather_reads_missing')
+
+    def test_cull_keeps_excluded_keys(self):
+        self.cache.set('ratelimit_bucket', {'tokens': 1}, None)
+        # "_" is matched literally, not as a LIKE wildcard
+        self.cache.set('ratelimitXbucket', {'tokens': 1}, 30)
+        with CaptureQueriesContext(connection) as queries:
+            for index in range(10):
+                self.cache.set(f"weather_{index}", index, 60 + index)
+        self.assertEqual(self.cache.get('ratelimit_bucket'), {'tokens': 1})
+        self.assertIsNone(self.cache.get('ratelimitXbucket'))
+        self.assertIsNone(self.cache.get('weather_0'))
+        culls = [query['sql'] for query in queries if 'ORDER BY' in query['sql']]
+        self.assertTrue(culls)
+        self.assertTrue(all('LIMIT' in sql for sql in culls), culls)
+
+
+def tiered_cache(location):
+    return {
+        'BACKEND': 'weather.cache_backends.TieredCache',
+        'LOCATION': location,
+        'OPTIONS': {
+            'L2_ALIAS': 'shared', 'INVALIDATION_CHECK_INTERVAL': 0, 'L1_EXCLUDE_PREFIXES': ['singleflight_'],
+        },
+    }
+
+
+@override_settings(CACHES={**TEST_CACHES, 'worker_a': tiered_cache('worker-a'), 'worker_b': tiered_cache('worker-b')})
+class TieredCacheTests(SimpleTestCase):
+    """Two TieredCaches with their own L1 stand in for two worker processes sharing L2"""
+
+    def setUp(self):
+        self.a = caches['worker_a']
+        self.b = caches['worker_b']
+        self.l2 = caches['shared']
+        self.a.clear()
+        self.b.clear()
+
+    def get_stats(self, tiered):
+        stats = tiered.stats()
+        return stats['l1']['hits'], stats['l1']['misses'], stats['l2']['hits']
+
+    def test_l1_hit_and_miss(self):
+        self.a.set('weather_1', 'sunny')
+        before = self.get_stats(self.b)
+        self.assertEqual(self.b.get('weather_1'), 'sunny')
+        self.assertEqual(self.b.get('weather_1'), 'sunny')
+        self.assertIsNone(self.b.get('weather_2'))
+        hits, misses, l2_hits = (now - then for now, then in zip(self.get_stats(self.b), before))
+        self.assertEqual((hits, misses, l2_hits), (1, 2, 1))
+
+    def test_writes_in_one_worker_evict_the_other_workers_l1(self):
+        self.a.set('weather_1', 'sunny')
+        self.b.get('weather_1')
+        # Changed behind the invalidation log's back, so only an L1 miss would see it
+        self.l2.set('weather_1', 'foggy')
+        self.assertEqual(self.b.get('weather_1'), 'sunny')
+
+        self.a.set('weather_1', 'rain')
+        self.assertEqual(self.b.get('weather_1'), 'rain')
+        self.a.delete('weather_1')
+        self.assertIsNone(self.b.get('weather_1'))
+
+    def test_lost_invalidation_messages_clear_l1(self):
+        self.a.set('weather_1', 'sunny')
+        self.b.get('weather_1')
+        self.a.set('weather_1', 'rain')
+        seq = self.l2.get(self.a.seq_key)
+        self.l2.delete(f"{self.a.message_prefix}_{seq}")
+        self.assertEqual(self.b.get('weather_1'), 'rain')
+
+    def test_get_many_and_set_many(self):
+        self.b.get_many(['weather_1', 'weather_2'])
+        seq = self.l2.get(self.a.seq_key)
+        self.a.set_many({'weather_1': 'sunny', 'weather_2': 'rain'})
+        self.assertEqual(self.l2.get(self.a.seq_key), seq + 1)
+        self.assertEqual(
+            self.b.get_many(['weather_1', 'weather_2', 'weather_3']), {'weather_1': 'sunny', 'weather_2': 'rain'}
+        )
+        self.a.set_many({'weather_1': 'snow'})
+        self.assertEqual(self.b.get_many(['weather_1', 'weather_2']), {'weather_1': 'snow', 'weather_2': 'rain'})
+
+    def test_coordination_keys_bypass_l1(self):
+        self.assertTrue(self.a.add('singleflight_1', 'token'))
+        self.assertFalse(self.b.add('singleflight_1', 'other'))
+        self.l2.delete('singleflight_1')
+        self.assertIsNone(self.a.get('singleflight_1'))
+        self.assertEqual(self.a.stats()['l1']['entries'], 0)
+
+    def test_publish_takes_two_l2_calls(self):
+        self.a.set('weather_1', 'sunny')
+        with mock.patch.object(self.l2, 'add', wraps=self.l2.add) as add:
+            self.a.set('weather_1', 'rain')
+        add.assert_not_called()
+
+
+@override_settings(
+    CACHES=TEST_CACHES, OPENWEATHER_RATE_LIMIT=60, OPENWEATHER_RATE_BURST=4,
+    OPENWEATHER_BACKGROUND_RESERVE=0.25, OPENWEATHER_FOREGROUND_MAX_WAIT=2, OPENWEATHER_BACKGROUND_MAX_WAIT=30,
+)
+class RateLimiterTests(SimpleTestCase):
+    """Token bucket with one token per second and room for four"""
+
+    def setUp(self):
+        cache.clear()
+        self.clock = FakeClock()
+        patcher = mock.patch('weather.ratelimit.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.limiter = UpstreamRateLimiter()
+
+    def test_bucket_refills_over_time(self):
+        for _ in range(4):
+            self.assertTrue(self.limiter.try_acquire(FOREGROUND))
+        self.assertFalse(self.limiter.try_acquire(FOREGROUND))
+        self.assertAlmostEqual(self.limiter.try_take(FOREGROUND), 1.0)
+        self.clock.now += 2.5
+        self.assertTrue(self.limiter.try_acquire(FOREGROUND))
+        self.assertTrue(self.limiter.try_acquire(FOREGROUND))
+        self.assertFalse(self.limiter.try_acquire(FOREGROUND))
+        self.clock.now += 1000
+        self.assertEqual(self.limiter.status()['tokens'], 4)
+
+    def test_background_leaves_the_reserve(self):
+        for _ in range(3):
+            self.assertTrue(self.limiter.try_acquire(BACKGROUND))
+        self.assertFalse(self.limiter.try_acquire(BACKGROUND))
+        self.assertTrue(self.limiter.try_acquire(FOREGROUND))
+
+    def test_acquire_waits_up_to_max_wait(self):
+        for _ in range(4):
+            self.limiter.try_acquire(FOREGROUND)
+        started = self.clock.now
+        self.assertTrue(self.limiter.acquire(FOREGROUND))
+        self.assertAlmostEqual(self.clock.now - started, 1.0)
+
+        self.limiter.pause(10)
+        started = self.clock.now
+        self.assertFalse(self.limiter.acquire(FOREGROUND))
+        self.assertEqual(self.clock.now, started)
+
+    def test_pause_blocks_until_retry_after(self):
+        self.limiter.pause(parse_retry_after('5'))
+        self.assertFalse(self.limiter.try_acquire(FOREGROUND))
+        self.assertAlmostEqual(self.limiter.try_take(FOREGROUND), 5)
+        self.clock.now += 5
+        self.assertTrue(self.limiter.try_acquire(FOREGROUND))
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after('120'), 120)
+        self.assertEqual(parse_retry_after('-3'), 0)
+        retry_at = datetime.now(dt_timezone.utc) + timedelta(seconds=60)
+        self.assertAlmostEqual(parse_retry_after(format_datetime(retry_at, usegmt=True)), 60, delta=2)
+        self.assertEqual(parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT'), 0)
+        self.assertIsNone(parse_retry_after('soon'))
+        self.assertIsNone(parse_retry_after(None))
+
+    def test_lock_is_only_released_by_its_holder(self):
+        # Our lock expires mid-update and another caller takes it
+        set_state = cache.set
+
+        def set_and_lose_lock(key, value, timeout=None):
+            set_state(key, value, timeout)
+            if key == self.limiter.state_key:
+                set_state(self.limiter.lock_key, 'other', 60)
+
+        with mock.patch.object(cache, 'set', set_and_lose_lock):
+            self.assertTrue(self.limiter.try_acquire(FOREGROUND))
+        self.assertEqual(cache.get(self.limiter.lock_key), 'other')
+
+
+def make_response(status_code, body=b'{}', headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = body
+    response.headers.update(headers or {})
+    response.url = 'https://api.openweathermap.org/data/2.5/weather'
+    return response
+
+
+@override_settings(
+    CACHES=TEST_CACHES, WEATHER_CIRCUIT_ERROR_THRESHOLD=0.5, WEATHER_CIRCUIT_MIN_REQUESTS=10,
+    WEATHER_CIRCUIT_WINDOW=60, WEATHER_CIRCUIT_BUCKET=10, WEATHER_CIRCUIT_OPEN_DURATION=30,
+    WEATHER_CIRCUIT_PROBE_TIMEOUT=15,
+)
+class CircuitBreakerTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.clock = FakeClock()
+        patcher = mock.patch('weather.circuitbreaker.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker()
+
+    def open_circuit(self):
+        for _ in range(10):
+            self.breaker.record_failure()
+        self.assertEqual(self.breaker.get_current_state(), OPEN)
+
+    def test_opens_at_threshold_after_min_requests(self):
+        for _ in range(9):
+            self.breaker.record_failure()
+        self.assertEqual(self.breaker.get_current_state(), CLOSED)
+
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.get_current_state(), CLOSED)
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.get_current_state(), OPEN)
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_stays_closed_below_threshold(self):
+        for _ in range(6):
+            self.breaker.record_success()
+        for _ in range(5):
+            self.breaker.record_failure()
+        self.assertEqual(self.breaker.get_current_state(), CLOSED)
+
+    def test_failures_leave_the_window(self):
+        for _ in range(9):
+            self.breaker.record_failure()
+        self.clock.now += 70
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.get_current_state(), CLOSED)
+
+    def test_half_open_allows_a_single_probe(self):
+        self.open_circuit()
+        self.clock.now += 30
+        self.assertEqual(self.breaker.get_current_state(), HALF_OPEN)
+        self.assertTrue(self.breaker.allow_request())
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_successful_probe_closes(self):
+        self.open_circuit()
+        self.clock.now += 30
+        self.breaker.allow_request()
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.get_current_state(), CLOSED)
+        # Failures from before the circuit closed no longer count
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.get_current_state(), CLOSED)
+        self.assertIs(self.breaker.allow_request(), True)
+
+    def test_failed_probe_reopens(self):
+        self.open_circuit()
+        self.clock.now += 30
+        self.breaker.allow_request()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.get_current_state(), OPEN)
+        self.assertFalse(self.breaker.allow_request())
+        self.clock.now += 30
+        self.assertTrue(self.breaker.allow_request())
+
+    def test_released_probe_can_be_taken_again(self):
+        self.open_circuit()
+        self.clock.now += 30
+        token = self.breaker.allow_request()
+        self.breaker.release_probe('someone else')
+        self.assertFalse(self.breaker.allow_request())
+        self.breaker.release_probe(token)
+        self.assertTrue(self.breaker.allow_request())
+
+
+@override_settings(CACHES=TEST_CACHES, WEATHER_CIRCUIT_MIN_REQUESTS=10, WEATHER_CIRCUIT_OPEN_DURATION=30)
+class UpstreamOutcomeTests(SimpleTestCase):
+    """Which OpenWeatherMap responses count against the circuit breaker"""
+
+    def setUp(self):
+        cache.clear()
+        self.http = mock.Mock()
+        patcher = mock.patch('weather.services.PooledHTTPSession.get', return_value=self.http)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.service = OpenWeatherMapService()
+        self.service.max_retries = 0
+        self.breaker = CircuitBreaker()
+
+    def get_failures(self):
+        return self.breaker.get_window_counts(self.breaker._get_state())[1]
+
+    def test_client_errors_do_not_count(self):
+        for status_code, message in ((404, 'City not found'), (401, 'Invalid API key'), (400, 'API error: 400')):
+            self.http.request.return_value = make_response(status_code)
+            with self.assertRaisesMessage(WeatherAPIException, message):
+                self.service.get_current_weather('Oslo', 'NO')
+        self.assertEqual(self.get_failures(), 0)
+
+    def test_server_errors_and_timeouts_count(self):
+        self.http.request.return_value = make_response(502)
+        with self.assertRaisesMessage(WeatherAPIException, 'API error: 502'):
+            self.service.get_current_weather('Oslo', 'NO')
+        self.http.request.side_effect = requests.exceptions.Timeout()
+        with self.assertRaisesMessage(WeatherAPIException, 'Request timeout'):
+            self.service.get_current_weather('Oslo', 'NO')
+        self.assertEqual(self.get_failures(), 2)
+
+    def test_probe_is_released_when_quota_is_exhausted(self):
+        for _ in range(10):
+            self.breaker.record_failure()
+        cache.set(self.breaker.state_key, {'state': OPEN, 'since': self.breaker._get_state()['since'] - 30}, None)
+        with mock.patch('weather.services.rate_limiter.acquire', return_value=False):
+            with self.assertRaisesMessage(WeatherAPIException, 'local quota'):
+                self.service.get_current_weather('Oslo', 'NO')
+        self.http.request.assert_not_called()
+        self.assertTrue(self.breaker.allow_request())
+
+
+@override_settings(CACHES=TEST_CACHES, WEATHER_READ_FLUSH_INTERVAL=10)
+class ReadCounterTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.clock = FakeClock()
+        patcher = mock.patch('weather.reads.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.counter = ReadCounter()
+
+    def test_reads_are_flushed_in_batches(self):
+        self.counter.record(1)
+        self.assertEqual(cache.get(self.counter.get_key(1)), 1)
+        self.counter.record(1, 2)
+        self.counter.record(1)
+        self.assertEqual(cache.get(self.counter.get_key(1)), 1)
+        self.assertIsNone(cache.get(self.counter.get_key(2)))
+        self.clock.now += 10
+        self.counter.record(2)
+        self.assertEqual(cache.get(self.counter.get_key(1)), 3)
+        self.assertEqual(cache.get(self.counter.get_key(2)), 2)
+
+
+@override_settings(CACHES=TEST_CACHES, WEATHER_CACHE_DURATION=600, WEATHER_REFRESH_LEAD_TIME=300)
+class RefreshSchedulerTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.weather_stale = City.objects.create(name='Oslo', country_code='NO', openweather_id=1)
+        cls.forecast_stale = City.objects.create(name='Bergen', country_code='NO', openweather_id=2)
+        cls.fresh = City.objects.create(name='Tromso', country_code='NO', openweather_id=3)
+        for city, weather_age, forecast_age in (
+            (cls.weather_stale, 400, 0), (cls.forecast_stale, 0, 400), (cls.fresh, 0, 0)
+        ):
+            weather = create_weather(city)
+            WeatherData.objects.filter(pk=weather.pk).update(cached_at=now - timedelta(seconds=weather_age))
+            ForecastData.objects.create(
+                city=city, forecast_date=now, temperature_min=1, temperature_max=2, temperature_day=2,
+                temperature_night=1, humidity=50, pressure=1000, weather_main='Clear',
+                weather_description='x', weather_icon='01d', wind_speed=1, wind_direction=0
+            )
+            ForecastData.objects.filter(city=city).update(cached_at=now - timedelta(seconds=forecast_age))
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch('weather.scheduler.time.sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.scheduler = RefreshScheduler(rate_limit=60)
+        self.service = mock.Mock()
+        self.service.openweather_service.group_size = 20
+        self.service.refresh_current_weather_bulk.side_effect = lambda cities: ([city.id for city in cities], {})
+        self.scheduler.weather_service = self.service
+
+    def test_refreshes_only_what_is_due(self):
+        self.assertEqual(self.scheduler.run_cycle(), 2)
+        self.service.refresh_current_weather_bulk.assert_called_once()
+        weather_cities = self.service.refresh_current_weather_bulk.call_args.args[0]
+        self.assertEqual([city.id for city in weather_cities], [self.weather_stale.id])
+        self.service.refresh_forecast.assert_called_once()
+        self.assertEqual(self.service.refresh_forecast.call_args.args[0].id, self.forecast_stale.id)
+
+    def test_paces_one_call_per_group(self):
+        cities = list(City.objects.all())
+        cities[0].openweather_id = None
+        self.scheduler.refresh_current_weather(cities)
+        # One group call for the two cities with an upstream ID, one call for the other
+        self.assertEqual(self.service.refresh_current_weather_bulk.call_count, 2)
+        self.assertEqual(self.sleep.call_count, 2)
+        for call in self.sleep.call_args_list:
+            self.assertLessEqual(call.args[0], 1.0)
+
+
+@override_settings(CACHES=TEST_CACHES, WEATHER_FETCH_WAIT_TIMEOUT=5, WEATHER_FETCH_POLL_INTERVAL=0)
+class SingleFlightTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.single_flight = SingleFlight()
+        self.lock_key = self.single_flight._get_lock_key('city')
+
+    def run_concurrently(self, fetch, count=4):
+        """Call do() from count threads while the first one is inside fetch(); return results and errors"""
+        release = threading.Event()
+        results, errors = [], []
+
+        def blocking_fetch():
+            release.wait(5)
+            return fetch()
+
+        def call():
+            try:
+                results.append(self.single_flight.do('city', blocking_fetch, lambda: None))
+            except Exception as e:
+                errors.append(e)
+
+        with self.assertLogs('weather_api', 'INFO') as logs:
+            threads = [threading.Thread(target=call) for _ in range(count)]
+            threads[0].start()
+            while 'city' not in self.single_flight._calls:
+                time.sleep(0.001)
+            for thread in threads[1:]:
+                thread.start()
+            # Release the leader once every other thread waits on it
+            while sum('Waiting for in-flight' in line for line in logs.output) < count - 1:
+                time.sleep(0.001)
+            release.set()
+            for thread in threads:
+                thread.join(5)
+        return results, errors
+
+    def test_waiters_share_the_leaders_result(self):
+        fetch = mock.Mock(return_value='weather')
+        results, errors = self.run_concurrently(fetch)
+        self.assertEqual(results, ['weather'] * 4)
+        self.assertEqual(errors, [])
+        fetch.assert_called_once()
+        self.assertIsNone(cache.get(self.lock_key))
+        self.assertEqual(self.single_flight._calls, {})
+
+    def test_waiters_get_the_leaders_error(self):
+        fetch = mock.Mock(side_effect=WeatherAPIException("City not found"))
+        results, errors = self.run_concurrently(fetch)
+        self.assertEqual(results, [])
+        self.assertEqual([str(e) for e in errors], ["City not found"] * 4)
+        fetch.assert_called_once()
+
+    def test_polls_for_result_of_other_worker(self):
+        cache.set(self.lock_key, 'other worker', 60)
+        fetch = mock.Mock()
+        peek = mock.Mock(side_effect=[None, None, 'published'])
+        self.assertEqual(self.single_flight.do('city', fetch, peek), 'published')
+        fetch.assert_not_called()
+        self.assertEqual(cache.get(self.lock_key), 'other worker')
+
+    def test_takes_over_an_expired_lock(self):
+        cache.set(self.lock_key, 'crashed worker', 60)
+
+        def peek():
+            # The other worker's lock expires without a result being published
+            cache.delete(self.lock_key)
+
+        fetch = mock.Mock(side_effect=lambda: cache.get(self.lock_key))
+        result = self.single_flight.do('city', fetch, peek)
+        fetch.assert_called_once()
+        # fetch ran while holding a lock of its own
+        self.assertNotIn(result, (None, 'crashed worker'))
+        self.assertIsNone(cache.get(self.lock_key))
+
+    @override_settings(WEATHER_FETCH_WAIT_TIMEOUT=0)
+    def test_fetches_uncoordinated_when_lock_stays_held(self):
+        cache.set(self.lock_key, 'stuck worker', 60)
+        fetch = mock.Mock(return_value='weather')
+        self.assertEqual(self.single_flight.do('city', fetch, lambda: None), 'weather')
+        self.assertEqual(cache.get(self.lock_key), 'stuck worker')
+
+
+@override_settings(CACHES=TEST_CACHES, WEATHER_FETCH_WAIT_TIMEOUT=5, WEATHER_FETCH_POLL_INTERVAL=0)
+class BackgroundRefreshTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.lock_key = SingleFlight()._get_lock_key('city')
+
+    def test_refuses_duplicate_background_refreshes(self):
+        single_flight = SingleFlight()
+        release = threading.Event()
+        fetch = mock.Mock(side_effect=lambda: release.wait(5))
+        self.assertTrue(single_flight.do_in_background('city', fetch))
+        self.assertFalse(single_flight.do_in_background('city', fetch))
+        # Another worker sees the shared lock
+        self.assertFalse(SingleFlight().do_in_background('city', fetch))
+
+        release.set()
+        while 'city' in single_flight._calls:
+            time.sleep(0.001)
+        fetch.assert_called_once()
+        self.assertIsNone(cache.get(self.lock_key))
+        self.assertTrue(single_flight.do_in_background('city', lambda: None))
+
+    def test_async_waiter_retries_after_background_refresh_gives_up(self):
+        # Another worker is refreshing, so the background refresh returns None
+        cache.set(self.lock_key, 'other worker', 60)
+        single_flight = AsyncSingleFlight()
+        fetch = mock.AsyncMock(return_value='fetched')
+        peek = mock.AsyncMock(return_value='published')
+
+        async def scenario():
+            self.assertTrue(single_flight.do_in_background('city', fetch))
+            return await single_flight.do('city', fetch, peek)
+
+        self.assertEqual(asyncio.run(scenario()), 'published')
+        fetch.assert_not_awaited()
+        peek.assert_awaited()
+        self.assertEqual(single_flight._calls, {})
+
+
+@override_settings(
+    CACHES=TEST_CACHES, CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    WEATHER_LIVE_MAX_SUBSCRIPTIONS=3,
+)
+class WeatherUpdatesConsumerTests(TestCase):
+    """ws/weather/ as weather_backend.asgi serves it outside DEBUG"""
+    origin = 'http://localhost:3000'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.oslo = City.objects.create(name='Oslo', country_code='NO')
+        cls.bergen = City.objects.create(name='Bergen', country_code='NO')
+
+    def get_application(self):
+        return OriginValidator(
+            URLRouter(websocket_urlpatterns), settings.CORS_ALLOWED_ORIGINS + settings.ALLOWED_HOSTS
+        )
+
+    async def connect(self, origin=None):
+        communicator = WebsocketCommunicator(
+            self.get_application(), '/ws/weather/', headers=[(b'origin', (origin or self.origin).encode())]
+        )
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    def weather_message(self, city, temperature):
+        return {'type': 'weather', 'city_id': city.id, 'unit': 'C', 'cached_at': None,
+                'changes': {'temperature': temperature}}
+
+    async def test_rejects_unknown_origin(self):
+        communicator = WebsocketCommunicator(
+            self.get_application(), '/ws/weather/', headers=[(b'origin', b'https://evil.example')]
+        )
+        connected, _ = await communicator.connect()
+        self.assertFalse(connected)
+
+    async def test_subscribe_and_unsubscribe(self):
+        communicator = await self.connect()
+        await communicator.send_json_to({'action': 'subscribe', 'city_ids': [self.oslo.id, self.bergen.id, 999]})
+        response = await communicator.receive_json_from()
+        self.assertEqual(response, {
+            'type': 'subscriptions', 'city_ids': sorted([self.oslo.id, self.bergen.id]), 'unit': 'C'
+        })
+
+        await communicator.send_json_to({'action': 'unsubscribe', 'city_ids': [self.oslo.id]})
+        response = await communicator.receive_json_from()
+        self.assertEqual(response['city_ids'], [self.bergen.id])
+
+        await sync_to_async(publish)(self.oslo.id, self.weather_message(self.oslo, 10))
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+    async def test_invalid_messages(self):
+        communicator = await self.connect()
+        for message in (
+            {'action': 'follow', 'city_ids': [1]},
+            {'action': 'subscribe', 'city_ids': 'all'},
+            {'action': 'subscribe', 'city_ids': [1], 'unit': 'K'},
+            {'action': 'subscribe', 'city_ids': [1, 2, 3, 4]},
+        ):
+            await communicator.send_json_to(message)
+            response = await communicator.receive_json_from()
+            self.assertEqual(response['type'], 'error', message)
+        await communicator.disconnect()
+
+    async def test_publish_fans_out_to_subscribers(self):
+        celsius = await self.connect()
+        fahrenheit = await self.connect()
+        other = await self.connect()
+        await celsius.send_json_to({'action': 'subscribe', 'city_ids': [self.oslo.id]})
+        await fahrenheit.send_json_to({'action': 'subscribe', 'city_ids': [self.oslo.id], 'unit': 'F'})
+        await other.send_json_to({'action': 'subscribe', 'city_ids': [self.bergen.id]})
+        for communicator in (celsius, fahrenheit, other):
+            await communicator.receive_json_from()
+
+        await sync_to_async(publish)(self.oslo.id, self.weather_message(self.oslo, 100))
+        self.assertEqual((await celsius.receive_json_from())['changes'], {'temperature': 100})
+        message = await fahrenheit.receive_json_from()
+        self.assertEqual((message['unit'], message['changes']), ('F', {'temperature': 212}))
+        self.assertTrue(await other.receive_nothing())
+        for communicator in (celsius, fahrenheit, other):
+            await communicator.disconnect()
+
+
+class ProviderTests(SimpleTestCase):
+
+    def test_provider_must_implement_the_api(self):
+        class GeocodeOnly(WeatherProvider):
+            def geocode(self, city_name, country_code):
+                return []
+
+        with self.assertRaises(TypeError):
+            GeocodeOnly()
+
+    def test_http_session_is_not_shared_after_fork(self):
+        service = OpenWeatherMapService()
+        session = service.http
+        self.assertIs(service.http, session)
+        with mock.patch('weather.services.os.getpid', return_value=session.pid + 1):
+            forked = service.http
+        self.assertIsNot(forked, session)
+        self.assertIs(PooledHTTPSession._instance, forked)
+
+
+class RowSerializerTests(TestCase):
+    """The values_list() fast path must render exactly what the ModelSerializers render"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.oslo = City.objects.create(name='Oslo', country_code='NO', latitude=59.9139, longitude=10)
+        cls.nowhere = City.objects.create(name='Nowhere', country_code='ZZ')
+        create_weather(cls.oslo, temperature=-3.25, pressure=1013, wind_speed=0, visibility=9000, uv_index=2.5)
+        create_weather(cls.nowhere, temperature=21, feels_like=20.5)
+        # Microseconds and a non-zero offset on input must come out as DRF formats them
+        WeatherData.objects.filter(city=cls.oslo).update(
+            cached_at=datetime(2026, 3, 1, 12, 30, 15, 123456, tzinfo=dt_timezone(timedelta(hours=1)))
+        )
+        for city in (cls.oslo, cls.nowhere):
+            ForecastData.objects.create(
+                city=city, forecast_date=datetime(2026, 3, 2, 23, tzinfo=dt_timezone.utc), temperature_min=-1.5,
+                temperature_max=4, temperature_day=3.75, temperature_night=-0.5, humidity=80, pressure=1008.4,
+                weather_main='Snow', weather_description='light snow', weather_icon='13d', wind_speed=5,
+                wind_direction=270
+            )
+
+    def assertSameJSON(self, rows, model_serializer, queryset):
+        expected = model_serializer(queryset, many=True).data
+        self.assertEqual(JSONRenderer().render(rows), JSONRenderer().render(expected))
+
+    def test_weather_rows_match_weather_data_serializer(self):
+        queryset = WeatherData.objects.select_related('city').order_by('id')
+        self.assertSameJSON(weather_row_serializer.serialize(queryset), WeatherDataSerializer, queryset)
+
+    def test_forecast_rows_match_forecast_data_serializer(self):
+        queryset = ForecastData.objects.select_related('city').order_by('id')
+        self.assertSameJSON(forecast_row_serializer.serialize(queryset), ForecastDataSerializer, queryset)
+
+    def test_flat_shape_lists_the_same_cities(self):
+        queryset = WeatherData.objects.select_related('city').order_by('id')
+        flat = weather_row_serializer.serialize(queryset, flat=True)
+        nested = weather_row_serializer.serialize(queryset)
+        self.assertEqual(flat['cities'], [row['city'] for row in nested])
+        self.assertEqual([row['city'] for row in flat['results']], [city['id'] for city in flat['cities']])
+
+
+@override_settings(**REPLAY_PROVIDER)
+class ReplayProviderTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        recordings = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+        with recordings:
+            json.dump({
+                'weather:London,GB': {'name': 'London', 'main': {'temp': 12.5}},
+                'forecast:Atlantis,GR': None,
+            }, recordings)
+        cls.recordings = recordings.name
+        cls.addClassCleanup(os.remove, recordings.name)
+
+    def get_outcomes(self, provider, calls=20):
+        """(delay, error) of each call, with sleeping recorded instead of done"""
+        outcomes = []
+        with mock.patch('weather.replay.time.sleep') as sleep:
+            for _ in range(calls):
+                try:
+                    provider.get_current_weather('Oslo', 'NO')
+                    error = None
+                except WeatherAPIException as e:
+                    error = str(e)
+                outcomes.append((sleep.call_args.args[0], error))
+        return outcomes
+
+    def test_recorded_responses(self):
+        provider = ReplayWeatherProvider(recordings=self.recordings)
+        self.assertEqual(provider.get_current_weather('London', 'GB')['main']['temp'], 12.5)
+        with self.assertRaisesMessage(WeatherAPIException, "City not found"):
+            provider.get_forecast('Atlantis', 'GR')
+        # Anything else is synthesized, the same way every time
+        paris = provider.get_current_weather('Paris', 'FR')
+        self.assertEqual(paris['main'], ReplayWeatherProvider().get_current_weather('Paris', 'FR')['main'])
+        self.assertEqual(len(provider.get_forecast('Paris', 'FR')['list']), 40)
+        self.assertEqual(provider.calls, 4)
+
+    def test_seed_fixes_latency_and_errors(self):
+        options = {'latency': 0.01, 'jitter': 0.05, 'error_rate': 0.5}
+        first = self.get_outcomes(ReplayWeatherProvider(seed=1, **options))
+        self.assertEqual(first, self.get_outcomes(ReplayWeatherProvider(seed=1, **options)))
+        self.assertNotEqual(first, self.get_outcomes(ReplayWeatherProvider(seed=2, **options)))
+        self.assertTrue(all(0.01 <= delay <= 0.06 for delay, error in first))
+        errors = {error for delay, error in first if error}
+        self.assertTrue(errors)
+        self.assertLessEqual(errors, set(INJECTED_ERRORS))
+
+    async def test_async_provider(self):
+        provider = AsyncReplayWeatherProvider(recordings=self.recordings, latency=0.2)
+        with mock.patch('weather.replay.asyncio.sleep') as sleep:
+            weather = await provider.get_current_weather('London', 'GB')
+            with self.assertRaisesMessage(WeatherAPIException, "City not found"):
+                await provider.get_forecast('Atlantis', 'GR')
+        self.assertEqual(weather['name'], 'London')
+        sleep.assert_called_with(0.2)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cities = [City.objects.create(name=f"City {i}", country_code='GB') for i in range(7)]
+        for i, city in enumerate(cities):
+            weather = create_weather(city)
+            # Two rows share a timestamp, so the id breaks the tie
+            WeatherData.objects.filter(pk=weather.pk).update(cached_at=now - timedelta(minutes=min(i, 5)))
+        cls.expected = list(WeatherData.objects.order_by('-cached_at', '-id').values_list('id', flat=True))
+
+    def test_pages_follow_the_key_with_one_query_each(self):
+        seen = []
+        url = '/api/weather/?page_size=3&fields=id'
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            weather_queries = [query for query in queries if 'weather_weatherdata' in query['sql']]
+            self.assertEqual(len(weather_queries), 1, weather_queries)
+            seen.extend(row['id'] for row in response.json()['results'])
+            url = response.json()['next']
+        self.assertEqual(seen, self.expected)
+
+    def test_last_full_page_has_no_next_link(self):
+        response = self.client.get('/api/weather/?page_size=7&shape=flat')
+        self.assertIsNone(response.json()['next'])
+        self.assertEqual(len(response.json()['results']), 7)
+        self.assertEqual(len(response.json()['cities']), 7)
+
+    def test_invalid_cursor_is_a_bad_request(self):
+        for cursor in ('garbage', 'eyJ2IjogIm5vdCBhIGRhdGUiLCAiaWQiOiAxfQ=='):
+            response = self.client.get(f'/api/weather/?cursor={cursor}')
+            self.assertEqual(response.status_code, 400, cursor)
+            self.assertIn('cursor', response.json())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class FavoritesInvalidationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.favorites = FavoritesService()
+        self.oslo = City.objects.create(name='Oslo', country_code='NO')
+        self.bergen = City.objects.create(name='Bergen', country_code='NO')
+        self.favorites.add('a' * 32, [self.oslo.id, self.bergen.id])
+        self.favorites.add('b' * 32, [self.bergen.id])
+        for session_key in ('a' * 32, 'b' * 32):
+            self.favorites.get_city_ids(session_key)
+
+    def test_deleting_a_city_drops_it_from_cached_favorites(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bergen.delete()
+        self.assertEqual(self.favorites.get_city_ids('a' * 32), [self.oslo.id])
+        self.assertEqual(self.favorites.get_city_ids('b' * 32), [])
+
+    def test_deleting_a_preference_drops_its_cached_favorites(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            UserPreference.objects.filter(session_key='a' * 32).delete()
+        self.assertEqual(self.favorites.get_city_ids('a' * 32), [])
+        self.assertEqual(self.favorites.get_city_ids('b' * 32), [self.bergen.id])
+
+
+@override_settings(CACHES=TEST_CACHES, **REPLAY_PROVIDER)
+class BulkRefreshTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.grouped = [City.objects.create(name=f"City {i}", country_code='NO', openweather_id=i) for i in range(1, 6)]
+        cls.by_name = City.objects.create(name='Oslo', country_code='NO')
+
+    def setUp(self):
+        cache.clear()
+        self.provider = ReplayWeatherProvider()
+        self.provider.group_size = 2
+        self.service = WeatherCacheService(provider=self.provider)
+        for city in [*self.grouped, self.by_name]:
+            self.service.cache_payload('weather', city.id, {'temperature': 0}, timezone.now())
+
+    def get_group(self, openweather_ids):
+        # Upstream leaves out IDs it does not know
+        return {'list': [self.provider.synthesize_current(i) for i in openweather_ids if i != 4]}
+
+    def test_refreshes_in_groups_and_reports_missing_cities(self):
+        with mock.patch.object(self.provider, 'get_current_weather_group', side_effect=self.get_group) as group, \
+                mock.patch.object(cache, 'delete_many', wraps=cache.delete_many) as delete_many:
+            refreshed, errors = self.service.refresh_current_weather_bulk([*self.grouped, self.by_name])
+
+        self.assertEqual([call.args[0] for call in group.call_args_list], [[1, 2], [3, 4], [5]])
+        missing = self.grouped[3]
+        self.assertCountEqual(refreshed, [city.id for city in [*self.grouped, self.by_name] if city != missing])
+        self.assertEqual(list(errors), [missing.id])
+        self.assertEqual(str(errors[missing.id]), "City not found")
+
+        # Each group drops the payloads of its own cities only
+        group_deletes = [call.args[0] for call in delete_many.call_args_list][:3]
+        self.assertEqual([len(keys) for keys in group_deletes], [4, 2, 2])
+        for city in [*self.grouped, self.by_name]:
+            payload = self.service.get_cached_payload('weather', city.id)
+            if city == missing:
+                self.assertIsNotNone(payload)
+                self.assertFalse(WeatherData.objects.filter(city=city).exists())
+            else:
+                self.assertIsNone(payload)
+                self.assertEqual(cache.get(f"weather_current_{city.id}"), WeatherData.objects.get(city=city))
+
+
+@override_settings(CACHES=TEST_CACHES, WEATHER_GEOCODING_NOT_FOUND_TTL=3600, **REPLAY_PROVIDER)
+class GeocodingTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.provider = get_provider()
+        self.geocoding = GeocodingService()
+
+    def spy(self, method, **kwargs):
+        return mock.patch.object(self.provider, method, **({'wraps': getattr(self.provider, method)} | kwargs))
+
+    def add_city(self, name='Oslo'):
+        return self.client.post('/api/cities/', {'name': name, 'country_code': 'no'}, content_type='application/json')
+
+    def test_resolve_geocodes_each_name_once(self):
+        with self.spy('geocode') as geocode:
+            first = self.geocoding.resolve('Oslo', 'NO')
+            second = self.geocoding.resolve(' oslo ', 'no')
+        self.assertEqual(geocode.call_count, 1)
+        self.assertTrue(first.found)
+        self.assertEqual((second.latitude, second.longitude), (first.latitude, first.longitude))
+
+    def test_not_found_expires(self):
+        with self.spy('geocode', return_value=[]) as geocode:
+            for _ in range(2):
+                with self.assertRaisesMessage(WeatherAPIException, "City not found"):
+                    self.geocoding.resolve('Atlantis', 'GR')
+        self.assertEqual(geocode.call_count, 1)
+
+        GeocodingResult.objects.update(created_at=timezone.now() - timedelta(hours=2))
+        self.assertIsNone(self.geocoding.get_cached('Atlantis', 'GR'))
+        self.assertTrue(self.geocoding.resolve('Atlantis', 'GR').found)
+
+    def test_adding_a_city_takes_one_upstream_call(self):
+        with self.spy('geocode') as geocode, self.spy('get_current_weather') as get_weather:
+            self.assertEqual(self.add_city().status_code, 201)
+        geocode.assert_not_called()
+        get_weather.assert_called_once_with('Oslo', 'NO', None, None)
+        city = City.objects.get(name='Oslo')
+        result = self.geocoding.get_cached('Oslo', 'NO')
+        self.assertEqual((result.latitude, result.longitude), (city.latitude, city.longitude))
+
+    def test_cached_location_is_used_for_the_weather_query(self):
+        self.geocoding.remember('oslo', 'NO', 59.9, 10.7)
+        with self.spy('get_current_weather') as get_weather:
+            self.assertEqual(self.add_city().status_code, 201)
+        get_weather.assert_called_once_with('Oslo', 'NO', 59.9, 10.7)
+
+    def test_city_not_found_upstream_is_rejected_from_the_cache(self):
+        with self.spy('get_current_weather', side_effect=WeatherAPIException("City not found")) as get_weather:
+            self.assertEqual(self.add_city('Atlantis').status_code, 404)
+            self.assertEqual(self.add_city('Atlantis').status_code, 404)
+        self.assertEqual(get_weather.call_count, 1)
+        self.assertFalse(City.objects.filter(name='Atlantis').exists())
+
+
+@override_settings(CACHES=TEST_CACHES, **REPLAY_PROVIDER)
+class FavoritesApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.oslo = City.objects.create(name='Oslo', country_code='NO')
+        cls.bergen = City.objects.create(name='Bergen', country_code='NO')
+        create_weather(cls.oslo, temperature=10)
+        create_weather(cls.bergen, temperature=20)
+
+    def setUp(self):
+        cache.clear()
+
+    def post(self, action, data):
+        return self.client.post(f'/api/preferences/{action}/', data, content_type='application/json')
+
+    def get_favorites(self):
+        return self.client.get('/api/preferences/favorites/').json()['city_ids']
+
+    def test_add_list_and_remove(self):
+        self.assertEqual(self.get_favorites(), [])
+        response = self.post('add_favorite_city', {'city_id': self.bergen.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([city['id'] for city in response.json()['favorite_cities']], [self.bergen.id])
+        self.assertEqual(self.get_favorites(), [self.bergen.id])
+
+        self.post('add_favorite_city', {'city_ids': [self.oslo.id, self.bergen.id]})
+        self.assertEqual(self.get_favorites(), sorted([self.oslo.id, self.bergen.id]))
+
+        response = self.post('remove_favorite_city', {'city_id': self.bergen.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_favorites(), [self.oslo.id])
+        self.assertEqual(self.post('remove_favorite_city', {'city_id': self.bergen.id}).status_code, 404)
+
+    def test_adding_a_favorite_twice(self):
+        self.post('add_favorite_city', {'city_id': self.oslo.id})
+        response = self.post('add_favorite_city', {'city_id': self.oslo.id})
+        self.assertEqual(response.json(), {'message': 'City is already in favorites'})
+        self.assertEqual(UserPreference.favorite_cities.through.objects.count(), 1)
+
+    def test_unknown_city(self):
+        self.assertEqual(self.post('add_favorite_city', {'city_id': 999}).status_code, 404)
+        response = self.post('add_favorite_city', {'city_ids': [999, self.oslo.id]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_favorites(), [self.oslo.id])
+        self.assertEqual(self.post('add_favorite_city', {'city_ids': ['x']}).status_code, 400)
+
+    def test_remove_without_session(self):
+        self.assertEqual(self.post('remove_favorite_city', {'city_id': self.oslo.id}).status_code, 400)
+
+    def test_favorites_weather_uses_the_batch_response(self):
+        self.post('add_favorite_city', {'city_ids': [self.oslo.id, self.bergen.id]})
+        with mock.patch('weather.views._batch_weather_response', wraps=views._batch_weather_response) as batch:
+            response = self.client.get('/api/preferences/favorites_weather/?unit=F')
+        batch.assert_called_once()
+        self.assertEqual(batch.call_args.args[1], sorted([self.oslo.id, self.bergen.id]))
+        self.assertEqual(response['X-Temperature-Unit'], 'F')
+        temperatures = {row['city']['id']: row['temperature'] for row in response.json()['results']}
+        self.assertEqual(temperatures, {self.oslo.id: 50, self.bergen.id: 68})
+        self.assertEqual(response.json()['errors'], [])
+
+
+@override_settings(CACHES=TEST_CACHES, WEATHER_CACHE_DURATION=1800, WEATHER_STALE_GRACE_PERIOD=900, **REPLAY_PROVIDER)
+class StaleWhileRevalidateTests(TransactionTestCase):
+    """Current weather is served from fresh or recently expired rows, refreshing the latter in the background"""
+
+    def setUp(self):
+        cache.clear()
+        self.provider = get_provider()
+        self.initial_calls = self.provider.calls
+        self.fresh = City.objects.create(name='Oslo', country_code='NO', latitude=59.9, longitude=10.7)
+        self.stale = City.objects.create(name='Bergen', country_code='NO', latitude=60.4, longitude=5.3)
+        self.expired = City.objects.create(name='Tromso', country_code='NO', latitude=69.6, longitude=18.9)
+        for city, age in ((self.fresh, 60), (self.stale, 1900), (self.expired, 2800)):
+            create_weather(city, temperature=99)
+            set_age(WeatherData.objects.filter(city=city), age)
+
+    def wait_for_refreshes(self):
+        deadline = time.monotonic() + 5
+        while single_flight._calls and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def get_temperature(self, city):
+        return WeatherData.objects.get(city=city).temperature
+
+    def get_upstream_calls(self):
+        return self.provider.calls - self.initial_calls
+
+    def test_fresh_row_is_served_without_upstream_call(self):
+        response = self.client.get(f'/api/cities/{self.fresh.id}/weather/')
+        self.assertEqual(response.json()['temperature'], 99)
+        self.assertEqual(self.get_upstream_calls(), 0)
+
+    def test_stale_row_is_served_while_refreshing(self):
+        response = self.client.get(f'/api/cities/{self.stale.id}/weather/')
+        self.assertEqual(response.json()['temperature'], 99)
+        self.wait_for_refreshes()
+        self.assertEqual(self.get_upstream_calls(), 1)
+        self.assertNotEqual(self.get_temperature(self.stale), 99)
+        self.assertTrue(WeatherData.objects.get(city=self.stale).is_cache_valid())
+
+    def test_row_past_grace_period_is_refetched(self):
+        response = self.client.get(f'/api/cities/{self.expired.id}/weather/')
+        self.assertNotEqual(response.json()['temperature'], 99)
+        self.assertEqual(response.json()['temperature'], self.get_temperature(self.expired))
+
+    def get_batch(self, *cities):
+        ids = ','.join(str(getattr(city, 'id', city)) for city in cities)
+        response = self.client.get(f'/api/weather/batch/?ids={ids}')
+        self.assertEqual(response.status_code, 200)
+        return {row['city']['id']: row['temperature'] for row in response.json()['results']}, response.json()['errors']
+
+    def test_batch_serves_fresh_rows_and_fetches_expired_ones(self):
+        temperatures, errors = self.get_batch(self.expired, self.fresh, 999)
+        self.assertEqual(list(temperatures), [self.expired.id, self.fresh.id])
+        self.assertEqual(temperatures[self.fresh.id], 99)
+        self.assertEqual(temperatures[self.expired.id], self.get_temperature(self.expired))
+        self.assertNotEqual(temperatures[self.expired.id], 99)
+        self.assertEqual(errors, [{'city_id': 999, 'error': 'City not found', 'code': 'CITY_NOT_FOUND'}])
+        self.assertEqual(self.get_upstream_calls(), 1)
+
+    def test_batch_serves_stale_rows_while_refreshing(self):
+        # Separate from the expired city: SQLite test databases lock on concurrent writers
+        temperatures, errors = self.get_batch(self.stale, self.fresh)
+        self.assertEqual(temperatures, {self.stale.id: 99, self.fresh.id: 99})
+        self.wait_for_refreshes()
+        self.assertEqual(self.get_upstream_calls(), 1)
+        self.assertNotEqual(self.get_temperature(self.stale), 99)
+
+    def test_batch_validates_ids(self):
+        self.assertEqual(self.client.get('/api/weather/batch/').status_code, 400)
+        self.assertEqual(self.client.get('/api/weather/batch/?ids=1,x').status_code, 400)
+
+
+@override_settings(CACHES=TEST_CACHES, **REPLAY_PROVIDER)
+class PayloadCacheTests(TestCase):
+    """Rendered weather and forecast responses are cached per unit and dropped on every write"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.city = City.objects.create(name='Oslo', country_code='NO', latitude=59.9, longitude=10.7)
+
+    def setUp(self):
+        cache.clear()
+        self.service = WeatherCacheService()
+        self.url = f'/api/cities/{self.city.id}/weather/'
+
+    def test_cached_payload_is_served_without_queries(self):
+        create_weather(self.city, temperature=20)
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_payloads_are_cached_per_unit(self):
+        create_weather(self.city, temperature=20)
+        self.assertEqual(self.client.get(self.url).json()['temperature'], 20)
+        self.assertEqual(self.client.get(f'{self.url}?unit=F').json()['temperature'], 68)
+        self.assertEqual(self.service.get_cached_payload('weather', self.city.id, 'C')['unit'], 'C')
+        self.assertEqual(self.service.get_cached_payload('weather', self.city.id, 'F')['unit'], 'F')
+
+    def test_weather_write_drops_payloads_of_every_unit(self):
+        create_weather(self.city, temperature=20)
+        self.client.get(self.url)
+        self.client.get(f'{self.url}?unit=F')
+
+        fresh = self.service.refresh_current_weather(self.city)
+        for unit in ('C', 'F'):
+            self.assertIsNone(self.service.get_cached_payload('weather', self.city.id, unit))
+        self.assertEqual(self.client.get(self.url).json()['temperature'], fresh.temperature)
+
+    def test_forecast_write_drops_the_forecast_payload(self):
+        url = f'/api/cities/{self.city.id}/forecast/'
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertIsNotNone(self.service.get_cached_payload('forecast', self.city.id))
+
+        set_age(ForecastData.objects.filter(city=self.city), 60)
+        self.service.refresh_forecast(self.city)
+        self.assertIsNone(self.service.get_cached_payload('forecast', self.city.id))
+        self.assertNotEqual(self.client.get(url)['ETag'], first['ETag'])
+
+    def test_expired_data_is_not_cached(self):
+        create_weather(self.city, temperature=20)
+        weather = WeatherData.objects.get(city=self.city)
+        self.service.cache_payload('weather', self.city.id, {'temperature': 20}, weather.cached_at - timedelta(hours=1))
+        self.assertIsNone(self.service.get_cached_payload('weather', self.city.id))
+
+
+@override_settings(CACHES=TEST_CACHES, **REPLAY_PROVIDER)
+class StoreForecastTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.city = City.objects.create(name='Oslo', country_code='NO')
+
+    def setUp(self):
+        cache.clear()
+        self.service = WeatherCacheService()
+        self.first_day = datetime(2026, 3, 1, tzinfo=dt_timezone.utc)
+
+    def store(self, days, temperature):
+        """Store a forecast with one midday slot on each of the given days after first_day"""
+        return self.service._store_forecast(self.city, {
+            'list': [forecast_item(self.first_day + timedelta(days=day, hours=12), temperature) for day in days],
+            'city': {'timezone': 0},
+        })
+
+    def get_rows(self):
+        return {
+            (forecast.forecast_date - self.first_day).days: forecast
+            for forecast in ForecastData.objects.filter(city=self.city)
+        }
+
+    def test_second_store_upserts_overlapping_days_and_prunes_the_rest(self):
+        self.store([0, 1, 2], temperature=1)
+        first_ids = {day: forecast.id for day, forecast in self.get_rows().items()}
+
+        stored = self.store([1, 2, 3], temperature=5)
+        rows = self.get_rows()
+        self.assertEqual(sorted(rows), [1, 2, 3])
+        self.assertEqual(len(stored), 3)
+        self.assertEqual(ForecastData.objects.filter(city=self.city).count(), 3)
+        self.assertEqual(ForecastData.objects.filter(city=self.city).values('forecast_date').distinct().count(), 3)
+        # Overlapping days are updated in place
+        self.assertEqual((rows[1].id, rows[2].id), (first_ids[1], first_ids[2]))
+        self.assertTrue(all(forecast.temperature_day == 5 for forecast in rows.values()))
+
+    def test_failed_store_leaves_the_previous_forecast(self):
+        self.store([0, 1, 2], temperature=1)
+        with mock.patch.object(ForecastSeries.objects, 'update_or_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.store([1, 2, 3], temperature=5)
+        rows = self.get_rows()
+        self.assertEqual(sorted(rows), [0, 1, 2])
+        self.assertTrue(all(forecast.temperature_day == 1 for forecast in rows.values()))
+
+
+@override_settings(CACHES=TEST_CACHES, WEATHER_CACHE_DURATION=1800, **REPLAY_PROVIDER)
+class ConditionalGetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.city = City.objects.create(name='Oslo', country_code='NO', latitude=59.9, longitude=10.7)
+        create_weather(cls.city, temperature=20)
+        cls.url = f'/api/cities/{cls.city.id}/weather/'
+
+    def setUp(self):
+        cache.clear()
+
+    def test_responses_carry_validators(self):
+        response = self.client.get(self.url)
+        cached_at = WeatherData.objects.get(city=self.city).cached_at
+        self.assertEqual(response['ETag'], f'"weather-{self.city.id}-{int(cached_at.timestamp() * 1000000)}-C"')
+        self.assertIn('Last-Modified', response)
+        self.assertRegex(response['Cache-Control'], r'max-age=(17\d\d|1800)')
+
+    def test_matching_etag_is_not_modified_from_payload_cache_and_db(self):
+        etag = self.client.get(self.url)['ETag']
+        # Once with the payload cached, once through the database path
+        for clear in (False, True):
+            if clear:
+                cache.clear()
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b'')
+            self.assertEqual(response['ETag'], etag)
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get(self.url)['Last-Modified']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        self.assertEqual(
+            self.client.get(self.url, HTTP_IF_MODIFIED_SINCE='Mon, 01 Jan 2001 00:00:00 GMT').status_code, 200
+        )
+
+    def test_etag_changes_with_unit_and_data(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(f'{self.url}?unit=F', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        set_age(WeatherData.objects.filter(city=self.city), 60)
+        WeatherCacheService().invalidate_city_cache(self.city.id)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+def observation(timestamp, temperature, wind_speed=2):
+    """Minimal upstream current weather payload observed at a UTC datetime"""
+    return {
+        'dt': int(timestamp.timestamp()),
+        'main': {'temp': temperature, 'humidity': 50, 'pressure': 1000},
+        'wind': {'speed': wind_speed},
+    }
+
+
+@override_settings(
+    WEATHER_HISTORY_RAW_RETENTION_DAYS=30, WEATHER_HISTORY_HOURLY_RETENTION_DAYS=400,
+    WEATHER_HISTORY_DAILY_RETENTION_DAYS=0, WEATHER_HISTORY_RAW_MAX_SPAN=2 * 24 * 60 * 60,
+    WEATHER_HISTORY_HOURLY_MAX_SPAN=31 * 24 * 60 * 60,
+)
+class WeatherHistoryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.oslo = City.objects.create(name='Oslo', country_code='NO')
+        cls.bergen = City.objects.create(name='Bergen', country_code='NO')
+
+    def setUp(self):
+        self.history = WeatherHistoryService()
+        self.midnight = datetime(2026, 3, 2, tzinfo=dt_timezone.utc)
+
+    def get_rollup(self, city, resolution, bucket_start):
+        return WeatherRollup.objects.get(city=city, resolution=resolution, bucket_start=bucket_start)
+
+    def test_record_many_packs_days_and_builds_rollups(self):
+        before = self.midnight - timedelta(minutes=30)
+        appended = self.history.record_many([
+            (self.oslo.id, observation(before, 1, wind_speed=4)),
+            (self.oslo.id, observation(self.midnight + timedelta(minutes=10), 3)),
+            (self.oslo.id, observation(self.midnight + timedelta(minutes=40), 5, wind_speed=6)),
+            (self.bergen.id, observation(self.midnight + timedelta(minutes=10), 8)),
+        ])
+        self.assertEqual(appended, 4)
+        self.assertEqual(WeatherObservationChunk.objects.filter(city=self.oslo).count(), 2)
+        chunk = WeatherObservationChunk.objects.get(city=self.oslo, day=self.midnight.date())
+        self.assertEqual(chunk.points['temp'], [3, 5])
+
+        hour = self.get_rollup(self.oslo, WeatherRollup.HOURLY, self.midnight)
+        self.assertEqual((hour.samples, hour.temperature_avg, hour.temperature_min, hour.temperature_max), (2, 4, 3, 5))
+        self.assertEqual((hour.wind_speed_avg, hour.wind_speed_max), (4, 6))
+        self.assertEqual(self.get_rollup(self.oslo, WeatherRollup.DAILY, self.midnight - timedelta(days=1)).samples, 1)
+        self.assertEqual(self.get_rollup(self.bergen, WeatherRollup.DAILY, self.midnight).temperature_avg, 8)
+
+    def test_record_many_skips_known_observations_and_sorts_late_ones(self):
+        late = self.midnight + timedelta(hours=1)
+        self.history.record_many([(self.oslo.id, observation(late + timedelta(minutes=30), 6))])
+        appended = self.history.record_many([
+            (self.oslo.id, observation(late + timedelta(minutes=30), 6)),
+            (self.oslo.id, observation(late, 2)),
+        ])
+        self.assertEqual(appended, 1)
+        chunk = WeatherObservationChunk.objects.get(city=self.oslo)
+        self.assertEqual(chunk.points['temp'], [2, 6])
+        self.assertEqual(self.get_rollup(self.oslo, WeatherRollup.HOURLY, late).samples, 2)
+        self.assertEqual(self.get_rollup(self.oslo, WeatherRollup.DAILY, self.midnight).temperature_avg, 4)
+
+    def test_choose_resolution(self):
+        now = timezone.now()
+        cases = [
+            (now - timedelta(days=1), now, 'raw'),
+            (now - timedelta(days=10), now, 'hourly'),
+            # Short, but older than the raw retention
+            (now - timedelta(days=40), now - timedelta(days=39), 'hourly'),
+            (now - timedelta(days=60), now, 'daily'),
+            (now - timedelta(days=500), now - timedelta(days=499), 'daily'),
+        ]
+        for start, end, expected in cases:
+            self.assertEqual(self.history.choose_resolution(start, end), expected, (start, end))
+
+    def test_get_range_at_each_resolution(self):
+        self.history.record_many([
+            (self.oslo.id, observation(self.midnight + timedelta(minutes=minutes), minutes))
+            for minutes in (10, 50, 70)
+        ])
+        start, end = self.midnight, self.midnight + timedelta(minutes=60)
+        resolution, points = self.history.get_range(self.oslo, start, end, 'raw')
+        self.assertEqual([point['temperature'] for point in points], [10, 50])
+        resolution, points = self.history.get_range(self.oslo, start, end, 'hourly')
+        self.assertEqual([point['samples'] for point in points], [2, 1])
+
+    def test_prune_applies_each_retention(self):
+        now = timezone.now().replace(microsecond=0)
+        old, recent = now - timedelta(days=500), now - timedelta(days=1)
+        self.history.record_many([(self.oslo.id, observation(old, 1)), (self.oslo.id, observation(recent, 2))])
+
+        deleted = self.history.prune()
+        self.assertEqual((deleted['raw'], deleted['hourly']), (1, 1))
+        self.assertNotIn('daily', deleted)
+        self.assertEqual(list(WeatherObservationChunk.objects.values_list('day', flat=True)), [recent.date()])
+        self.assertEqual(WeatherRollup.objects.filter(resolution=WeatherRollup.HOURLY).count(), 1)
+        self.assertEqual(WeatherRollup.objects.filter(resolution=WeatherRollup.DAILY).count(), 2)
+
+
+def forecast_item(timestamp, temperature, pod='d', main='Clear'):
+    """One 3-hour slot of the upstream forecast payload at a UTC datetime"""
+    return {
+        'dt': int(timestamp.timestamp()),
+        'main': {
+            'temp': temperature, 'temp_min': temperature - 1, 'temp_max': temperature + 1,
+            'humidity': 60, 'pressure': 1010,
+        },
+        'weather': [{'main': main, 'description': main.lower(), 'icon': f"01{pod}"}],
+        'wind': {'speed': 3, 'deg': 90},
+        'pop': 0.1,
+        'sys': {'pod': pod},
+    }
+
+
+class ForecastAggregationTests(SimpleTestCase):
+    # Helsinki switches from UTC+2 to UTC+3 on 29 March 2026
+    WINTER_OFFSET = 2 * 60 * 60
+    SUMMER_OFFSET = 3 * 60 * 60
+
+    def setUp(self):
+        self.start = datetime(2026, 3, 28, 12, tzinfo=dt_timezone.utc)
+
+    def make_points(self, temperatures, pods=None, mains=None):
+        pods = pods or ['d'] * len(temperatures)
+        mains = mains or ['Clear'] * len(temperatures)
+        return pack_forecast_series({'list': [
+            forecast_item(self.start + timedelta(hours=3 * step), temperature, pod, main)
+            for step, (temperature, pod, main) in enumerate(zip(temperatures, pods, mains))
+        ]})
+
+    def test_pack_forecast_series_sorts_slots_and_fills_defaults(self):
+        late = forecast_item(self.start + timedelta(hours=3), 5)
+        early = forecast_item(self.start, 2)
+        del early['wind'], early['pop'], early['sys']
+        points = pack_forecast_series({'list': [late, early]})
+        self.assertEqual(points['dt'], [early['dt'], late['dt']])
+        self.assertEqual(points['temp'], [2, 5])
+        self.assertEqual(points['feels_like'], [2, 5])
+        self.assertEqual(points['wind_speed'], [0, 3])
+        self.assertEqual(points['pod'], ['', 'd'])
+
+    def test_days_split_at_local_midnight(self):
+        # Slots at 12, 15, 18 and 21 UTC on the 28th, then 00 UTC on the 29th
+        points = self.make_points([1, 2, 3, 4, 5])
+        winter = aggregate_daily(points, self.WINTER_OFFSET)
+        summer = aggregate_daily(points, self.SUMMER_OFFSET)
+
+        # 21:00 UTC is 23:00 local in winter time but already midnight in summer time
+        self.assertEqual([day['temperature_max'] for day in winter], [5, 6])
+        self.assertEqual([day['temperature_max'] for day in summer], [4, 6])
+        self.assertEqual(
+            [day['forecast_date'] for day in winter],
+            [datetime(2026, 3, 27, 22, tzinfo=dt_timezone.utc), datetime(2026, 3, 28, 22, tzinfo=dt_timezone.utc)]
+        )
+        self.assertEqual(
+            [day['forecast_date'] for day in summer],
+            [datetime(2026, 3, 27, 21, tzinfo=dt_timezone.utc), datetime(2026, 3, 28, 21, tzinfo=dt_timezone.utc)]
+        )
+
+    def test_forecast_date_is_stable_across_refreshes(self):
+        points = self.make_points([1, 2, 3, 4, 5])
+        later = {column: values[2:] for column, values in points.items()}
+        self.assertEqual(
+            [day['forecast_date'] for day in aggregate_daily(points, self.SUMMER_OFFSET)],
+            [day['forecast_date'] for day in aggregate_daily(later, self.SUMMER_OFFSET)]
+        )
+
+    def test_day_and_night_temperatures(self):
+        points = self.make_points(
+            [10, 14, 6, 4, 2], pods=['d', 'd', 'n', 'n', 'n'], mains=['Rain', 'Clear', 'Snow', 'Snow', 'Snow']
+        )
+        first, second = aggregate_daily(points)
+        self.assertEqual((first['temperature_day'], first['temperature_night']), (12, 5))
+        # Night-time slots outnumber daytime ones, but the day is described by its daytime weather
+        self.assertEqual((first['weather_main'], first['weather_description']), ('Rain', 'rain'))
+        # The partial day has no daytime slot
+        self.assertEqual((second['temperature_day'], second['temperature_night']), (3, 2))
+        self.assertEqual(second['weather_main'], 'Snow')
+
+    def test_days_limit(self):
+        points = self.make_points(list(range(24)))
+        self.assertEqual(len(aggregate_daily(points)), 4)
+        self.assertEqual(len(aggregate_daily(points, days=2)), 2)
+
+
+class AsyncStackTests(SimpleTestCase):
+    """The async views only help if nothing in front of them needs a thread"""
+
+    def test_middleware_chain_stays_async(self):
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler().load_middleware(is_async=True)
+
+    async def request(self, application, path):
+        communicator = ApplicationCommunicator(application, {
+            'type': 'http', 'http_version': '1.1', 'method': 'GET', 'path': path,
+            'query_string': b'', 'headers': [],
+        })
+        await communicator.send_input({'type': 'http.request'})
+        start = await communicator.receive_output(5)
+        body = b''
+        while True:
+            message = await communicator.receive_output(5)
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                return start['status'], body
+
+    @override_settings(DEBUG=False)
+    async def test_static_files_are_served_in_front_of_django(self):
+        from weather_backend.static import get_asgi_static_files
+
+        async def django_app(scope, receive, send):
+            await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b'django'})
+
+        with self.settings(STATIC_ROOT=settings.BASE_DIR / 'weather'):
+            application = get_asgi_static_files(django_app)
+            status, body = await self.request(application, '/static/models.py')
+            self.assertEqual(status, 200)
+            self.assertIn(b'class City', body)
+            self.assertEqual(await self.request(application, '/static/missing.css'), (404, b'Not Found'))
+            self.assertEqual(await self.request(application, '/api/cities/'), (200, b'django'))
+
+    @override_settings(CACHES={
+        'default': {
+            'BACKEND': 'weather.cache_backends.TieredCache', 'LOCATION': 'async-tests',
+            'OPTIONS': {'L2_ALIAS': 'shared', 'INVALIDATION_CHECK_INTERVAL': 60},
+        },
+        'shared': TEST_CACHES['shared'],
+    })
+    async def test_tiered_cache_answers_l1_hits_on_the_loop(self):
+        # The first read checks the invalidation log, which is in L2
+        self.assertIsNone(await cache.aget('weather_2'))
+        await cache.aset('weather_1', 'sunny')
+        with mock.patch('weather.cache_backends.sync_to_async') as to_thread:
+            self.assertEqual(await cache.aget('weather_1'), 'sunny')
+        to_thread.assert_not_called()
+        await cache.aclear()
+
+
+@override_settings(CACHES=TEST_CACHES)
+class AsyncOpenWeatherMapServiceTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.responses = []
+        self.service = AsyncOpenWeatherMapService()
+        self.client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: self.responses.pop(0)))
+        for target, replacement in (
+            ('weather.async_services.AsyncHTTPClient.get', mock.Mock(return_value=self.client)),
+            ('weather.async_services.backoff_delay', mock.Mock(return_value=0)),
+        ):
+            patcher = mock.patch(target, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_one_client_per_event_loop_closed_with_the_loop(self):
+        mock.patch.stopall()
+
+        async def get_clients():
+            return AsyncHTTPClient.get(), AsyncHTTPClient.get()
+
+        first, again = asyncio.run(get_clients())
+        self.assertIs(first, again)
+        self.assertTrue(first.is_closed)
+        self.assertIsNot(asyncio.run(get_clients())[0], first)
+
+    async def test_retries_server_errors(self):
+        self.responses = [httpx.Response(502), httpx.Response(200, json={'name': 'Oslo'})]
+        self.assertEqual(await self.service.get_current_weather('Oslo', 'NO'), {'name': 'Oslo'})
+        self.assertEqual(self.responses, [])
+
+    async def test_errors_map_to_weather_api_exceptions(self):
+        for status, message in ((404, "City not found"), (401, "Invalid API key"), (400, "API error: 400")):
+            self.responses = [httpx.Response(status)]
+            with self.assertRaisesMessage(WeatherAPIException, message):
+                await self.service.get_forecast('Oslo', 'NO', 59.9, 10.7)
+
+    async def test_open_circuit_fails_without_a_request(self):
+        with mock.patch('weather.async_services.circuit_breaker.aallow_request', mock.AsyncMock(return_value=False)):
+            with self.assertRaises(CircuitOpenError):
+                await self.service.get_current_weather('Oslo', 'NO')
+
+
+@override_settings(CACHES=TEST_CACHES, WEATHER_CACHE_DURATION=1800, WEATHER_STALE_GRACE_PERIOD=900, **REPLAY_PROVIDER)
+class AsyncWeatherTests(TestCase):
+    """AsyncWeatherCacheService and the /api/async/ views"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.city = City.objects.create(name='Oslo', country_code='NO', latitude=59.9, longitude=10.7)
+
+    def setUp(self):
+        cache.clear()
+        self.service = AsyncWeatherCacheService()
+        self.provider = get_async_provider()
+        self.initial_calls = self.provider.calls
+
+    def get_upstream_calls(self):
+        return self.provider.calls - self.initial_calls
+
+    def fail_upstream(self, message):
+        return mock.patch.object(
+            self.provider, 'get_current_weather', mock.AsyncMock(side_effect=WeatherAPIException(message))
+        )
+
+    async def test_cache_hit_skips_db_and_upstream(self):
+        await sync_to_async(create_weather)(self.city, temperature=20)
+        await self.service.aget_or_fetch_current_weather(self.city)
+        await WeatherData.objects.filter(city=self.city).aupdate(temperature=30)
+        weather = await self.service.aget_or_fetch_current_weather(self.city)
+        self.assertEqual(weather.temperature, 20)
+        self.assertEqual(self.get_upstream_calls(), 0)
+
+    async def test_miss_fetches_and_stores(self):
+        weather = await self.service.aget_or_fetch_current_weather(self.city)
+        self.assertEqual(self.get_upstream_calls(), 1)
+        stored = await WeatherData.objects.aget(city=self.city)
+        self.assertEqual(stored.temperature, weather.temperature)
+
+    async def test_stale_row_is_served_while_refreshing(self):
+        await sync_to_async(create_weather)(self.city, temperature=99)
+        await sync_to_async(set_age)(WeatherData.objects.filter(city=self.city), 1900)
+        weather = await self.service.aget_or_fetch_current_weather(self.city)
+        self.assertEqual(weather.temperature, 99)
+        await asyncio.gather(*async_single_flight._tasks)
+        self.assertEqual(self.get_upstream_calls(), 1)
+        self.assertNotEqual((await WeatherData.objects.aget(city=self.city)).temperature, 99)
+
+    async def test_upstream_error_falls_back_to_expired_row(self):
+        await sync_to_async(create_weather)(self.city, temperature=99)
+        await sync_to_async(set_age)(WeatherData.objects.filter(city=self.city), 3600)
+        with self.fail_upstream("Request timeout after multiple retries"):
+            weather = await self.service.aget_or_fetch_current_weather(self.city)
+        self.assertEqual(weather.temperature, 99)
+
+    async def test_views_serve_weather_and_forecast(self):
+        await sync_to_async(create_weather)(self.city, temperature=20)
+        response = await self.async_client.get(f'/api/async/cities/{self.city.id}/weather/?unit=F')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['temperature'], 68)
+        self.assertEqual(response['X-Temperature-Unit'], 'F')
+        self.assertIn('ETag', response)
+
+        response = await self.async_client.get(f'/api/async/cities/{self.city.id}/forecast/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 5)
+
+    async def test_empty_forecast_is_labelled(self):
+        with mock.patch.object(AsyncWeatherCacheService, 'aget_or_fetch_forecast', mock.AsyncMock(return_value=[])):
+            response = await self.async_client.get(f'/api/async/cities/{self.city.id}/forecast/')
+        self.assertEqual(response.json(), [])
+        self.assertEqual(response['X-Temperature-Unit'], 'C')
+        self.assertIn('Cookie', response['Vary'])
+
+    async def test_views_map_errors(self):
+        url = f'/api/async/cities/{self.city.id}/weather/'
+        response = await self.async_client.get('/api/async/cities/999/weather/')
+        self.assertEqual(response.status_code, 404)
+        with self.fail_upstream("City not found"):
+            response = await self.async_client.get(url)
+        self.assertEqual((response.status_code, response.json()['code']), (404, 'CITY_NOT_FOUND'))
+        with self.fail_upstream("Request timeout after multiple retries"):
+            response = await self.async_client.get(url)
+        self.assertEqual((response.status_code, response.json()['code']), (503, 'SERVICE_UNAVAILABLE'))
+        with mock.patch.object(
+            self.provider, 'get_current_weather', mock.AsyncMock(side_effect=CircuitOpenError("circuit open"))
+        ):
+            response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], str(settings.WEATHER_CIRCUIT_OPEN_DURATION))
+
+
+class BenchmarkCommandTests(TestCase):
+    """benchmark_weather against the replay provider, in the test database instead of a new one"""
+    scenario_keys = {
+        'endpoint', 'tier', 'cities', 'requests', 'throughput', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms',
+        'queries_per_request',
+    }
+
+    def setUp(self):
+        self.output = os.path.join(tempfile.mkdtemp(), 'results.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.output))
+
+    def run_benchmark(self, *args):
+        command = 'weather.management.commands.benchmark_weather'
+        with mock.patch.object(connection.creation, 'create_test_db', return_value=connection.settings_dict['NAME']), \
+                mock.patch.object(connection.creation, 'destroy_test_db'), \
+                mock.patch(f'{command}.setup_test_environment'), mock.patch(f'{command}.teardown_test_environment'):
+            call_command(
+                'benchmark_weather', '--cities', '10', '--requests', '5', '--latency', '0', *args, stdout=StringIO()
+            )
+
+    def test_writes_results(self):
+        self.run_benchmark('--output', self.output)
+        with open(self.output) as f:
+            results = json.load(f)
+        self.assertLessEqual(
+            {'commit', 'created_at', 'python', 'database', 'provider_latency', 'requests', 'seed', 'scenarios'},
+            set(results)
+        )
+        self.assertEqual((results['provider_latency'], results['requests']), (0, 5))
+        for scenario in results['scenarios']:
+            self.assertEqual(set(scenario), self.scenario_keys, scenario)
+            self.assertEqual(scenario['cities'], 10)
+        self.assertEqual(
+            {(row['endpoint'], row['tier']) for row in results['scenarios'] if row['endpoint'] == 'city_weather'},
+            {('city_weather', UPSTREAM_MISS), ('city_weather', DB_HIT), ('city_weather', CACHE_HIT)}
+        )
+
+    def test_compare_fails_on_regression(self):
+        self.run_benchmark('--output', self.output)
+        with open(self.output) as f:
+            baseline = json.load(f)
+        for row in baseline['scenarios']:
+            row['throughput'] *= 10
+            for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+                row[metric] /= 10
+        with open(self.output, 'w') as f:
+            json.dump(baseline, f)
+
+        # Regressions are only reported without --max-regression
+        self.run_benchmark('--compare', self.output)
+        with self.assertRaisesMessage(CommandError, 'regressed by more than 50'):
+            self.run_benchmark('--compare', self.output, '--max-regression', '50')
@@ -0,0 +1,49 @@
+# Server-side temperature units. Data is fetched and stored in Celsius
+# (units=metric) only; other units are derived from the stored values, so one
+# upstream call serves every unit. Pressure, humidity and wind are unchanged.
+
+TEMPERATURE_UNITS = ['C', 'F']
+DEFAULT_TEMPERATURE_UNIT = 'C'
+
+# Temperature fields of the serialized weather, forecast and hourly payloads
+TEMPERATURE_FIELDS = [
+    'temperature', 'feels_like', 'temperature_min', 'temperature_max',
+    'temperature_day', 'temperature_night'
+]
+
+# Temperature columns of a packed ForecastSeries (see weather.forecast)
+SERIES_TEMPERATURE_COLUMNS = ['temp', 'feels_like', 'temp_min', 'temp_max']
+
+def _to_fahrenheit(values):
+    return [None if value is None else round(value * 9 / 5 + 32, 2) for value in values]
+
+_CONVERTERS = {
+    'F': _to_fahrenheit,
+}
+
+def convert_rows(rows, unit):
+    """Return serialized rows (a dict or a list of dicts) with temperatures in unit.
+
+    Each temperature field is converted as one column across all rows.
+    """
+    if unit not in _CONVERTERS:
+        return rows
+    single = isinstance(rows, dict)
+    rows = [dict(row) for row in ([rows] if single else rows)]
+    if rows:
+        converter = _CONVERTERS[unit]
+        for field in TEMPERATURE_FIELDS:
+            if field in rows[0]:
+                for row, value in zip(rows, converter([row[field] for row in rows])):
+                    row[field] = value
+    return rows[0] if single else rows
+
+def convert_series(points, unit):
+    """Return a packed forecast series with its temperature columns in unit"""
+    if unit not in _CONVERTERS:
+        return points
+    converter = _CONVERTERS[unit]
+    return {
+        column: converter(values) if column in SERIES_TEMPERATURE_COLUMNS else values
+        for column, values in points.items()
+    }
@@ -1,6 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import CityViewSet, WeatherViewSet, ForecastViewSet, UserPreferenceViewSet
+from . import async_views
 
 router = DefaultRouter()
 router.register(r'cities', CityViewSet)
@@ -10,4 +11,7 @@ router.register(r'preferences', UserPreferenceViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
+    # Non-blocking variants for ASGI deployments
+    path('async/cities/<int:pk>/weather/', async_views.city_weather, name='async-city-weather'),
+    path('async/cities/<int:pk>/forecast/', async_views.city_forecast, name='async-city-forecast'),
 ]
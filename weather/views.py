@@ -1,14 +1,26 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.conf import settings
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, timedelta, timezone as dt_timezone
 import logging
 from .models import City, WeatherData, ForecastData, UserPreference
 from .serializers import (
     CitySerializer, WeatherDataSerializer, ForecastDataSerializer,
-    UserPreferenceSerializer, AddCitySerializer
+    UserPreferenceSerializer, AddCitySerializer,
+    weather_row_serializer, forecast_row_serializer
 )
-from .services import WeatherCacheService, WeatherAPIException
+from .forecast import unpack_hourly
+from .pagination import KeysetPagination
+from .services import WeatherCacheService, GeocodingService, WeatherAPIException, CircuitOpenError
+from .favorites import FavoritesService
+from .units import TEMPERATURE_UNITS, DEFAULT_TEMPERATURE_UNIT, convert_rows, convert_series
 
 logger = logging.getLogger('weather_api')
 
@@ -34,15 +46,22 @@ class CityViewSet(viewsets.ModelViewSet):
             
             if created:
                 # Try to fetch weather data to validate the city
+                geocoding = GeocodingService()
                 try:
+                    # Coordinates of a name seen before come from the geocoding cache;
+                    # otherwise the weather fetch queries by name and returns them
+                    geocoding.geocode_city(city)
                     weather_service = WeatherCacheService()
                     weather_service.get_or_fetch_current_weather(city)
+                    geocoding.remember(name, country_code, city.latitude, city.longitude)
                     logger.info(f"Successfully added and validated city: {name}, {country_code}")
                 except WeatherAPIException as e:
                     logger.error(f"Failed to validate city {name}, {country_code}: {e}")
                     city.delete()
                     
                     if "not found" in str(e).lower():
+                        if geocoding.get_cached(name, country_code) is None:
+                            geocoding.remember(name, country_code)
                         return Response(
                             {'error': f'City "{name}" not found in {country_code}. Please check the spelling and country code.'}, 
                             status=status.HTTP_404_NOT_FOUND
@@ -92,13 +111,30 @@ class CityViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def weather(self, request, pk=None):
         """Get current weather for a city with enhanced error handling"""
+        try:
+            unit = _get_temperature_unit(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        weather_service = WeatherCacheService()
+        # Cached responses skip the city lookup, ORM hydration, serialization and conversion
+        payload = weather_service.get_cached_payload('weather', pk, unit)
+        if payload is not None:
+            return _payload_response(request, weather_service, payload)
+        
         city = get_object_or_404(City, pk=pk)
         
         try:
-            weather_service = WeatherCacheService()
             weather_data = weather_service.get_or_fetch_current_weather(city)
+            # Answer polling clients that already have this version before serializing
+            etag = weather_service.get_payload_etag('weather', city.id, weather_data.cached_at, unit)
+            not_modified = _not_modified(request, weather_service, etag, weather_data.cached_at)
+            if not_modified is not None:
+                return not_modified
             serializer = WeatherDataSerializer(weather_data)
-            return Response(serializer.data)
+            payload = weather_service.cache_payload(
+                'weather', city.id, convert_rows(serializer.data, unit), weather_data.cached_at, unit
+            )
+            return _payload_response(request, weather_service, payload)
         except WeatherAPIException as e:
             logger.error(f"Weather API error for city {city.name}: {e}")
             if "not found" in str(e).lower():
@@ -106,6 +142,12 @@ class CityViewSet(viewsets.ModelViewSet):
                     {'error': f'Weather data not available for {city.name}', 'code': 'CITY_NOT_FOUND'}, 
                     status=status.HTTP_404_NOT_FOUND
                 )
+            elif isinstance(e, CircuitOpenError):
+                return Response(
+                    {'error': 'Weather service is temporarily unavailable. Please try again.', 'code': 'SERVICE_UNAVAILABLE'}, 
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    headers={'Retry-After': str(settings.WEATHER_CIRCUIT_OPEN_DURATION)}
+                )
             elif "timeout" in str(e).lower() or "connection" in str(e).lower():
                 return Response(
                     {'error': 'Weather service is temporarily unavailable. Please try again.', 'code': 'SERVICE_UNAVAILABLE'}, 
@@ -126,13 +168,32 @@ class CityViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def forecast(self, request, pk=None):
         """Get 5-day forecast for a city with enhanced error handling"""
+        try:
+            unit = _get_temperature_unit(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        weather_service = WeatherCacheService()
+        # Cached responses skip the city lookup, ORM hydration, serialization and conversion
+        payload = weather_service.get_cached_payload('forecast', pk, unit)
+        if payload is not None:
+            return _payload_response(request, weather_service, payload)
+        
         city = get_object_or_404(City, pk=pk)
         
         try:
-            weather_service = WeatherCacheService()
             forecast_data = weather_service.get_or_fetch_forecast(city)
+            if not forecast_data:
+                return _set_unit_header(request, Response([]), unit)
+            cached_at = min(forecast.cached_at for forecast in forecast_data)
+            etag = weather_service.get_payload_etag('forecast', city.id, cached_at, unit)
+            not_modified = _not_modified(request, weather_service, etag, cached_at)
+            if not_modified is not None:
+                return not_modified
             serializer = ForecastDataSerializer(forecast_data, many=True)
-            return Response(serializer.data)
+            payload = weather_service.cache_payload(
+                'forecast', city.id, convert_rows(serializer.data, unit), cached_at, unit
+            )
+            return _payload_response(request, weather_service, payload)
         except WeatherAPIException as e:
             logger.error(f"Forecast API error for city {city.name}: {e}")
             if "not found" in str(e).lower():
@@ -140,6 +201,12 @@ class CityViewSet(viewsets.ModelViewSet):
                     {'error': f'Forecast data not available for {city.name}', 'code': 'CITY_NOT_FOUND'}, 
                     status=status.HTTP_404_NOT_FOUND
                 )
+            elif isinstance(e, CircuitOpenError):
+                return Response(
+                    {'error': 'Weather service is temporarily unavailable. Please try again.', 'code': 'SERVICE_UNAVAILABLE'}, 
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    headers={'Retry-After': str(settings.WEATHER_CIRCUIT_OPEN_DURATION)}
+                )
             elif "timeout" in str(e).lower() or "connection" in str(e).lower():
                 return Response(
                     {'error': 'Weather service is temporarily unavailable. Please try again.', 'code': 'SERVICE_UNAVAILABLE'}, 
@@ -157,17 +224,286 @@ class CityViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=True, methods=['get'])
+    def forecast_hourly(self, request, pk=None):
+        """Get the full 3-hourly forecast for a city"""
+        try:
+            unit = _get_temperature_unit(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        city = get_object_or_404(City, pk=pk)
+        
+        try:
+            weather_service = WeatherCacheService()
+            series = weather_service.get_or_fetch_forecast_series(city)
+            points = convert_series(series.points, unit)
+            return _set_unit_header(request, Response(unpack_hourly(points, series.timezone_offset)), unit)
+        except WeatherAPIException as e:
+            logger.error(f"Forecast API error for city {city.name}: {e}")
+            if "not found" in str(e).lower():
+                return Response(
+                    {'error': f'Forecast data not available for {city.name}', 'code': 'CITY_NOT_FOUND'}, 
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            elif isinstance(e, CircuitOpenError):
+                return Response(
+                    {'error': 'Weather service is temporarily unavailable. Please try again.', 'code': 'SERVICE_UNAVAILABLE'}, 
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    headers={'Retry-After': str(settings.WEATHER_CIRCUIT_OPEN_DURATION)}
+                )
+            elif "timeout" in str(e).lower() or "connection" in str(e).lower():
+                return Response(
+                    {'error': 'Weather service is temporarily unavailable. Please try again.', 'code': 'SERVICE_UNAVAILABLE'}, 
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE
+                )
+            else:
+                return Response(
+                    {'error': f'Failed to get forecast data: {str(e)}', 'code': 'API_ERROR'}, 
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE
+                )
+        except Exception as e:
+            logger.error(f"Unexpected error getting hourly forecast for city {city.name}: {e}")
+            return Response(
+                {'error': 'An unexpected error occurred', 'code': 'INTERNAL_ERROR'}, 
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    @action(detail=True, methods=['get'])
+    def history(self, request, pk=None):
+        """Get observed weather for a city between ?start= and ?end=
+        
+        ?resolution= is raw, hourly, daily or auto (the default), which picks
+        the finest resolution that keeps the number of points small.
+        """
+        city = get_object_or_404(City, pk=pk)
+        weather_service = WeatherCacheService()
+        
+        resolution = request.query_params.get('resolution', 'auto')
+        if resolution != 'auto' and resolution not in weather_service.history.resolutions:
+            return Response(
+                {'error': f'Unknown resolution: {resolution}'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            end = _parse_history_time(request.query_params.get('end')) or timezone.now()
+            start = _parse_history_time(request.query_params.get('start')) or (
+                end - timedelta(seconds=settings.WEATHER_HISTORY_DEFAULT_SPAN)
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if start > end:
+            return Response(
+                {'error': 'start must be before end'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        resolution, points = weather_service.history.get_range(city, start, end, resolution)
+        return Response({
+            'city': city.id,
+            'start': start,
+            'end': end,
+            'resolution': resolution,
+            'points': points,
+        })
+
+def _get_or_create_session_key(request):
+    """Session key of the visitor, starting a session on their first preference write"""
+    if not request.session.session_key:
+        request.session.create()
+    return request.session.session_key
+
+def _get_temperature_unit(request):
+    """Temperature unit of a response: ?unit=C|F, else the session's preference, else Celsius"""
+    unit = request.GET.get('unit')
+    if unit:
+        unit = unit.upper()
+        if unit not in TEMPERATURE_UNITS:
+            raise ValueError(f'unit must be one of {", ".join(TEMPERATURE_UNITS)}')
+        return unit
+    # Visitors without a session cookie never load a session
+    if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+        return DEFAULT_TEMPERATURE_UNIT
+    unit = request.session.get('temperature_unit')
+    if unit is None:
+        # Sessions from before the unit was kept in the session. Reads never
+        # write the session, so these keep looking it up until the next preference write
+        unit = UserPreference.objects.filter(
+            session_key=request.session.session_key
+        ).values_list('temperature_unit', flat=True).first()
+    if unit not in TEMPERATURE_UNITS:
+        return DEFAULT_TEMPERATURE_UNIT
+    return unit
+
+def _validate_temperature_unit(data):
+    """Error message for an unsupported temperature_unit in a preference write, else None"""
+    unit = data.get('temperature_unit')
+    if unit is not None and unit not in TEMPERATURE_UNITS:
+        return f'temperature_unit must be one of {", ".join(TEMPERATURE_UNITS)}'
+    return None
+
+def _vary_on_unit(request, response):
+    """Without ?unit= the temperature unit comes from the session cookie"""
+    if 'unit' not in request.GET:
+        patch_vary_headers(response, ['Cookie'])
+    return response
+
+def _set_unit_header(request, response, unit):
+    """Label the temperature unit of a response"""
+    response['X-Temperature-Unit'] = unit
+    return _vary_on_unit(request, response)
+
+def _get_favorite_city_ids(data):
+    """Read city_id or a city_ids list from a favorites request, or None if invalid"""
+    city_ids = data.get('city_ids')
+    if city_ids is None and data.get('city_id'):
+        city_ids = [data.get('city_id')]
+    if not isinstance(city_ids, list) or not city_ids:
+        return None
+    try:
+        return list(dict.fromkeys(int(city_id) for city_id in city_ids))
+    except (TypeError, ValueError):
+        return None
+
+def _set_validators(response, weather_service, etag, cached_at):
+    """Add ETag, Last-Modified and a max-age matching the remaining cache validity"""
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(cached_at.timestamp())
+    patch_cache_control(response, max_age=weather_service.get_remaining_validity(cached_at))
+
+def _not_modified(request, weather_service, etag, cached_at):
+    """Return a 304 response if the client's copy is current, otherwise None"""
+    response = get_conditional_response(request, etag=etag, last_modified=int(cached_at.timestamp()))
+    if response is not None:
+        _set_validators(response, weather_service, etag, cached_at)
+        _vary_on_unit(request, response)
+    return response
+
+def _payload_response(request, weather_service, payload):
+    """Serve a rendered payload from WeatherCacheService.cache_payload with its validators"""
+    response = _not_modified(request, weather_service, payload['etag'], payload['cached_at'])
+    if response is None:
+        response = HttpResponse(payload['body'], content_type='application/json')
+        _set_unit_header(request, response, payload['unit'])
+        _set_validators(response, weather_service, payload['etag'], payload['cached_at'])
+    return response
+
+def _parse_history_time(value):
+    """Parse an ISO 8601 date or datetime query parameter (naive values are UTC)"""
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Invalid date or datetime: {value}')
+        parsed = datetime(day.year, day.month, day.day)
+    if timezone.is_naive(parsed):
+        parsed = parsed.replace(tzinfo=dt_timezone.utc)
+    return parsed
+
+def _list_rows(request, queryset, row_serializer, paginator):
+    """Paginate and serialize a list endpoint.
+    
+    ?fields=a,b limits the row fields, ?shape=flat lists each city once,
+    ?unit= selects the temperature unit and ?cursor= / ?page_size= the page.
+    """
+    try:
+        unit = _get_temperature_unit(request)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    fields = None
+    if request.query_params.get('fields'):
+        fields = [field.strip() for field in request.query_params['fields'].split(',') if field.strip()]
+        unknown = row_serializer.get_projection(fields)
+        if unknown:
+            return Response(
+                {'error': f'Unknown fields: {", ".join(unknown)}'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+    
+    flat = request.query_params.get('shape') == 'flat'
+    page = paginator.paginate_values(queryset, request, row_serializer.get_columns(fields))
+    rows = row_serializer.serialize_values(page, flat=flat, fields=fields)
+    if flat:
+        rows['results'] = convert_rows(rows['results'], unit)
+    else:
+        rows = convert_rows(rows, unit)
+    response = paginator.get_paginated_response(rows)
+    return _set_unit_header(request, response, unit)
+
 class WeatherViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = WeatherData.objects.all()
     serializer_class = WeatherDataSerializer
     
     def get_queryset(self):
         """Filter weather data by city if specified"""
-        queryset = WeatherData.objects.all()
+        queryset = WeatherData.objects.select_related('city')
         city_id = self.request.query_params.get('city_id')
         if city_id:
             queryset = queryset.filter(city_id=city_id)
         return queryset
+    
+    def list(self, request, *args, **kwargs):
+        """List weather data newest first, one keyset page at a time"""
+        paginator = KeysetPagination('cached_at', descending=True)
+        return _list_rows(request, self.get_queryset(), weather_row_serializer, paginator)
+    
+    @action(detail=False, methods=['get'])
+    def batch(self, request):
+        """Get current weather for several cities (?ids=1,2,3) in one call"""
+        try:
+            city_ids = list(dict.fromkeys(
+                int(city_id) for city_id in request.query_params.get('ids', '').split(',') if city_id.strip()
+            ))
+        except ValueError:
+            return Response({'error': 'ids must be a comma-separated list of city ids'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if not city_ids:
+            return Response({'error': 'ids is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(city_ids) > settings.WEATHER_BATCH_MAX_CITIES:
+            return Response(
+                {'error': f'At most {settings.WEATHER_BATCH_MAX_CITIES} cities can be requested at once'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            unit = _get_temperature_unit(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return _batch_weather_response(request, city_ids, City.objects.in_bulk(city_ids), unit)
+
+def _batch_weather_response(request, city_ids, cities, unit=DEFAULT_TEMPERATURE_UNIT):
+    """Current weather for city_ids (cities maps the known ones to City objects) as {'results', 'errors'}"""
+    weather_service = WeatherCacheService()
+    try:
+        results, api_errors = weather_service.get_or_fetch_current_weather_many(list(cities.values()))
+    except Exception as e:
+        logger.error(f"Unexpected error getting batch weather for cities {city_ids}: {e}")
+        return Response(
+            {'error': 'An unexpected error occurred', 'code': 'INTERNAL_ERROR'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+    
+    errors = []
+    for city_id in city_ids:
+        if city_id not in cities:
+            errors.append({'city_id': city_id, 'error': 'City not found', 'code': 'CITY_NOT_FOUND'})
+        elif city_id in api_errors:
+            e = api_errors[city_id]
+            logger.error(f"Weather API error for city {cities[city_id].name}: {e}")
+            if "not found" in str(e).lower():
+                code = 'CITY_NOT_FOUND'
+            elif isinstance(e, CircuitOpenError) or "timeout" in str(e).lower() or "connection" in str(e).lower():
+                code = 'SERVICE_UNAVAILABLE'
+            else:
+                code = 'API_ERROR'
+            errors.append({'city_id': city_id, 'error': str(e), 'code': code})
+    
+    weather_data = [results[city_id] for city_id in city_ids if city_id in results]
+    serializer = WeatherDataSerializer(weather_data, many=True)
+    response = Response({'results': convert_rows(serializer.data, unit), 'errors': errors})
+    return _set_unit_header(request, response, unit)
 
 class ForecastViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = ForecastData.objects.all()
@@ -175,11 +511,16 @@ class ForecastViewSet(viewsets.ReadOnlyModelViewSet):
     
     def get_queryset(self):
         """Filter forecast data by city if specified"""
-        queryset = ForecastData.objects.all()
+        queryset = ForecastData.objects.select_related('city')
         city_id = self.request.query_params.get('city_id')
         if city_id:
             queryset = queryset.filter(city_id=city_id)
         return queryset
+    
+    def list(self, request, *args, **kwargs):
+        """List forecast data by date, one keyset page at a time"""
+        paginator = KeysetPagination('forecast_date', descending=False)
+        return _list_rows(request, self.get_queryset(), forecast_row_serializer, paginator)
 
 class UserPreferenceViewSet(viewsets.ModelViewSet):
     queryset = UserPreference.objects.all()
@@ -187,24 +528,28 @@ class UserPreferenceViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """Get preferences for current session"""
+        # Reading preferences never creates a session; a visitor without one has none
         session_key = self.request.session.session_key
         if not session_key:
-            self.request.session.create()
-            session_key = self.request.session.session_key
+            return UserPreference.objects.none()
         
-        return UserPreference.objects.filter(session_key=session_key)
+        return UserPreference.objects.filter(session_key=session_key).prefetch_related('favorite_cities')
+    
+    def perform_update(self, serializer):
+        preference = serializer.save()
+        self.request.session['temperature_unit'] = preference.temperature_unit
     
     def create(self, request):
         """Create or update user preferences with error handling"""
-        session_key = request.session.session_key
-        if not session_key:
-            request.session.create()
-            session_key = self.request.session.session_key
+        unit_error = _validate_temperature_unit(request.data)
+        if unit_error:
+            return Response({'temperature_unit': [unit_error]}, status=status.HTTP_400_BAD_REQUEST)
+        session_key = _get_or_create_session_key(request)
         
         try:
             preference, created = UserPreference.objects.get_or_create(
                 session_key=session_key,
-                defaults={'temperature_unit': request.data.get('temperature_unit', 'C')}
+                defaults={'temperature_unit': request.data.get('temperature_unit', DEFAULT_TEMPERATURE_UNIT)}
             )
             
             if not created:
@@ -212,10 +557,13 @@ class UserPreferenceViewSet(viewsets.ModelViewSet):
                 serializer = UserPreferenceSerializer(preference, data=request.data, partial=True)
                 if serializer.is_valid():
                     serializer.save()
+                    # Weather views read the unit from the session, not the DB
+                    request.session['temperature_unit'] = preference.temperature_unit
                     logger.info(f"Updated preferences for session {session_key}")
                     return Response(serializer.data)
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
             
+            request.session['temperature_unit'] = preference.temperature_unit
             serializer = UserPreferenceSerializer(preference)
             logger.info(f"Created preferences for session {session_key}")
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -228,30 +576,24 @@ class UserPreferenceViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['post'])
     def add_favorite_city(self, request):
-        """Add a city to favorites with error handling"""
-        session_key = request.session.session_key
-        if not session_key:
-            request.session.create()
-            session_key = self.request.session.session_key
+        """Add one city (city_id) or several (city_ids) to favorites with error handling"""
+        session_key = _get_or_create_session_key(request)
         
-        city_id = request.data.get('city_id')
-        if not city_id:
-            return Response({'error': 'city_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+        city_ids = _get_favorite_city_ids(request.data)
+        if city_ids is None:
+            return Response({'error': 'city_id or city_ids is required'}, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            city = City.objects.get(id=city_id)
-            preference, created = UserPreference.objects.get_or_create(session_key=session_key)
-            
-            if city in preference.favorite_cities.all():
+            favorites = FavoritesService()
+            if len(city_ids) == 1 and favorites.is_favorite(session_key, city_ids[0]):
                 return Response({'message': 'City is already in favorites'}, status=status.HTTP_200_OK)
             
-            preference.favorite_cities.add(city)
-            logger.info(f"Added city {city.name} to favorites for session {session_key}")
+            preference, added, unknown = favorites.add(session_key, city_ids)
+            if unknown and not added:
+                return Response({'error': 'City not found'}, status=status.HTTP_404_NOT_FOUND)
             
             serializer = UserPreferenceSerializer(preference)
             return Response(serializer.data)
-        except City.DoesNotExist:
-            return Response({'error': 'City not found'}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             logger.error(f"Error adding favorite city for session {session_key}: {e}")
             return Response(
@@ -261,24 +603,23 @@ class UserPreferenceViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['post'])
     def remove_favorite_city(self, request):
-        """Remove a city from favorites with error handling"""
+        """Remove one city (city_id) or several (city_ids) from favorites with error handling"""
         session_key = request.session.session_key
         if not session_key:
             return Response({'error': 'No session found'}, status=status.HTTP_400_BAD_REQUEST)
         
-        city_id = request.data.get('city_id')
-        if not city_id:
-            return Response({'error': 'city_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+        city_ids = _get_favorite_city_ids(request.data)
+        if city_ids is None:
+            return Response({'error': 'city_id or city_ids is required'}, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            city = City.objects.get(id=city_id)
-            preference = UserPreference.objects.get(session_key=session_key)
-            preference.favorite_cities.remove(city)
-            logger.info(f"Removed city {city.name} from favorites for session {session_key}")
+            preference, removed = FavoritesService().remove(session_key, city_ids)
+            if not removed:
+                return Response({'error': 'City or preference not found'}, status=status.HTTP_404_NOT_FOUND)
             
             serializer = UserPreferenceSerializer(preference)
             return Response(serializer.data)
-        except (City.DoesNotExist, UserPreference.DoesNotExist):
+        except UserPreference.DoesNotExist:
             return Response({'error': 'City or preference not found'}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             logger.error(f"Error removing favorite city for session {session_key}: {e}")
@@ -286,3 +627,19 @@ class UserPreferenceViewSet(viewsets.ModelViewSet):
                 {'error': 'Failed to remove city from favorites'}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+    
+    @action(detail=False, methods=['get'])
+    def favorites(self, request):
+        """Get the favorite city IDs of the session from the favourites cache"""
+        city_ids = FavoritesService().get_city_ids(request.session.session_key)
+        return Response({'city_ids': city_ids})
+    
+    @action(detail=False, methods=['get'])
+    def favorites_weather(self, request):
+        """Get current weather for every favorite city of the session"""
+        try:
+            unit = _get_temperature_unit(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        cities = FavoritesService().get_cities(request.session.session_key)
+        return _batch_weather_response(request, [city.id for city in cities], {city.id: city for city in cities}, unit)
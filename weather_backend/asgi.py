@@ -13,4 +13,23 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'weather_backend.settings')
 
-application = get_asgi_application()
+# Initialize Django before importing code that uses the ORM
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from channels.security.websocket import OriginValidator  # noqa: E402
+from django.conf import settings  # noqa: E402
+from weather.routing import websocket_urlpatterns  # noqa: E402
+from weather_backend.static import get_asgi_static_files  # noqa: E402
+
+# Browsers send the frontend's origin on WebSocket handshakes, so accept the
+# same origins as CORS in addition to the backend's own hosts
+if getattr(settings, 'CORS_ALLOW_ALL_ORIGINS', False):
+    allowed_origins = ['*']
+else:
+    allowed_origins = settings.CORS_ALLOWED_ORIGINS + settings.ALLOWED_HOSTS
+
+application = ProtocolTypeRouter({
+    'http': get_asgi_static_files(django_asgi_app),
+    'websocket': OriginValidator(URLRouter(websocket_urlpatterns), allowed_origins),
+})
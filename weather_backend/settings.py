@@ -40,6 +40,7 @@ ALLOWED_HOSTS = [
 # Application definition
 
 INSTALLED_APPS = [
+    'daphne',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -49,12 +50,12 @@ INSTALLED_APPS = [
     'weather',
     'rest_framework',
     'corsheaders',
+    'channels',
 ]
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -91,6 +92,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'weather_backend.wsgi.application'
+ASGI_APPLICATION = 'weather_backend.asgi.application'
 
 
 # Database
@@ -168,6 +170,9 @@ if DEBUG:
 
 # REST Framework settings
 REST_FRAMEWORK = {
+    # The API has no user accounts; DRF's default SessionAuthentication would
+    # load the session on every request just to find an anonymous user
+    'DEFAULT_AUTHENTICATION_CLASSES': [],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
@@ -176,26 +181,154 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Upstream weather source (a weather.providers.WeatherProvider). Point both at
+# weather.replay.ReplayWeatherProvider / AsyncReplayWeatherProvider to run offline.
+WEATHER_PROVIDER = config('WEATHER_PROVIDER', default='weather.services.OpenWeatherMapService')
+WEATHER_ASYNC_PROVIDER = config('WEATHER_ASYNC_PROVIDER', default='weather.async_services.AsyncOpenWeatherMapService')
+WEATHER_REPLAY = {
+    'RECORDINGS': config('WEATHER_REPLAY_RECORDINGS', default=''),  # JSON file of recorded responses
+    'LATENCY': config('WEATHER_REPLAY_LATENCY', default=0.05, cast=float),  # seconds per call
+    'JITTER': config('WEATHER_REPLAY_JITTER', default=0.0, cast=float),  # extra random seconds per call
+    'ERROR_RATE': config('WEATHER_REPLAY_ERROR_RATE', default=0.0, cast=float),  # share of calls that fail
+    'SEED': config('WEATHER_REPLAY_SEED', default=0, cast=int),
+}
+
 # OpenWeatherMap API settings
 OPENWEATHER_API_KEY = config('OPENWEATHER_API_KEY', default='bedd08dbae64163d4f433573beee8a0e')
 OPENWEATHER_BASE_URL = 'https://api.openweathermap.org/data/2.5'
+OPENWEATHER_GEO_URL = 'https://api.openweathermap.org/geo/1.0'
+
+# Keep-alive connection pool shared by each worker process for upstream calls
+OPENWEATHER_POOL_CONNECTIONS = config('OPENWEATHER_POOL_CONNECTIONS', default=4, cast=int)  # hosts kept alive
+OPENWEATHER_POOL_MAXSIZE = config('OPENWEATHER_POOL_MAXSIZE', default=10, cast=int)  # connections per host
+OPENWEATHER_POOL_BLOCK = config('OPENWEATHER_POOL_BLOCK', default=False, cast=bool)  # hard per-host limit
+OPENWEATHER_ASYNC_MAX_CONNECTIONS = config('OPENWEATHER_ASYNC_MAX_CONNECTIONS', default=200, cast=int)  # per ASGI worker
+
+# Upstream quota shared by all workers (token bucket in the shared cache, see weather.ratelimit)
+OPENWEATHER_RATE_LIMIT = config('OPENWEATHER_RATE_LIMIT', default=60, cast=int)  # calls per minute
+OPENWEATHER_RATE_BURST = config('OPENWEATHER_RATE_BURST', default=60, cast=int)  # bucket size
+OPENWEATHER_BACKGROUND_RESERVE = 0.25  # share of the bucket background refreshes leave for user requests
+OPENWEATHER_FOREGROUND_MAX_WAIT = 2  # seconds a user request may wait for a token
+OPENWEATHER_BACKGROUND_MAX_WAIT = 30  # seconds a background refresh may wait for a token
+OPENWEATHER_RETRY_BASE_DELAY = 0.5  # first retry backoff ceiling in seconds, doubled per attempt
+OPENWEATHER_RETRY_MAX_DELAY = 8
+OPENWEATHER_DEFAULT_COOLDOWN = 30  # pause after a 429 without Retry-After
+
+# Circuit breaker shared by all workers (see weather.circuitbreaker)
+WEATHER_CIRCUIT_ERROR_THRESHOLD = config('WEATHER_CIRCUIT_ERROR_THRESHOLD', default=0.5, cast=float)  # failure rate that opens it
+WEATHER_CIRCUIT_MIN_REQUESTS = 10  # calls in the window before the error rate counts
+WEATHER_CIRCUIT_WINDOW = 60  # rolling window in seconds
+WEATHER_CIRCUIT_BUCKET = 10  # counter granularity in seconds
+WEATHER_CIRCUIT_OPEN_DURATION = config('WEATHER_CIRCUIT_OPEN_DURATION', default=30, cast=int)  # seconds before a probe
+WEATHER_CIRCUIT_PROBE_TIMEOUT = 15  # seconds before another worker may probe
 
 
 # Cache settings
 WEATHER_CACHE_DURATION = 30 * 60  # 30 minutes in seconds
+WEATHER_STALE_GRACE_PERIOD = 15 * 60  # serve expired data this long while refreshing in the background
+
+# Single-flight coordination of concurrent upstream fetches for the same city
+WEATHER_FETCH_LOCK_TIMEOUT = 45  # seconds; covers the request timeout plus retries
+WEATHER_FETCH_WAIT_TIMEOUT = 45  # seconds a waiter blocks before fetching itself
+WEATHER_FETCH_POLL_INTERVAL = 0.1  # seconds between checks for another worker's result
+
+# Geocoding results (weather.GeocodingResult): found names are kept for good
+WEATHER_GEOCODING_NOT_FOUND_TTL = 24 * 60 * 60  # seconds before a "not found" name is looked up again
+
+# Favourite city IDs cached per session (/api/preferences/favorites/)
+WEATHER_FAVORITES_CACHE_TIMEOUT = 60 * 60
+
+# Keyset pagination for /api/weather/ and /api/forecast/
+WEATHER_LIST_PAGE_SIZE = 100
+WEATHER_LIST_MAX_PAGE_SIZE = 1000
+
+# Batch weather endpoint (/api/weather/batch/?ids=1,2,3)
+WEATHER_BATCH_MAX_CITIES = 50
+WEATHER_BATCH_MAX_WORKERS = 8  # parallel upstream fetches for cache misses
+
+# Background refresh scheduler (python manage.py refresh_weather)
+WEATHER_REFRESH_LEAD_TIME = 5 * 60  # refresh this many seconds before WEATHER_CACHE_DURATION runs out
+WEATHER_REFRESH_RATE_LIMIT = config('WEATHER_REFRESH_RATE_LIMIT', default=40, cast=int)  # upstream calls per minute
+WEATHER_REFRESH_POLL_INTERVAL = 30  # seconds to sleep when no city is due
+WEATHER_READ_TRAFFIC_WINDOW = 60 * 60  # seconds of read traffic used to prioritise cities
+WEATHER_READ_FLUSH_INTERVAL = 10  # seconds between writes of a worker's read counts to the shared cache
+
+# Observation history (/api/cities/{id}/history/); a retention of 0 days keeps data forever
+WEATHER_HISTORY_RAW_RETENTION_DAYS = config('WEATHER_HISTORY_RAW_RETENTION_DAYS', default=30, cast=int)
+WEATHER_HISTORY_HOURLY_RETENTION_DAYS = config('WEATHER_HISTORY_HOURLY_RETENTION_DAYS', default=400, cast=int)
+WEATHER_HISTORY_DAILY_RETENTION_DAYS = config('WEATHER_HISTORY_DAILY_RETENTION_DAYS', default=0, cast=int)
+WEATHER_HISTORY_RAW_MAX_SPAN = 2 * 24 * 60 * 60  # resolution=auto returns raw points for ranges up to this
+WEATHER_HISTORY_HOURLY_MAX_SPAN = 31 * 24 * 60 * 60  # and hourly rollups up to this, daily beyond
+WEATHER_HISTORY_DEFAULT_SPAN = 7 * 24 * 60 * 60  # range when ?start= is omitted
+WEATHER_HISTORY_PRUNE_INTERVAL = 60 * 60  # seconds between retention runs of the refresh scheduler
+
+# Keys used for cross-worker locks, counters and state. They need atomic
+# add/incr and must never be evicted to make room for cached data.
+WEATHER_COORDINATION_KEY_PREFIXES = [
+    'singleflight_', 'weather_reads_', 'ratelimit_', 'circuit_', 'tiered_invalidation',
+]
+
+# Two-tier cache: a per-process LRU (L1) in front of a cache shared by all
+# workers (L2). Set REDIS_URL in production; without it the shared tier is a
+# table in the database (python manage.py createcachetable), which is slower
+# but, unlike a file cache, has atomic add/incr.
+REDIS_URL = config('REDIS_URL', default='')
+
+if REDIS_URL:
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    }
+else:
+    SHARED_CACHE = {
+        'BACKEND': 'weather.cache_backends.AtomicDatabaseCache',
+        'LOCATION': 'weather_cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+            'CULL_FREQUENCY': 3,
+            'CULL_EXCLUDE_PREFIXES': WEATHER_COORDINATION_KEY_PREFIXES,
+        }
+    }
 
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'weather.cache_backends.TieredCache',
         'LOCATION': 'weather-cache',
         'TIMEOUT': WEATHER_CACHE_DURATION,
         'OPTIONS': {
-            'MAX_ENTRIES': 1000,
-            'CULL_FREQUENCY': 3,
+            'L2_ALIAS': 'shared',
+            'L1_MAX_ENTRIES': 1000,
+            'L1_TIMEOUT': 30,
+            'INVALIDATION_CHECK_INTERVAL': 1,
+            # Locks and counters must always be read from the shared tier
+            'L1_EXCLUDE_PREFIXES': WEATHER_COORDINATION_KEY_PREFIXES,
         }
-    }
+    },
+    'shared': {
+        'TIMEOUT': WEATHER_CACHE_DURATION,
+        **SHARED_CACHE,
+    },
 }
 
+# Live updates (ws/weather/). The in-memory layer only reaches subscribers in
+# the process that wrote the update; with REDIS_URL, writes from any web or
+# worker process are delivered to every daphne process.
+if REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [REDIS_URL]},
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        }
+    }
+
+WEATHER_LIVE_MAX_SUBSCRIPTIONS = 50  # cities per WebSocket connection
+
 # Logging configuration for better error tracking
 LOGGING = {
     'version': 1,
@@ -238,10 +371,13 @@ LOGGING = {
 }
 
 
-# Session configuration for better user preference handling
-SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+# Session configuration for better user preference handling. Sessions are read
+# from the shared cache and written through to the DB only when they change;
+# weather reads never touch them (see DEFAULT_AUTHENTICATION_CLASSES).
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_CACHE_ALIAS = 'shared'
 SESSION_COOKIE_AGE = 86400 * 30  # 30 days
-SESSION_SAVE_EVERY_REQUEST = True
+SESSION_SAVE_EVERY_REQUEST = False
 
 
 # Static files (CSS, JavaScript, Images)
@@ -250,7 +386,7 @@ SESSION_SAVE_EVERY_REQUEST = True
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
-# WhiteNoise configuration for static files
+# Served by WhiteNoise in front of Django, see weather_backend.static
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 # Default primary key field type
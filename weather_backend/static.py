@@ -0,0 +1,48 @@
+"""
+Static file serving for the ASGI and WSGI entry points.
+
+WhiteNoise's Django middleware is sync-only: under daphne, Django would adapt
+the whole middleware chain to sync and every request, including the async
+views, would hold a thread. Static files are served in front of Django instead.
+"""
+
+from asgiref.wsgi import WsgiToAsgi
+from django.conf import settings
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
+from whitenoise import WhiteNoise
+
+# Names written by the manifest storage, e.g. "app.3f2a9c1b7d4e.css", never change
+HASHED_FILE_PATTERN = r'\.[0-9a-f]{12}\.\w+$'
+
+def _not_found(environ, start_response):
+    start_response('404 Not Found', [('Content-Type', 'text/plain')])
+    return [b'Not Found']
+
+def get_whitenoise(application):
+    """Wrap a WSGI application to serve the collected files under STATIC_URL"""
+    return WhiteNoise(
+        application, root=settings.STATIC_ROOT, prefix=settings.STATIC_URL,
+        immutable_file_test=HASHED_FILE_PATTERN,
+    )
+
+class ASGIStaticFiles:
+    """Serve STATIC_URL with WhiteNoise in a worker thread and pass every other request on.
+
+    With DEBUG the files come from the app directories through Django's
+    staticfiles finders, as with runserver, so collectstatic is not needed.
+    """
+    def __init__(self, application):
+        self.application = application
+        self.prefix = settings.STATIC_URL
+        self.static_app = WsgiToAsgi(get_whitenoise(_not_found))
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['path'].startswith(self.prefix):
+            return await self.static_app(scope, receive, send)
+        return await self.application(scope, receive, send)
+
+def get_asgi_static_files(application):
+    """Wrap an ASGI application to serve static files without a sync middleware"""
+    if settings.DEBUG:
+        return ASGIStaticFilesHandler(application)
+    return ASGIStaticFiles(application)
@@ -18,6 +18,10 @@ from django.contrib import admin
 from django.urls import path, include
 from django.http import JsonResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from weather.services import WeatherCacheService
+from weather.providers import get_provider
+from weather.circuitbreaker import circuit_breaker, OPEN
+from weather.ratelimit import rate_limiter
 
 @csrf_exempt
 def root_view(request):
@@ -36,6 +40,17 @@ def health_check(request):
     """Simple health check endpoint"""
     return HttpResponse("OK", content_type="text/plain")
 
+def upstream_health(request):
+    """OpenWeatherMap circuit breaker, quota, connection pool and cache status"""
+    circuit = circuit_breaker.status()
+    return JsonResponse({
+        "status": "degraded" if circuit.get('state') == OPEN else "ok",
+        "circuit": circuit,
+        "quota": rate_limiter.status(),
+        "pool": get_provider().pool_stats(),
+        "cache": WeatherCacheService().cache_stats(),
+    })
+
 def test_view(request):
     """Very simple test view to debug 400 errors"""
     return HttpResponse("Test OK", content_type="text/plain")
@@ -43,6 +58,7 @@ def test_view(request):
 urlpatterns = [
     path('', root_view, name='root'),
     path('health/', health_check, name='health'),
+    path('health/upstream/', upstream_health, name='health-upstream'),
     path('test/', test_view, name='test'),
     path('admin/', admin.site.urls),
     path('api/', include('weather.urls')),
@@ -13,4 +13,8 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'weather_backend.settings')
 
-application = get_wsgi_application()
+django_wsgi_app = get_wsgi_application()
+
+from weather_backend.static import get_whitenoise  # noqa: E402
+
+application = get_whitenoise(django_wsgi_app)